@@ -0,0 +1,216 @@
+import argparse
+import asyncio
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable
+
+from sqlalchemy import select
+from starlette.concurrency import run_in_threadpool
+
+from . import models
+from .rate_limit import Limit
+
+# Origen de las claves de API: static (API_KEY_SECRET), file (API_KEYS_FILE) o db (tabla api_keys)
+API_KEY_STORE = os.getenv("API_KEY_STORE", "static")
+# En una aplicación real esta clave debe venir de un servicio de secretos
+API_KEY_SECRET = os.getenv("API_KEY_SECRET", "my-super-secret-key")
+# JSON con una lista de {"key_hash" (o "key"), "tenant", "tier"}
+API_KEYS_FILE = os.getenv("API_KEYS_FILE", "./api_keys.json")
+# Las claves se validan contra una copia en memoria que se recarga con esta frecuencia
+API_KEY_REFRESH_SECONDS = float(os.getenv("API_KEY_REFRESH_SECONDS", "30"))
+# Límite de tasa por nivel: "free=5/60,pro=120/60" (peticiones/segundos)
+API_KEY_TIERS = os.getenv("API_KEY_TIERS", "")
+
+# Caracteres del hash usados para localizar la clave; la comparación completa es en tiempo constante
+_LOOKUP_PREFIX = 8
+
+
+def hash_key(key: str) -> str:
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def parse_tiers(value: str) -> dict[str, Limit]:
+    """Convierte "nivel=veces/segundos,..." en un dict por nivel."""
+    tiers = {}
+    for rule in filter(None, (part.strip() for part in value.split(","))):
+        name, _, limit = rule.partition("=")
+        tiers[name.strip()] = Limit.parse(limit)
+    return tiers
+
+
+TIER_LIMITS = parse_tiers(API_KEY_TIERS)
+
+
+@dataclass(frozen=True)
+class ApiKeyInfo:
+    """Metadatos de una clave, disponibles en ``request.state.api_key``."""
+
+    key_hash: str
+    tenant: str
+    tier: str | None = None
+
+
+class StaticKeyStore:
+    """Una única clave, la de API_KEY_SECRET (comportamiento por defecto)."""
+
+    def __init__(self, secret: str = API_KEY_SECRET):
+        self.secret = secret
+
+    def load(self) -> list[ApiKeyInfo] | None:
+        return [ApiKeyInfo(hash_key(self.secret), tenant="default")]
+
+
+class FileKeyStore:
+    """Claves en un fichero JSON; solo se vuelve a leer si cambia su ``mtime``."""
+
+    def __init__(self, path: str = API_KEYS_FILE):
+        self.path = path
+        self._mtime: float | None = None
+
+    def load(self) -> list[ApiKeyInfo] | None:
+        mtime = os.stat(self.path).st_mtime
+        if mtime == self._mtime:
+            return None
+        with open(self.path, encoding="utf-8") as fh:
+            entries = json.load(fh)
+        keys = [
+            ApiKeyInfo(entry.get("key_hash") or hash_key(entry["key"]), entry["tenant"], entry.get("tier"))
+            for entry in entries
+        ]
+        self._mtime = mtime
+        return keys
+
+
+class DatabaseKeyStore:
+    """Claves activas de la tabla ``api_keys``."""
+
+    def __init__(self, session_factory):
+        self.session_factory = session_factory
+
+    def load(self) -> list[ApiKeyInfo] | None:
+        table = models.ApiKey.__table__
+        with self.session_factory() as db:
+            rows = db.execute(select(table.c.key_hash, table.c.tenant, table.c.tier).where(table.c.active)).all()
+        return [ApiKeyInfo(*row) for row in rows]
+
+
+class ApiKeyCache:
+    """Copia en memoria de las claves de un almacén, indexada por su hash.
+
+    Validar una clave no consulta el almacén: se calcula su SHA-256, se
+    localiza por los primeros caracteres del hash y se compara el hash
+    completo con ``hmac.compare_digest``. Una tarea en segundo plano recarga
+    las claves cada ``refresh_interval`` segundos, así que una rotación se
+    aplica en ese plazo; si la recarga falla se mantienen las anteriores.
+    """
+
+    def __init__(self, store, refresh_interval: float = API_KEY_REFRESH_SECONDS,
+                 clock: Callable[[], float] = time.monotonic):
+        self.store = store
+        self.refresh_interval = refresh_interval
+        self.clock = clock
+        self._index: dict[str, list[ApiKeyInfo]] | None = None
+        self._refresh_task: asyncio.Task | None = None
+        self.keys = 0
+        self.loaded_at: float | None = None
+        self.refresh_errors = 0
+        self.rejected = 0
+
+    def authenticate(self, key: str) -> ApiKeyInfo | None:
+        if self._index is None:
+            # Primera petición sin arranque previo (p. ej. en pruebas): carga síncrona
+            self.refresh_sync()
+        digest = hash_key(key)
+        for candidate in (self._index or {}).get(digest[:_LOOKUP_PREFIX], ()):
+            if hmac.compare_digest(candidate.key_hash, digest):
+                return candidate
+        self.rejected += 1
+        return None
+
+    def refresh_sync(self) -> bool:
+        """Recarga las claves del almacén. Devuelve si cambiaron."""
+        try:
+            keys = self.store.load()
+        except Exception:
+            self.refresh_errors += 1
+            if self._index is None:
+                self._index = {}
+            return False
+        self.loaded_at = self.clock()
+        if keys is None:
+            return False
+        index: dict[str, list[ApiKeyInfo]] = {}
+        for info in keys:
+            index.setdefault(info.key_hash[:_LOOKUP_PREFIX], []).append(info)
+        # Sustitución atómica: las peticiones en curso ven la copia anterior o la nueva
+        self._index = index
+        self.keys = len(keys)
+        return True
+
+    async def refresh(self) -> bool:
+        return await run_in_threadpool(self.refresh_sync)
+
+    async def start(self):
+        if self._refresh_task is None:
+            await self.refresh()
+            self._refresh_task = asyncio.create_task(self._run_refresh())
+
+    async def stop(self):
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+            try:
+                await self._refresh_task
+            except asyncio.CancelledError:
+                pass
+            self._refresh_task = None
+
+    async def _run_refresh(self):
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            await self.refresh()
+
+    def stats(self) -> dict:
+        return {
+            "store": type(self.store).__name__,
+            "keys": self.keys,
+            "seconds_since_refresh": None if self.loaded_at is None else round(self.clock() - self.loaded_at, 1),
+            "refresh_errors": self.refresh_errors,
+            "rejected": self.rejected,
+        }
+
+
+def build_store(kind: str = API_KEY_STORE):
+    if kind == "file":
+        return FileKeyStore()
+    if kind == "db":
+        from .database import SessionLocal
+
+        return DatabaseKeyStore(SessionLocal)
+    return StaticKeyStore()
+
+
+key_cache = ApiKeyCache(build_store())
+
+
+if __name__ == "__main__":
+    # Genera una clave nueva: se muestra una sola vez; solo se guarda su hash
+    parser = argparse.ArgumentParser(description="Genera una clave de API para un tenant")
+    parser.add_argument("tenant")
+    parser.add_argument("--tier", help="Nivel de limitación de tasa (API_KEY_TIERS)")
+    parser.add_argument("--db", action="store_true", help="Guardarla en la tabla api_keys")
+    args = parser.parse_args()
+    key = secrets.token_urlsafe(32)
+    entry = {"key_hash": hash_key(key), "tenant": args.tenant, "tier": args.tier}
+    if args.db:
+        from .database import SessionLocal
+
+        with SessionLocal() as db:
+            db.add(models.ApiKey(**entry, active=True, created_at=datetime.utcnow()))
+            db.commit()
+    print(json.dumps({"key": key, "entry": entry}, indent=2))
@@ -0,0 +1,187 @@
+import asyncio
+import os
+from typing import Awaitable, Callable
+
+from redis.exceptions import RedisError
+
+from .routers.websocket import manager
+
+# memory: difusión solo dentro del proceso; redis: pub/sub compartido por todas las réplicas
+BROADCAST_BACKEND = os.getenv("BROADCAST_BACKEND", "memory")
+BROADCAST_CHANNEL = os.getenv("BROADCAST_CHANNEL", "chat:messages")
+BROADCAST_BATCH_WINDOW_MS = float(os.getenv("BROADCAST_BATCH_WINDOW_MS", "5"))
+BROADCAST_BATCH_MAX_SIZE = int(os.getenv("BROADCAST_BATCH_MAX_SIZE", "100"))
+# Espera antes de volver a suscribirse si se pierde la conexión con Redis
+BROADCAST_RECONNECT_SECONDS = float(os.getenv("BROADCAST_RECONNECT_SECONDS", "1"))
+
+# Separador de mensajes dentro de un lote: el JSON compacto nunca contiene saltos de línea literales
+BATCH_SEPARATOR = "\n"
+
+Deliver = Callable[[str], Awaitable[None]]
+
+
+class BroadcastBackend:
+    """Interfaz común: ``publish`` se llama una vez por mensaje y ``deliver``
+    reparte el mensaje entre los clientes WebSocket de este proceso."""
+
+    def __init__(self, deliver: Deliver):
+        self.deliver = deliver
+        self.published = 0
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    async def publish(self, message: str):
+        raise NotImplementedError
+
+    def stats(self) -> dict:
+        return {"backend": self.name, "published": self.published}
+
+
+class InMemoryBroadcast(BroadcastBackend):
+    """Entrega directa a las conexiones locales (un solo proceso)."""
+
+    name = "memory"
+
+    async def publish(self, message: str):
+        self.published += 1
+        await self.deliver(message)
+
+
+class RedisBroadcast(BroadcastBackend):
+    """Difusión entre réplicas mediante un canal pub/sub de Redis.
+
+    Los mensajes publicados dentro de una ventana corta se agrupan en un único
+    PUBLISH. Cada proceso está suscrito al canal y reparte localmente lo que
+    recibe, incluidos sus propios mensajes, de modo que ningún cliente recibe
+    un mensaje dos veces. Si Redis no está disponible el mensaje se entrega al
+    menos a los clientes del propio proceso.
+    """
+
+    name = "redis"
+
+    def __init__(
+        self,
+        redis,
+        deliver: Deliver,
+        channel: str = BROADCAST_CHANNEL,
+        window_ms: float = BROADCAST_BATCH_WINDOW_MS,
+        max_batch_size: int = BROADCAST_BATCH_MAX_SIZE,
+        reconnect_seconds: float = BROADCAST_RECONNECT_SECONDS,
+    ):
+        super().__init__(deliver)
+        self.redis = redis
+        self.channel = channel
+        self.window = window_ms / 1000
+        self.max_batch_size = max_batch_size
+        self.reconnect_seconds = reconnect_seconds
+        self._queue: asyncio.Queue[str] = asyncio.Queue()
+        self._publisher: asyncio.Task | None = None
+        self._subscriber: asyncio.Task | None = None
+        self._subscribed = asyncio.Event()
+        self.batches_published = 0
+        self.received = 0
+        self.errors = 0
+
+    async def start(self):
+        """Se suscribe al canal y arranca las tareas de publicación y recepción."""
+        if self._publisher is not None:
+            return
+        self._subscriber = asyncio.create_task(self._listen())
+        self._publisher = asyncio.create_task(self._run())
+        await self._subscribed.wait()
+
+    async def stop(self):
+        """Publica los mensajes pendientes y detiene las tareas."""
+        if self._publisher is None:
+            return
+        await self._queue.join()
+        for task in (self._publisher, self._subscriber):
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._publisher = self._subscriber = None
+        self._subscribed.clear()
+
+    async def publish(self, message: str):
+        self.published += 1
+        self._queue.put_nowait(message)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.window
+            while len(batch) < self.max_batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                    continue
+                except asyncio.QueueEmpty:
+                    pass
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                await self._flush(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _flush(self, batch: list[str]):
+        try:
+            await self.redis.publish(self.channel, BATCH_SEPARATOR.join(batch))
+            self.batches_published += 1
+        except RedisError:
+            # Modo degradado: al menos los clientes de esta réplica reciben el mensaje
+            self.errors += 1
+            for message in batch:
+                await self.deliver(message)
+
+    async def _listen(self):
+        while True:
+            pubsub = self.redis.pubsub()
+            try:
+                await pubsub.subscribe(self.channel)
+                self._subscribed.set()
+                while True:
+                    event = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                    if event is None or event["type"] != "message":
+                        continue
+                    data = event["data"]
+                    if isinstance(data, bytes):
+                        data = data.decode()
+                    for message in data.split(BATCH_SEPARATOR):
+                        self.received += 1
+                        await self.deliver(message)
+            except RedisError:
+                self.errors += 1
+                # No bloquea el arranque aunque Redis no responda
+                self._subscribed.set()
+                await asyncio.sleep(self.reconnect_seconds)
+            finally:
+                try:
+                    await pubsub.close()
+                except RedisError:
+                    pass
+
+    def stats(self) -> dict:
+        return {
+            **super().stats(),
+            "batches_published": self.batches_published,
+            "received": self.received,
+            "errors": self.errors,
+        }
+
+
+# Instancia activa: en memoria por defecto; el arranque la sustituye por RedisBroadcast
+# si BROADCAST_BACKEND=redis
+broadcaster: BroadcastBackend = InMemoryBroadcast(manager.broadcast)
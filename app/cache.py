@@ -0,0 +1,255 @@
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Callable
+
+from redis.exceptions import RedisError
+
+# Configuración de la caché del historial de sesiones
+# Con Redis la invalidación se comparte entre réplicas; sin él solo vale en el proceso que escribe,
+# así que la caché está desactivada por defecto salvo que se active Redis (o CACHE_ENABLED=true
+# en un despliegue de un único proceso)
+CACHE_REDIS_ENABLED = os.getenv("CACHE_REDIS_ENABLED", "false").lower() in ("1", "true", "yes")
+CACHE_ENABLED = os.getenv("CACHE_ENABLED", str(CACHE_REDIS_ENABLED)).lower() in ("1", "true", "yes")
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "1024"))
+CACHE_LOCAL_TTL_SECONDS = float(os.getenv("CACHE_LOCAL_TTL_SECONDS", "5"))
+CACHE_REDIS_TTL_SECONDS = int(os.getenv("CACHE_REDIS_TTL_SECONDS", "60"))
+
+
+class LRUTTLCache:
+    """Caché en memoria con expulsión LRU y caducidad por TTL.
+
+    Con ``max_bytes`` también se expulsan entradas mientras la suma de
+    ``sizeof(valor)`` supere ese tamaño.
+    """
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES, ttl: float = CACHE_LOCAL_TTL_SECONDS,
+                 clock: Callable[[], float] = time.monotonic,
+                 on_remove: Callable[[Any], None] | None = None,
+                 max_bytes: int | None = None, sizeof: Callable[[Any], int] = len):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.bytes = 0
+        # Se llama con la clave cuando una entrada caduca o se expulsa
+        self.on_remove = on_remove
+        self._entries: OrderedDict[Any, tuple[float, Any]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, value = entry
+        if expires_at <= self.clock():
+            self._pop(key)
+            self.expirations += 1
+            self.misses += 1
+            if self.on_remove is not None:
+                self.on_remove(key)
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key, value):
+        self._pop(key)
+        self._entries[key] = (self.clock() + self.ttl, value)
+        if self.max_bytes is not None:
+            self.bytes += self.sizeof(value)
+        while len(self._entries) > self.max_entries or (
+            self.max_bytes is not None and self.bytes > self.max_bytes and len(self._entries) > 1
+        ):
+            evicted = next(iter(self._entries))
+            self._pop(evicted)
+            self.evictions += 1
+            if self.on_remove is not None:
+                self.on_remove(evicted)
+
+    def delete(self, key):
+        self._pop(key)
+
+    def clear(self):
+        self._entries.clear()
+        self.bytes = 0
+
+    def _pop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None and self.max_bytes is not None:
+            self.bytes -= self.sizeof(entry[1])
+
+
+class SessionHistoryCache:
+    """Caché de lectura del historial por (session_id, sender, página).
+
+    Primero se consulta el nivel en memoria y después, si está configurado,
+    Redis. Cada página se guarda bajo la generación de su sesión, que se
+    incrementa con cada escritura: una página leída antes de una escritura
+    concurrente queda bajo una generación antigua y ya no se sirve.
+
+    Con Redis la generación vive en Redis (``INCR``), así que una escritura en
+    cualquier réplica invalida las páginas de todas, también las del nivel en
+    memoria. Sin Redis la generación es local al proceso; el contador de cada
+    sesión se poda junto con las entradas (como mucho ``2 * max_entries``
+    sesiones) y las sesiones podadas heredan un mínimo que solo crece, de modo
+    que ninguna generación vuelve a un valor ya usado.
+    """
+
+    def __init__(self, local: LRUTTLCache | None = None, redis=None,
+                 redis_ttl: int = CACHE_REDIS_TTL_SECONDS, prefix: str = "chat:history",
+                 dumps: Callable[[Any], str] = str, loads: Callable[[str], Any] = str):
+        self.local = local if local is not None else LRUTTLCache()
+        self.local.on_remove = self._forget_key
+        self.redis = redis
+        self.redis_ttl = redis_ttl
+        self.prefix = prefix
+        self.dumps = dumps
+        self.loads = loads
+        self._session_keys: dict[str, set] = {}
+        # session_id -> generación, en orden de uso; _generation_floor es la de las sesiones podadas
+        self._generations: OrderedDict[str, int] = OrderedDict()
+        self._generation_floor = 0
+        self._counter = 0
+        self.max_generations = 2 * self.local.max_entries
+        self.redis_hits = 0
+        self.redis_misses = 0
+        self.redis_errors = 0
+        self.invalidations = 0
+
+    def _redis_key(self, key) -> str:
+        return f"{self.prefix}:" + ":".join("" if part is None else str(part) for part in key)
+
+    async def generation(self, session_id: str) -> int | None:
+        """Generación actual de la sesión; None si no se puede saber (Redis no responde)."""
+        if self.redis is None:
+            return self._local_generation(session_id)
+        try:
+            value = await self.redis.get(self._redis_key((session_id, "generation")))
+        except RedisError:
+            self.redis_errors += 1
+            return None
+        return int(value or 0)
+
+    async def get(self, session_id: str, sender: str | None, page: tuple, generation: int | None = None):
+        """Página cacheada de la generación indicada (por defecto, la actual) o None."""
+        if generation is None:
+            generation = await self.generation(session_id)
+            if generation is None:
+                return None
+        key = (session_id, generation, sender, *page)
+        value = self.local.get(key)
+        if value is not None or self.redis is None:
+            return value
+        try:
+            raw = await self.redis.get(self._redis_key(key))
+        except RedisError:
+            self.redis_errors += 1
+            return None
+        if raw is None:
+            self.redis_misses += 1
+            return None
+        self.redis_hits += 1
+        value = self.loads(raw)
+        self._store_local(key, value)
+        return value
+
+    async def set(self, session_id: str, sender: str | None, page: tuple, value, generation: int | None):
+        """Guarda la página bajo ``generation``, la leída antes de consultar la BD."""
+        if generation is None:
+            return
+        if self.redis is None and generation != self._local_generation(session_id):
+            # Hubo una escritura en la sesión mientras se leía: la página puede estar obsoleta
+            return
+        key = (session_id, generation, sender, *page)
+        self._store_local(key, value)
+        if self.redis is None:
+            self._touch_generation(session_id, generation)
+            return
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.set(self._redis_key(key), self.dumps(value), ex=self.redis_ttl)
+                # La generación sobrevive a todas sus páginas: si caduca, la sesión no tiene ninguna
+                pipe.expire(self._redis_key((session_id, "generation")), 2 * self.redis_ttl)
+                await pipe.execute()
+        except RedisError:
+            self.redis_errors += 1
+
+    async def invalidate(self, session_id: str):
+        self.invalidations += 1
+        for key in self._session_keys.pop(session_id, ()):
+            self.local.delete(key)
+        if self.redis is None:
+            self._counter = max(self._counter, self._generation_floor) + 1
+            self._touch_generation(session_id, self._counter)
+            return
+        generation_key = self._redis_key((session_id, "generation"))
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.incr(generation_key)
+                pipe.expire(generation_key, 2 * self.redis_ttl)
+                await pipe.execute()
+        except RedisError:
+            self.redis_errors += 1
+
+    def _local_generation(self, session_id: str) -> int:
+        return self._generations.get(session_id, self._generation_floor)
+
+    def _touch_generation(self, session_id: str, generation: int):
+        self._generations[session_id] = generation
+        self._generations.move_to_end(session_id)
+        while len(self._generations) > self.max_generations:
+            pruned, value = self._generations.popitem(last=False)
+            # Las sesiones podadas ven al menos esta generación: sus páginas antiguas dejan de servirse
+            self._generation_floor = max(self._generation_floor, value)
+            for key in self._session_keys.pop(pruned, ()):
+                self.local.delete(key)
+
+    def _store_local(self, key, value):
+        self.local.set(key, value)
+        self._session_keys.setdefault(key[0], set()).add(key)
+
+    def _forget_key(self, key):
+        keys = self._session_keys.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._session_keys[key[0]]
+
+    def clear(self):
+        self.local.clear()
+        self._session_keys.clear()
+        self._generations.clear()
+        self._generation_floor = 0
+        self._counter = 0
+
+    def stats(self) -> dict:
+        return {
+            "enabled": CACHE_ENABLED,
+            "entries": len(self.local),
+            "tracked_sessions": len(self._generations),
+            "hits": self.local.hits,
+            "misses": self.local.misses,
+            "evictions": self.local.evictions,
+            "expirations": self.local.expirations,
+            "invalidations": self.invalidations,
+            "redis_enabled": self.redis is not None,
+            "redis_hits": self.redis_hits,
+            "redis_misses": self.redis_misses,
+            "redis_errors": self.redis_errors,
+        }
+
+
+# Caché del historial de sesiones compartida por la aplicación: guarda el JSON ya serializado
+history_cache = SessionHistoryCache(
+    dumps=lambda value: value,
+    loads=lambda raw: raw.encode() if isinstance(raw, str) else raw,
+)
@@ -1,7 +1,76 @@
+import heapq
+from collections.abc import Iterable
+from datetime import datetime
+from itertools import chain, islice
+from sqlalchemy import Table, case, select, tuple_
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.orm import Session
-from . import models, schemas
+from sqlalchemy.orm.attributes import set_committed_value
+from . import models, partitioning, schemas, search
+
+# Constructores de INSERT con soporte de ON CONFLICT según el dialecto
+_UPSERT_INSERTS = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}
+
+def _update_session_stats(db: Session, rows: Iterable):
+    """Suma los mensajes a session_stats con un único upsert (sin commit: va en la transacción del INSERT).
+
+    ``rows`` son objetos o dicts con session_id, sender, word_count,
+    character_count y timestamp.
+    """
+    totals: dict[tuple[str, str], dict] = {}
+    for row in rows:
+        if isinstance(row, dict):
+            session_id, sender, words, characters, timestamp = (
+                row["session_id"], row["sender"], row["word_count"], row["character_count"], row["timestamp"]
+            )
+        else:
+            session_id, sender, words, characters, timestamp = (
+                row.session_id, row.sender, row.word_count, row.character_count, row.timestamp
+            )
+        # Como en la columna DateTime, se compara la hora sin zona horaria
+        timestamp = timestamp.replace(tzinfo=None)
+        total = totals.get((session_id, sender))
+        if total is None:
+            totals[(session_id, sender)] = {
+                "session_id": session_id, "sender": sender, "message_count": 1,
+                "word_count": words, "character_count": characters,
+                "first_timestamp": timestamp, "last_timestamp": timestamp,
+            }
+        else:
+            total["message_count"] += 1
+            total["word_count"] += words
+            total["character_count"] += characters
+            total["first_timestamp"] = min(total["first_timestamp"], timestamp)
+            total["last_timestamp"] = max(total["last_timestamp"], timestamp)
+    if not totals:
+        return
+    stats = models.SessionStats.__table__
+    stmt = _UPSERT_INSERTS[db.get_bind().dialect.name](stats).values(list(totals.values()))
+    new = stmt.excluded
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=[stats.c.session_id, stats.c.sender],
+        set_={
+            "message_count": stats.c.message_count + new.message_count,
+            "word_count": stats.c.word_count + new.word_count,
+            "character_count": stats.c.character_count + new.character_count,
+            "first_timestamp": case(
+                (new.first_timestamp < stats.c.first_timestamp, new.first_timestamp),
+                else_=stats.c.first_timestamp,
+            ),
+            "last_timestamp": case(
+                (new.last_timestamp > stats.c.last_timestamp, new.last_timestamp),
+                else_=stats.c.last_timestamp,
+            ),
+        },
+    ))
+
+def _register_message_ids(db: Session, message_ids: list[str]):
+    """Registra los message_id con el particionado activo; un duplicado lanza IntegrityError."""
+    if partitioning.PARTITIONING_ENABLED and message_ids:
+        db.execute(models.MessageIdRegistry.__table__.insert(), [{"message_id": id_} for id_ in message_ids])
 
 def create_message(db: Session, message: schemas.MessageCreate, metadata: schemas.MessageMetadata):
+    _register_message_ids(db, [message.message_id])
     db_message = models.Message(
         message_id=message.message_id,
         session_id=message.session_id,
@@ -13,19 +82,168 @@ def create_message(db: Session, message: schemas.MessageCreate, metadata: schema
         processed_at=metadata.processed_at
     )
     db.add(db_message)
+    _update_session_stats(db, [db_message])
     db.commit()
     db.refresh(db_message)
     return db_message
 
-def get_messages_by_session(db: Session, session_id: str, sender: str | None, skip: int = 0, limit: int = 100):
-    query = db.query(models.Message).filter(models.Message.session_id == session_id)
-    
+def _history_key(row):
+    return row.timestamp, row.id
+
+def _partitions(db: Session, after: tuple[datetime, int] | None = None) -> list[partitioning.Partition]:
+    """Particiones en línea que pueden contener filas posteriores a ``after``, en orden cronológico."""
+    if not partitioning.PARTITIONING_ENABLED:
+        return []
+    partitions = partitioning.catalog.online(db)
+    if after:
+        # Poda por rango: las particiones que terminan antes del cursor no se consultan
+        partitions = [partition for partition in partitions if partition.range_end > after[0]]
+    return partitions
+
+def _message_columns(table: Table):
+    return [table.c[column.key] for column in models.MESSAGE_COLUMNS]
+
+def session_history_query(session_id: str, sender: str | None, table: Table = models.Message.__table__):
+    """SELECT del historial de una sesión en orden (timestamp, id), servido por los índices compuestos.
+
+    ``table`` es la tabla activa o una partición mensual con la misma estructura.
+    """
+    query = select(*_message_columns(table)).where(table.c.session_id == session_id)
     if sender:
-        query = query.filter(models.Message.sender == sender)
-        
-    return query.offset(skip).limit(limit).all()
-
-def search_messages_by_content(db: Session, query_text: str, skip: int = 0, limit: int = 100):
-    return db.query(models.Message).filter(
-        models.Message.content.ilike(f"%{query_text}%")
-    ).offset(skip).limit(limit).all()
+        query = query.where(table.c.sender == sender)
+    return query.order_by(table.c.timestamp, table.c.id)
+
+def iter_messages_by_session(db: Session, session_id: str, sender: str | None, batch_size: int = 1000):
+    """Recorre toda la sesión con un cursor del servidor, en bloques de ``batch_size`` filas."""
+    result = db.execute(session_history_query(session_id, sender).execution_options(yield_per=batch_size))
+    partitions = _partitions(db)
+    if not partitions:
+        yield from result.partitions()
+        return
+    # Las particiones no se solapan entre sí, pero la tabla activa puede tener mensajes
+    # de meses ya sellados que llegaron tarde: se mezclan por (timestamp, id)
+    archived = chain.from_iterable(
+        db.execute(session_history_query(session_id, sender, partition.table).execution_options(yield_per=batch_size))
+        for partition in partitions
+    )
+    rows = heapq.merge(archived, result, key=_history_key)
+    while batch := list(islice(rows, batch_size)):
+        yield batch
+
+def get_messages_by_session(
+    db: Session, session_id: str, sender: str | None, skip: int = 0, limit: int = 100,
+    after: tuple[datetime, int] | None = None,
+):
+    """Filas de una sesión en orden (timestamp, id); ``after`` es la clave de la última fila vista."""
+    def page(table: Table, offset: int, count: int):
+        query = session_history_query(session_id, sender, table)
+        if after:
+            query = query.where(tuple_(table.c.timestamp, table.c.id) > tuple_(*after))
+        return db.execute(query.offset(offset).limit(count)).all()
+
+    partitions = _partitions(db, after)
+    if not partitions:
+        return page(models.Message.__table__, skip, limit)
+    wanted = skip + limit
+    archived = []
+    for partition in partitions:
+        # Las particiones siguientes solo tienen mensajes posteriores: la página ya está completa
+        if len(archived) >= wanted:
+            break
+        archived.extend(page(partition.table, 0, wanted - len(archived)))
+    rows = heapq.merge(archived, page(models.Message.__table__, 0, wanted), key=_history_key)
+    return list(islice(rows, skip, wanted))
+
+def get_message_by_message_id(db: Session, message_id: str):
+    """Fila del mensaje con ese message_id (en la tabla activa o en una partición), o None."""
+    tables = chain([models.Message.__table__], (partition.table for partition in reversed(_partitions(db))))
+    for table in tables:
+        row = db.execute(select(*_message_columns(table)).where(table.c.message_id == message_id)).first()
+        if row is not None:
+            return row
+    return None
+
+def search_messages_by_content(
+    db: Session, query_text: str, session_id: str | None = None, skip: int = 0, limit: int = 100,
+    after: list | None = None,
+):
+    """Devuelve pares (fila, clave de ordenación) ordenados por relevancia.
+
+    Con particiones se busca en cada una (con su propio índice) y en la tabla
+    activa, y se mezclan los resultados por la clave de ordenación.
+    """
+    backend = search.get_backend(db.get_bind().dialect.name)
+    partitions = _partitions(db)
+    if not partitions:
+        return backend.search(db, query_text, session_id=session_id, skip=skip, limit=limit, after=after)
+    wanted = skip + limit
+    results = [
+        backend.search(db, query_text, session_id=session_id, skip=0, limit=wanted, after=after, source=table)
+        for table in chain([models.Message.__table__], (partition.table for partition in partitions))
+    ]
+    return list(islice(heapq.merge(*results, key=lambda result: result[1]), skip, wanted))
+
+def create_messages(db: Session, items: list[tuple[schemas.MessageCreate, schemas.MessageMetadata]]):
+    """Inserta varios mensajes en una única transacción (INSERT multi-fila)."""
+    _register_message_ids(db, [message.message_id for message, _ in items])
+    db_messages = [
+        models.Message(
+            message_id=message.message_id,
+            session_id=message.session_id,
+            content=message.content,
+            timestamp=message.timestamp,
+            sender=message.sender,
+            word_count=metadata.word_count,
+            character_count=metadata.character_count,
+            processed_at=metadata.processed_at
+        )
+        for message, metadata in items
+    ]
+    db.add_all(db_messages)
+    db.flush()
+    _update_session_stats(db, db_messages)
+    # Se desvinculan antes del commit para no recargar cada fila con un SELECT adicional
+    for db_message in db_messages:
+        db.expunge(db_message)
+    db.commit()
+    # El timestamp es lo único que la BD guarda distinto de como llega (sin zona horaria):
+    # se relee de todo el lote en una consulta para devolverlo como lo haría db.refresh()
+    by_id = {db_message.id: db_message for db_message in db_messages}
+    stored = db.execute(
+        select(models.Message.id, models.Message.timestamp).where(models.Message.id.in_(list(by_id)))
+    )
+    for id_, timestamp in stored:
+        set_committed_value(by_id[id_], "timestamp", timestamp)
+    return db_messages
+
+def bulk_insert_messages(db: Session, rows: list[dict]) -> set[str]:
+    """Inserta un bloque de mensajes ignorando los message_id ya existentes.
+
+    Devuelve el conjunto de message_id que se han insertado realmente.
+    """
+    insert = _UPSERT_INSERTS[db.get_bind().dialect.name]
+    if partitioning.PARTITIONING_ENABLED and rows:
+        # Los message_id ya movidos a una partición no están en el índice único de messages
+        registry = models.MessageIdRegistry.__table__
+        registered = set(db.scalars(
+            insert(registry).on_conflict_do_nothing().returning(registry.c.message_id),
+            [{"message_id": row["message_id"]} for row in rows],
+        ))
+        rows = [row for row in rows if row["message_id"] in registered]
+        if not rows:
+            db.commit()
+            return set()
+    stmt = (
+        insert(models.Message)
+        .on_conflict_do_nothing(index_elements=[models.Message.message_id])
+        .returning(models.Message.message_id)
+    )
+    inserted = set(db.scalars(stmt, rows))
+    _update_session_stats(db, (row for row in rows if row["message_id"] in inserted))
+    db.commit()
+    return inserted
+
+def get_session_stats(db: Session, session_id: str):
+    """Filas de session_stats de la sesión (una por remitente)."""
+    stats = models.SessionStats.__table__
+    return db.execute(select(stats).where(stats.c.session_id == session_id)).all()
@@ -1,14 +1,241 @@
-from sqlalchemy import create_engine
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Callable
+from sqlalchemy import create_engine, event, exc, func, insert, inspect, select, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
-from .models import Base
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from starlette.concurrency import run_in_threadpool
+from . import metrics
+from .models import Base, Message, MessageIdRegistry, MessagePartition, SessionStats
+from .partitioning import partition_table
+from .search import ensure_search_index
 
-DATABASE_URL = "sqlite:///./chat.db"
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./chat.db")
 
-engine = create_engine(
-    DATABASE_URL, connect_args={"check_same_thread": False}
-)
+# Crear tablas e índices al arrancar; con muchas réplicas conviene hacerlo una vez (python -m app.database)
+DB_CREATE_SCHEMA = os.getenv("DB_CREATE_SCHEMA", "true").lower() in ("1", "true", "yes")
+DB_HEALTH_TIMEOUT_SECONDS = float(os.getenv("DB_HEALTH_TIMEOUT_SECONDS", "2"))
+
+# Drivers asíncronos equivalentes a cada driver síncrono
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+}
+
+# Por defecto los endpoints usan la sesión asíncrona; DB_ASYNC=false vuelve a la sesión síncrona
+DB_ASYNC = os.getenv("DB_ASYNC", "true").lower() in ("1", "true", "yes")
+
+def to_async_url(url: str) -> str:
+    """Convierte una URL de SQLAlchemy síncrona en su equivalente asíncrona."""
+    scheme, sep, rest = url.partition("://")
+    backend = scheme.split("+", 1)[0]
+    return f"{ASYNC_DRIVERS.get(backend, scheme)}{sep}{rest}"
+
+# PRAGMAs aplicados a cada conexión SQLite nueva (configurables por entorno)
+SQLITE_PRAGMAS = {
+    # WAL permite lecturas concurrentes con una escritura; NORMAL evita un fsync por commit
+    "journal_mode": os.getenv("SQLITE_JOURNAL_MODE", "WAL"),
+    "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "mmap_size": os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)),
+    # Valor negativo = KiB: 64 MiB de caché de páginas por conexión
+    "cache_size": os.getenv("SQLITE_CACHE_SIZE", "-65536"),
+    "temp_store": "MEMORY",
+    "busy_timeout": os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"),
+}
+
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for name, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
+
+def register_sqlite_pragmas(target_engine):
+    """Aplica SQLITE_PRAGMAS a cada conexión del engine (síncrono o asíncrono)."""
+    sync_engine = getattr(target_engine, "sync_engine", target_engine)
+    if sync_engine.dialect.name == "sqlite":
+        event.listen(sync_engine, "connect", _apply_sqlite_pragmas)
+
+# Valores por defecto del pool según el backend; las variables DB_* los sustituyen
+POOL_DEFAULTS = {
+    # SQLite solo admite un escritor: un pool pequeño evita colas de "database is locked"
+    "sqlite": {"pool_size": 5, "max_overflow": 10, "pool_timeout": 30, "pool_recycle": -1, "pool_pre_ping": False},
+    # En un servidor las conexiones pueden cortarse por inactividad: se comprueban y se reciclan
+    "postgresql": {"pool_size": 10, "max_overflow": 20, "pool_timeout": 30, "pool_recycle": 1800, "pool_pre_ping": True},
+}
+POOL_ENV = {
+    "pool_size": ("DB_POOL_SIZE", int),
+    "max_overflow": ("DB_MAX_OVERFLOW", int),
+    "pool_timeout": ("DB_POOL_TIMEOUT", float),
+    "pool_recycle": ("DB_POOL_RECYCLE", int),
+    "pool_pre_ping": ("DB_POOL_PRE_PING", lambda value: value.lower() in ("1", "true", "yes")),
+}
+# Sentencias compiladas (SQLAlchemy) y preparadas (driver) que se guardan en caché por engine/conexión
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "500"))
+
+class PoolMetrics:
+    """Contadores de checkout del pool: cuántos, cuánto se esperó y cuántos agotaron el tiempo."""
+
+    def __init__(self, clock: Callable[[], float] = time.perf_counter):
+        self.clock = clock
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.pool = None
+
+    def record(self, seconds: float):
+        self.checkouts += 1
+        self.wait_seconds_total += seconds
+        self.wait_seconds_max = max(self.wait_seconds_max, seconds)
+
+    def stats(self) -> dict:
+        data = {
+            "checkouts": self.checkouts,
+            "timeouts": self.timeouts,
+            "wait_seconds_total": round(self.wait_seconds_total, 6),
+            "wait_seconds_max": round(self.wait_seconds_max, 6),
+        }
+        if isinstance(self.pool, QueuePool):
+            data.update(size=self.pool.size(), checked_out=self.pool.checkedout(), overflow=self.pool.overflow())
+        return data
+
+class _InstrumentedPool:
+    """Mide el tiempo que tarda cada checkout (incluida la espera por una conexión libre)."""
+
+    metrics: PoolMetrics
+
+    def _do_get(self):
+        self.metrics.pool = self
+        start = self.metrics.clock()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            self.metrics.timeouts += 1
+            raise
+        self.metrics.record(self.metrics.clock() - start)
+        return connection
+
+def instrumented_pool_class(base: type, metrics: PoolMetrics) -> type:
+    # recreate() instancia self.__class__, así que las métricas viajan con la clase
+    return type(f"Instrumented{base.__name__}", (_InstrumentedPool, base), {"metrics": metrics})
+
+def engine_options(url: str, metrics: PoolMetrics | None = None, is_async: bool = False) -> dict:
+    """Argumentos de create_engine para la URL: pool según backend y variables DB_*."""
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    options: dict = {"query_cache_size": DB_STATEMENT_CACHE_SIZE}
+    if backend == "sqlite":
+        options["connect_args"] = {"check_same_thread": False, "cached_statements": DB_STATEMENT_CACHE_SIZE}
+        if parsed.database in (None, "", ":memory:"):
+            # Una BD en memoria vive en una sola conexión: SQLAlchemy elige su propio pool
+            return options
+    if backend == "postgresql" and is_async:
+        options["connect_args"] = {"prepared_statement_cache_size": DB_STATEMENT_CACHE_SIZE}
+    for name, value in POOL_DEFAULTS.get(backend, POOL_DEFAULTS["postgresql"]).items():
+        env_name, convert = POOL_ENV[name]
+        options[name] = convert(os.environ[env_name]) if os.getenv(env_name) else value
+    if metrics is not None:
+        options["poolclass"] = instrumented_pool_class(AsyncAdaptedQueuePool if is_async else QueuePool, metrics)
+    return options
+
+pool_metrics = {"sync": PoolMetrics(), "async": PoolMetrics()}
+
+engine = create_engine(DATABASE_URL, **engine_options(DATABASE_URL, pool_metrics["sync"]))
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+async_engine = create_async_engine(
+    to_async_url(DATABASE_URL), **engine_options(DATABASE_URL, pool_metrics["async"], is_async=True)
+)
+
+register_sqlite_pragmas(engine)
+register_sqlite_pragmas(async_engine)
+
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine, autoflush=False, expire_on_commit=False
+)
+
+def backfill_session_stats(connection):
+    """Calcula session_stats a partir de los mensajes ya guardados (tabla recién creada)."""
+    stats = SessionStats.__table__
+    connection.execute(insert(stats).from_select(
+        [stats.c.session_id, stats.c.sender, stats.c.message_count, stats.c.word_count,
+         stats.c.character_count, stats.c.first_timestamp, stats.c.last_timestamp],
+        select(
+            Message.session_id, Message.sender, func.count(), func.sum(Message.word_count),
+            func.sum(Message.character_count), func.min(Message.timestamp), func.max(Message.timestamp),
+        ).group_by(Message.session_id, Message.sender),
+    ))
+
+def backfill_message_id_registry(connection):
+    """Registra los message_id de las particiones en línea creadas antes que el registro."""
+    partitions = MessagePartition.__table__
+    registry = MessageIdRegistry.__table__
+    names = connection.execute(select(partitions.c.name).where(partitions.c.state == "online")).scalars()
+    for name in names:
+        connection.execute(insert(registry).from_select(["message_id"], select(partition_table(name).c.message_id)))
+
 def create_db_and_tables():
+    """Crea las tablas e índices que falten (idempotente)."""
+    stats_existed = inspect(engine).has_table(SessionStats.__tablename__)
+    registry_existed = inspect(engine).has_table(MessageIdRegistry.__tablename__)
     Base.metadata.create_all(bind=engine)
+    with engine.begin() as connection:
+        if not stats_existed:
+            backfill_session_stats(connection)
+        if not registry_existed:
+            backfill_message_id_registry(connection)
+        # create_all no añade índices nuevos a tablas que ya existían
+        for index in Message.__table__.indexes:
+            index.create(bind=connection, checkfirst=True)
+        ensure_search_index(connection)
+        # Particiones creadas antes de que cada una tuviera su índice de texto
+        partitions = MessagePartition.__table__
+        for name in connection.execute(select(partitions.c.name).where(partitions.c.state == "online")).scalars():
+            ensure_search_index(connection, name)
+
+@asynccontextmanager
+async def open_session(session_factory):
+    """Abre una sesión (síncrona o asíncrona) fuera de una dependencia y la cierra al salir."""
+    db = session_factory()
+    try:
+        yield db
+    finally:
+        if isinstance(db, AsyncSession):
+            await db.close()
+        else:
+            db.close()
+
+async def run_db(db, fn, *args, **kwargs):
+    """Ejecuta una función CRUD síncrona sin bloquear el event loop.
+
+    Con una ``AsyncSession`` la función se ejecuta mediante ``run_sync`` sobre
+    el driver asíncrono; con una ``Session`` clásica se delega al threadpool.
+    """
+    with metrics.span("db"):
+        if isinstance(db, AsyncSession):
+            return await db.run_sync(fn, *args, **kwargs)
+        return await run_in_threadpool(fn, db, *args, **kwargs)
+
+async def ping(timeout: float = DB_HEALTH_TIMEOUT_SECONDS):
+    """Comprueba que la base de datos responde (``SELECT 1`` con el engine de los endpoints)."""
+    async def check():
+        if DB_ASYNC:
+            async with async_engine.connect() as connection:
+                await connection.execute(text("SELECT 1"))
+        else:
+            await run_in_threadpool(_ping_sync)
+
+    await asyncio.wait_for(check(), timeout)
+
+def _ping_sync():
+    with engine.connect() as connection:
+        connection.execute(text("SELECT 1"))
+
+if __name__ == "__main__":
+    # Con DB_CREATE_SCHEMA=false el esquema se crea una vez (p. ej. en un Job) antes de desplegar
+    create_db_and_tables()
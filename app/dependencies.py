@@ -1,12 +1,9 @@
 from fastapi import Depends, HTTPException, status, Request
 from fastapi.security import APIKeyHeader
-from fastapi_limiter import FastAPILimiter
-from fastapi_limiter.depends import RateLimiter
 
-from .database import SessionLocal
-
-# En una aplicación real, esta clave debería cargarse desde variables de entorno o un servicio de secretos.
-API_KEY_SECRET = "my-super-secret-key"
+from .database import SessionLocal, AsyncSessionLocal, DB_ASYNC, open_session
+from . import api_keys, metrics, replicas
+from .rate_limit import RateLimiter
 
 api_key_header_scheme = APIKeyHeader(name="X-API-Key", auto_error=False)
 
@@ -17,14 +14,49 @@ def get_db():
     finally:
         db.close()
 
-def get_api_key(api_key_header: str = Depends(api_key_header_scheme)):
-    """Dependencia que valida la clave de API en la cabecera."""
-    if not api_key_header or api_key_header != API_KEY_SECRET:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Clave de API inválida o faltante",
-        )
-    return api_key_header
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+# Dependencia de sesión usada por los endpoints: asíncrona por defecto, síncrona con DB_ASYNC=false
+get_session = get_async_db if DB_ASYNC else get_db
+
+async def get_read_session(request: Request, db=Depends(get_session)):
+    """Sesión para lecturas: una réplica sana si hay READ_REPLICA_URLS, si no la del primario.
+
+    Un cliente que acaba de hacer un POST lee del primario para ver su propia escritura.
+    La réplica elegida queda en ``request.state.read_replica`` (None = primario).
+    """
+    replica = await replicas.replica_set.choose(request) if replicas.replica_set is not None else None
+    request.state.read_replica = replica
+    if replica is None:
+        yield db
+        return
+    async with open_session(replica.session_factory) as replica_db:
+        yield replica_db
+
+def get_session_factory():
+    """Fábrica de sesiones para código que abre la sesión bajo demanda (p. ej. WebSockets)."""
+    return AsyncSessionLocal if DB_ASYNC else SessionLocal
+
+async def get_api_key(request: Request, api_key_header: str = Depends(api_key_header_scheme)):
+    """Dependencia que valida la clave de API en la cabecera.
+
+    Deja los metadatos de la clave en ``request.state.api_key`` y, si su nivel
+    tiene límite propio, lo fija en ``request.state.rate_limit``.
+    """
+    with metrics.span("auth"):
+        info = api_keys.key_cache.authenticate(api_key_header) if api_key_header else None
+        if info is None:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Clave de API inválida o faltante",
+            )
+        request.state.api_key = info
+        limit = api_keys.TIER_LIMITS.get(info.tier)
+        if limit is not None:
+            request.state.rate_limit = limit
+        return api_key_header
 
-# Use RateLimiter as a dependency - this is the correct way
+# Limitador por clave de API (o IP) y ruta; en memoria salvo RATE_LIMIT_BACKEND=redis
 rate_limit_dependency = RateLimiter(times=5, seconds=60)
\ No newline at end of file
@@ -0,0 +1,113 @@
+import os
+import re
+import time
+from typing import Iterable
+
+REPLACEMENT = "****"
+
+
+def _trie_pattern(words: Iterable[str]) -> str:
+    """Construye una alternancia regex factorizada por prefijos (trie) de las palabras.
+
+    Con un trie el motor de regex descarta una posición en cuanto el primer
+    carácter no coincide, en lugar de probar cada palabra por separado.
+    """
+    trie: dict = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def build(node: dict) -> str:
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        alternation = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        # Si aquí termina una palabra, el resto es opcional (codicioso: prefiere la más larga)
+        return f"(?:{alternation})?" if "" in node else alternation
+
+    return build(trie)
+
+
+class BannedWordFilter:
+    """Filtro de palabras prohibidas compilado en una única expresión regular.
+
+    ``whole_words=False`` reemplaza cualquier aparición (como subcadena);
+    ``whole_words=True`` solo palabras completas.
+    """
+
+    def __init__(self, words: Iterable[str], whole_words: bool = False, replacement: str = REPLACEMENT):
+        self.words = frozenset(word.lower() for word in words if word)
+        self.whole_words = whole_words
+        self.replacement = replacement
+        self._pattern = None
+        if self.words:
+            pattern = _trie_pattern(self.words)
+            if whole_words:
+                pattern = rf"\b{pattern}\b"
+            self._pattern = re.compile(pattern, re.IGNORECASE)
+
+    def filter(self, content: str) -> str:
+        if self._pattern is None:
+            return content
+        return self._pattern.sub(self.replacement, content)
+
+
+def load_words(path: str) -> set[str]:
+    """Lee una palabra por línea, ignorando líneas vacías y comentarios (#)."""
+    with open(path, encoding="utf-8") as handle:
+        return {line.strip() for line in handle if line.strip() and not line.lstrip().startswith("#")}
+
+
+class WordListFile:
+    """Lista de palabras prohibidas en un fichero, recargada en caliente al cambiar.
+
+    El ``mtime`` del fichero se comprueba como mucho cada ``check_interval``
+    segundos, así que el coste por mensaje es una lectura del reloj.
+    """
+
+    def __init__(self, path: str, whole_words: bool = False, check_interval: float = 5.0):
+        self.path = path
+        self.whole_words = whole_words
+        self.check_interval = check_interval
+        self._mtime: float | None = None
+        self._next_check = 0.0
+        self._filter = BannedWordFilter((), whole_words)
+
+    def get_filter(self) -> BannedWordFilter:
+        now = time.monotonic()
+        if now >= self._next_check:
+            self._next_check = now + self.check_interval
+            self.reload()
+        return self._filter
+
+    def reload(self, force: bool = False) -> bool:
+        """Recompila el filtro si el fichero ha cambiado. Devuelve si se recargó."""
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except FileNotFoundError:
+            return False
+        if not force and mtime == self._mtime:
+            return False
+        self._filter = BannedWordFilter(load_words(self.path), self.whole_words)
+        self._mtime = mtime
+        return True
+
+
+_compiled_cache: tuple[object, int, bool, BannedWordFilter] | None = None
+
+
+def compiled_filter(words: Iterable[str], whole_words: bool = False) -> BannedWordFilter:
+    """Devuelve el filtro compilado para ``words``, recompilándolo solo si la colección cambia.
+
+    Se compara por identidad y tamaño para no recorrer la lista en cada mensaje:
+    para cambiar la lista hay que asignar una colección nueva.
+    """
+    global _compiled_cache
+    cached = _compiled_cache
+    if cached is not None and cached[0] is words and cached[1] == len(words) and cached[2] == whole_words:
+        return cached[3]
+    engine = BannedWordFilter(words, whole_words)
+    _compiled_cache = (words, len(words), whole_words, engine)
+    return engine
@@ -0,0 +1,89 @@
+import os
+
+from redis.exceptions import RedisError
+
+from .cache import LRUTTLCache
+
+# Reintentos de POST /api/messages/ con un message_id ya guardado
+IDEMPOTENCY_ENABLED = os.getenv("IDEMPOTENCY_ENABLED", "true").lower() in ("1", "true", "yes")
+IDEMPOTENCY_MAX_ENTRIES = int(os.getenv("IDEMPOTENCY_MAX_ENTRIES", "50000"))
+# Memoria máxima de las respuestas recordadas (suma de sus JSON)
+IDEMPOTENCY_MAX_BYTES = int(os.getenv("IDEMPOTENCY_MAX_BYTES", str(16 * 1024 * 1024)))
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", "3600"))
+# Con Redis los reintentos se reconocen aunque lleguen a otra réplica
+IDEMPOTENCY_REDIS_ENABLED = os.getenv("IDEMPOTENCY_REDIS_ENABLED", "false").lower() in ("1", "true", "yes")
+
+# Cabecera de las respuestas que devuelven un mensaje guardado por una petición anterior
+REPLAY_HEADER = "Idempotent-Replay"
+
+
+class DuplicateMessage(Exception):
+    """El message_id ya estaba guardado; ``message_json`` es el mensaje almacenado."""
+
+    def __init__(self, message_json: bytes):
+        super().__init__("message_id ya existente")
+        self.message_json = message_json
+
+
+class RecentMessages:
+    """Mensajes creados recientemente por (tenant, message_id), ya serializados a JSON.
+
+    Un reintento del mismo POST se responde desde aquí sin filtrar ni tocar
+    la BD. La clave incluye el tenant de la clave de API, así que un
+    message_id de otro tenant nunca se responde desde aquí. La memoria está
+    acotada en bytes (``max_bytes``, la suma de los JSON), además de por
+    ``max_entries`` (LRU) y ``ttl``; los reintentos que ya no están en la
+    ventana los detecta la restricción única de ``message_id`` al guardar.
+    """
+
+    def __init__(self, max_entries: int = IDEMPOTENCY_MAX_ENTRIES, ttl: int = IDEMPOTENCY_TTL_SECONDS,
+                 redis=None, prefix: str = "chat:idempotency", max_bytes: int = IDEMPOTENCY_MAX_BYTES):
+        self.local = LRUTTLCache(max_entries, ttl=ttl, max_bytes=max_bytes)
+        self.ttl = ttl
+        self.redis = redis
+        self.prefix = prefix
+        self.replays = 0
+        self.redis_errors = 0
+
+    async def get(self, tenant: str | None, message_id: str) -> bytes | None:
+        key = f"{tenant or ''}:{message_id}"
+        value = self.local.get(key)
+        if value is None and self.redis is not None:
+            try:
+                raw = await self.redis.get(f"{self.prefix}:{key}")
+            except RedisError:
+                self.redis_errors += 1
+                raw = None
+            if raw is not None:
+                value = raw.encode() if isinstance(raw, str) else raw
+                self.local.set(key, value)
+        if value is not None:
+            self.replays += 1
+        return value
+
+    async def remember(self, tenant: str | None, message_id: str, message_json: bytes):
+        key = f"{tenant or ''}:{message_id}"
+        self.local.set(key, message_json)
+        if self.redis is None:
+            return
+        try:
+            await self.redis.set(f"{self.prefix}:{key}", message_json.decode(), ex=self.ttl)
+        except RedisError:
+            self.redis_errors += 1
+
+    def clear(self):
+        self.local.clear()
+
+    def stats(self) -> dict:
+        return {
+            "enabled": IDEMPOTENCY_ENABLED,
+            "entries": len(self.local),
+            "bytes": self.local.bytes,
+            "replays": self.replays,
+            "evictions": self.local.evictions,
+            "redis_enabled": self.redis is not None,
+            "redis_errors": self.redis_errors,
+        }
+
+
+recent_messages = RecentMessages()
@@ -0,0 +1,104 @@
+import codecs
+import json
+from typing import Any, AsyncIterator
+
+# Tamaño máximo de un elemento pendiente de completar en el buffer de lectura
+MAX_ITEM_BYTES = 1024 * 1024
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = " \t\r\n"
+# Un error a menos de estos caracteres del final del buffer puede deberse a un escape \uXXXX cortado
+_TRUNCATION_MARGIN = 6
+
+
+class BulkFormatError(Exception):
+    """El cuerpo de la petición masiva no es un array JSON ni NDJSON válido.
+
+    ``result`` es el resultado parcial de la ingesta: los elementos leídos
+    antes del error ya se han guardado.
+    """
+
+    def __init__(self, message: str, result=None):
+        super().__init__(message)
+        self.result = result
+
+
+def _is_truncated(exc: json.JSONDecodeError, buffer: str) -> bool:
+    """Indica si el error de decodificación puede deberse a que el elemento aún no ha llegado entero."""
+    return exc.msg.startswith("Unterminated string") or len(buffer) - exc.pos <= _TRUNCATION_MARGIN
+
+
+def _syntax_error(exc: json.JSONDecodeError, count: int) -> BulkFormatError:
+    return BulkFormatError(f"JSON inválido en el elemento {count}: {exc.msg}")
+
+
+async def iter_ndjson(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """Devuelve cada línea no vacía de un cuerpo NDJSON a medida que llega."""
+    pending = b""
+    async for chunk in chunks:
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield line
+        if len(pending) > MAX_ITEM_BYTES:
+            raise BulkFormatError("Línea NDJSON demasiado grande")
+    if pending.strip():
+        yield pending
+
+
+def _skip_whitespace(buffer: str, pos: int) -> int:
+    while pos < len(buffer) and buffer[pos] in _WHITESPACE:
+        pos += 1
+    return pos
+
+
+async def iter_json_array(chunks: AsyncIterator[bytes]) -> AsyncIterator[Any]:
+    """Decodifica incrementalmente los elementos de un array JSON sin cargarlo entero."""
+    decode = codecs.getincrementaldecoder("utf-8")().decode
+    buffer, pos = "", 0
+    state = "start"  # start -> item <-> separator -> end
+    count = 0
+    async for chunk in chunks:
+        buffer = buffer[pos:] + decode(chunk)
+        pos = 0
+        while True:
+            pos = _skip_whitespace(buffer, pos)
+            if pos >= len(buffer):
+                break
+            char = buffer[pos]
+            if state == "start":
+                if char != "[":
+                    raise BulkFormatError("Se esperaba un array JSON")
+                pos, state = pos + 1, "item"
+            elif state == "item":
+                if char == "]" and count == 0:
+                    pos, state = pos + 1, "end"
+                    continue
+                try:
+                    value, pos = _decoder.raw_decode(buffer, pos)
+                except json.JSONDecodeError as exc:
+                    if not _is_truncated(exc, buffer):
+                        raise _syntax_error(exc, count)
+                    # Elemento incompleto: esperamos al siguiente fragmento
+                    if len(buffer) - pos > MAX_ITEM_BYTES:
+                        raise BulkFormatError(f"Elemento {count} demasiado grande")
+                    break
+                count += 1
+                state = "separator"
+                yield value
+            elif state == "separator":
+                if char not in ",]":
+                    raise BulkFormatError(f"Se esperaba ',' o ']' tras el elemento {count - 1}")
+                pos, state = pos + 1, ("item" if char == "," else "end")
+            else:
+                raise BulkFormatError("Contenido inesperado tras el final del array")
+    if state == "item" and _skip_whitespace(buffer, pos) < len(buffer):
+        # Sin más fragmentos, un elemento que no se decodifica solo es incompleto si se corta al final
+        try:
+            _decoder.raw_decode(buffer, _skip_whitespace(buffer, pos))
+        except json.JSONDecodeError as exc:
+            if exc.pos < len(buffer) and not exc.msg.startswith("Unterminated string"):
+                raise _syntax_error(exc, count)
+    if state != "end":
+        raise BulkFormatError("Array JSON incompleto")
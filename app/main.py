@@ -1,31 +1,134 @@
+import math
 import os
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request, status, Depends
 from fastapi.responses import JSONResponse
 from fastapi.exceptions import RequestValidationError
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from redis.asyncio import Redis
-from fastapi_limiter import FastAPILimiter
-from fastapi_limiter.depends import RateLimiter # Add this import
+from starlette.concurrency import run_in_threadpool
 
-from .database import create_db_and_tables
+from .database import create_db_and_tables, SessionLocal, AsyncSessionLocal, DB_ASYNC, DB_CREATE_SCHEMA
+from . import write_queue, cache, broadcast, rate_limit, processing, services, metrics, replicas, idempotency, api_keys
+from .ingest import BulkFormatError
+from .pagination import InvalidCursor
 from .routers import messages
 from .routers import websocket # Add websocket
-from .schemas import ErrorResponse, ErrorDetail
+from .routers import monitoring
+from .schemas import BulkIngestErrorResponse, ErrorResponse, ErrorDetail
 from .dependencies import rate_limit_dependency  # Add this import
 
-# En una app de producción, esto se manejaría con Alembic o un script de inicialización
-create_db_and_tables()
+REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
+REDIS_PORT = int(os.getenv("REDIS_PORT", "6379"))
+# Acota cuánto espera cada intento de conexión si Redis no responde
+REDIS_CONNECT_TIMEOUT_SECONDS = float(os.getenv("REDIS_CONNECT_TIMEOUT_SECONDS", "1"))
+
+
+def redis_required() -> bool:
+    """Si alguna función configurada usa Redis; si no, no se crea el cliente."""
+    return (
+        rate_limit.RATE_LIMIT_BACKEND == "redis"
+        or cache.CACHE_REDIS_ENABLED
+        or idempotency.IDEMPOTENCY_REDIS_ENABLED
+        or broadcast.BROADCAST_BACKEND == "redis"
+        or (replicas.replica_set is not None and replicas.READ_YOUR_WRITES_REDIS_ENABLED)
+    )
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Arranque y parada de la aplicación.
+
+    Importar el módulo no toca la base de datos ni Redis: el esquema se crea
+    aquí (salvo con DB_CREATE_SCHEMA=false) y el cliente de Redis no conecta
+    hasta el primer comando. Si Redis no está disponible, cada función usa su
+    alternativa local (modo degradado) y /health/ready lo indica.
+    """
+    app.state.ready = False
+    # En una app de producción, esto se manejaría con Alembic o un script de inicialización
+    if DB_CREATE_SCHEMA:
+        await run_in_threadpool(create_db_and_tables)
+
+    redis = None
+    if redis_required():
+        redis = Redis(
+            host=REDIS_HOST, port=REDIS_PORT, db=0, encoding="utf-8", decode_responses=True,
+            socket_connect_timeout=REDIS_CONNECT_TIMEOUT_SECONDS,
+        )
+    app.state.redis = redis
+
+    # Por defecto el límite de tasa se aplica en memoria, sin depender de Redis
+    if rate_limit.RATE_LIMIT_BACKEND == "redis":
+        rate_limit_dependency.backend = rate_limit.RedisRateLimitBackend(redis)
+
+    # La caché del historial reutiliza la misma conexión de Redis como segundo nivel
+    if cache.CACHE_REDIS_ENABLED:
+        cache.history_cache.redis = redis
+
+    # Los message_id recientes se comparten entre réplicas para reconocer reintentos en cualquiera
+    if idempotency.IDEMPOTENCY_REDIS_ENABLED:
+        idempotency.recent_messages.redis = redis
+
+    # Con varias réplicas los mensajes se difunden a través de Redis pub/sub
+    if broadcast.BROADCAST_BACKEND == "redis":
+        broadcast.broadcaster = broadcast.RedisBroadcast(redis, websocket.manager.broadcast)
+        await broadcast.broadcaster.start()
+
+    # Filtrado y metadatos en un pool de hilos o procesos en lugar del event loop
+    if processing.PROCESSING_MODE != "inline":
+        processing.pipeline = processing.ProcessingPipeline(services.process_contents)
+        await processing.pipeline.start()
+
+    # Claves de API en memoria, recargadas periódicamente desde su almacén
+    await api_keys.key_cache.start()
+
+    # Comprobación periódica de las réplicas de lectura
+    if replicas.replica_set is not None:
+        # La ventana de lectura de las propias escrituras se comparte entre las réplicas a través de Redis
+        if replicas.READ_YOUR_WRITES_REDIS_ENABLED:
+            replicas.replica_set.redis = redis
+        await replicas.replica_set.start()
+
+    if write_queue.WRITE_BATCH_ENABLED:
+        write_queue.write_queue = write_queue.MessageWriteQueue(
+            AsyncSessionLocal if DB_ASYNC else SessionLocal
+        )
+        await write_queue.write_queue.start()
+
+    app.state.ready = True
+    yield
+    # Deja de recibir tráfico nuevo mientras se vacían las colas
+    app.state.ready = False
+
+    if write_queue.write_queue is not None:
+        await write_queue.write_queue.stop()
+        write_queue.write_queue = None
+    if processing.pipeline is not None:
+        await processing.pipeline.stop()
+        processing.pipeline = None
+    await broadcast.broadcaster.stop()
+    await api_keys.key_cache.stop()
+    if replicas.replica_set is not None:
+        await replicas.replica_set.stop()
+    if redis is not None:
+        await redis.close()
+
 
 app = FastAPI(
     title="Chat Message API",
     description="Una API para procesar y recuperar mensajes de chat.",
     version="1.0.0",
+    lifespan=lifespan,
 )
+# Hasta que termina el arranque /health/ready responde 503
+app.state.ready = False
+app.state.redis = None
 
-@app.on_event("startup")
-async def startup():
-    redis_host = os.getenv("REDIS_HOST", "localhost")
-    redis = Redis(host=redis_host, port=6379, db=0, encoding="utf-8", decode_responses=True)
-    await FastAPILimiter.init(redis)
+# Tiempos por petición y por etapa, consultas SQL por petición y conexiones WebSocket
+# para GET /metrics; desactivado no se añade el middleware
+if metrics.METRICS_ENABLED:
+    app.add_middleware(metrics.MetricsMiddleware)
+metrics.websocket_connections.function = lambda: len(websocket.manager.active_connections)
 
 # Manejador de errores de validación personalizado
 @app.exception_handler(RequestValidationError)
@@ -46,13 +149,76 @@ async def validation_exception_handler(request: Request, exc: RequestValidationE
         ).model_dump(),
     )
 
+# Límite de tasa superado
+@app.exception_handler(rate_limit.RateLimitExceeded)
+async def rate_limit_exceeded_handler(request: Request, exc: rate_limit.RateLimitExceeded):
+    return JSONResponse(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        headers={"Retry-After": str(math.ceil(exc.retry_after))},
+        content=ErrorResponse(
+            error=ErrorDetail(code="RATE_LIMITED", message=str(exc))
+        ).model_dump(),
+    )
+
+# Cursor de paginación manipulado o de otra consulta
+@app.exception_handler(InvalidCursor)
+async def invalid_cursor_exception_handler(request: Request, exc: InvalidCursor):
+    return JSONResponse(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        content=ErrorResponse(
+            error=ErrorDetail(code="INVALID_CURSOR", message=str(exc))
+        ).model_dump(),
+    )
+
+# Cuerpo de ingesta masiva mal formado
+@app.exception_handler(BulkFormatError)
+async def bulk_format_exception_handler(request: Request, exc: BulkFormatError):
+    return JSONResponse(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        content=BulkIngestErrorResponse(
+            error=ErrorDetail(
+                code="INVALID_FORMAT",
+                message="El cuerpo debe ser un array JSON o NDJSON",
+                details=str(exc),
+            ),
+            data=exc.result,
+        ).model_dump(),
+    )
+
+# La cola de escritura está saturada: se pide al cliente que reintente más tarde
+@app.exception_handler(write_queue.WriteQueueFull)
+async def write_queue_full_handler(request: Request, exc: write_queue.WriteQueueFull):
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        headers={"Retry-After": "1"},
+        content=ErrorResponse(
+            error=ErrorDetail(
+                code="SERVICE_OVERLOADED",
+                message="El servidor está procesando demasiados mensajes",
+                details=str(exc),
+            )
+        ).model_dump(),
+    )
+
+# Todas las conexiones del pool están ocupadas y se agotó DB_POOL_TIMEOUT
+@app.exception_handler(PoolTimeoutError)
+async def pool_timeout_handler(request: Request, exc: PoolTimeoutError):
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        headers={"Retry-After": "1"},
+        content=ErrorResponse(
+            error=ErrorDetail(
+                code="DATABASE_BUSY",
+                message="No hay conexiones libres con la base de datos",
+                details=str(exc),
+            )
+        ).model_dump(),
+    )
+
 app.include_router(messages.router)
 app.include_router(websocket.router)
-
-@app.on_event("shutdown")
-async def shutdown():
-    await FastAPILimiter.close()
+app.include_router(monitoring.router)
 
 @app.get("/")
-async def read_root(request: Request, rate_limiter: RateLimiter = Depends(rate_limit_dependency)):
+async def read_root(request: Request, rate_limiter: None = Depends(rate_limit_dependency)):
     return {"message": "Bienvenido a la API de Mensajes de Chat"}
\ No newline at end of file
@@ -0,0 +1,270 @@
+import functools
+import inspect
+import math
+import os
+import time
+from bisect import bisect_left
+from contextlib import nullcontext
+from contextvars import ContextVar
+from typing import Callable
+
+from fastapi.routing import APIRoute
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Métricas de peticiones y etapas en formato Prometheus (GET /metrics)
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+
+# Buckets en segundos: la petición completa y cada etapa (más finos, las etapas son cortas)
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STAGE_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: tuple[str, ...], values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """Base de las métricas: nombre, ayuda y valores por combinación de etiquetas."""
+
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+
+    def render(self) -> list[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}", *self.samples()]
+
+    def samples(self) -> list[str]:
+        raise NotImplementedError
+
+
+class Gauge(Metric):
+    """Valor instantáneo; con ``function`` se calcula al generar la salida."""
+
+    type = "gauge"
+
+    def __init__(self, name, documentation, function: Callable[[], float] | None = None):
+        super().__init__(name, documentation)
+        self.function = function
+        self.value = 0
+
+    def set(self, value: float):
+        self.value = value
+
+    def samples(self):
+        value = self.function() if self.function is not None else self.value
+        return [f"{self.name} {_number(value)}"]
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=REQUEST_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets) + (math.inf,)
+        # etiquetas -> [contador por bucket (no acumulado), suma, total]
+        self._values: dict[tuple, list] = {}
+
+    def observe(self, value: float, *labels):
+        entry = self._values.get(labels)
+        if entry is None:
+            entry = self._values[labels] = [[0] * len(self.buckets), 0.0, 0]
+        # Primer límite >= value (los buckets de Prometheus son "le")
+        entry[0][bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+        entry[2] += 1
+
+    def samples(self):
+        lines = []
+        for labels, (counts, total, count) in self._values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = f'le="{_number(bound)}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: list[Metric] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """Formato de exposición de texto de Prometheus (versión 0.0.4)."""
+        return "\n".join(line for metric in self.metrics for line in metric.render()) + "\n"
+
+
+registry = Registry()
+request_duration = registry.register(Histogram(
+    "http_request_duration_seconds", "Duración de las peticiones HTTP.", ("method", "route", "status"),
+))
+stage_duration = registry.register(Histogram(
+    "request_stage_duration_seconds", "Duración de cada etapa del procesamiento de una petición.", ("stage",),
+    buckets=STAGE_BUCKETS,
+))
+db_queries = registry.register(Histogram(
+    "db_queries_per_request", "Consultas SQL ejecutadas por petición.", ("method", "route"), buckets=QUERY_BUCKETS,
+))
+websocket_connections = registry.register(Gauge(
+    "websocket_connections", "Conexiones WebSocket activas en esta réplica.",
+))
+
+
+class RequestMetrics:
+    """Estado de la petición en curso: consultas SQL y tiempo ya atribuido a etapas."""
+
+    __slots__ = ("queries", "span_time", "validation_start")
+
+    def __init__(self):
+        self.queries = 0
+        self.span_time = 0.0
+        # (instante, span_time) al empezar a resolver la ruta, hasta que arranca el endpoint
+        self.validation_start: tuple[float, float] | None = None
+
+
+# Se asigna un objeto mutable por petición: los hilos del threadpool y run_sync trabajan
+# sobre una copia del contexto, pero comparten la misma instancia
+_current: ContextVar[RequestMetrics | None] = ContextVar("request_metrics", default=None)
+
+_DISABLED = nullcontext()
+
+
+class _Span:
+    __slots__ = ("stage", "start")
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        stage_duration.observe(elapsed, self.stage)
+        current = _current.get()
+        if current is not None:
+            current.span_time += elapsed
+        return False
+
+
+def span(stage: str):
+    """Mide una etapa (``with metrics.span("db"): ...``); sin coste apreciable si está desactivado."""
+    return _Span(stage) if METRICS_ENABLED else _DISABLED
+
+
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    current = _current.get()
+    if current is not None:
+        current.queries += 1
+
+
+if METRICS_ENABLED:
+    # Todos los engines, incluidos el síncrono interno de cada engine asíncrono
+    event.listen(Engine, "before_cursor_execute", _count_query)
+
+
+class MetricsMiddleware:
+    """Middleware ASGI: duración y consultas SQL de cada petición, etiquetadas por ruta.
+
+    Se usa la plantilla de la ruta (``/api/messages/{session_id}``) para no
+    crear una serie por sesión; las peticiones sin ruta cuentan como
+    ``unmatched``.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        current = RequestMetrics()
+        token = _current.set(current)
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route")
+            path = route.path if route is not None else "unmatched"
+            request_duration.observe(time.perf_counter() - start, scope["method"], path, str(status_code))
+            db_queries.observe(current.queries, scope["method"], path)
+            _current.reset(token)
+
+
+def _end_validation(current: RequestMetrics | None):
+    if current is None or current.validation_start is None:
+        return
+    started, span_time = current.validation_start
+    current.validation_start = None
+    elapsed = time.perf_counter() - started - (current.span_time - span_time)
+    stage_duration.observe(max(elapsed, 0.0), "validation")
+
+
+class TimedRoute(APIRoute):
+    """Ruta que atribuye a la etapa ``validation`` el tiempo previo al endpoint.
+
+    Cubre la lectura del cuerpo, su validación con Pydantic y la resolución de
+    parámetros; se descuenta lo ya medido por otras etapas (autenticación,
+    limitación de tasa) para no contarlo dos veces.
+    """
+
+    def __init__(self, path: str, endpoint: Callable, **kwargs):
+        if METRICS_ENABLED and inspect.iscoroutinefunction(endpoint):
+            endpoint = self._mark_start(endpoint)
+        super().__init__(path, endpoint, **kwargs)
+
+    @staticmethod
+    def _mark_start(endpoint: Callable) -> Callable:
+        # functools.wraps conserva la firma: FastAPI sigue viendo los parámetros del endpoint
+        @functools.wraps(endpoint)
+        async def wrapper(*args, **kwargs):
+            _end_validation(_current.get())
+            return await endpoint(*args, **kwargs)
+        return wrapper
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+        if not METRICS_ENABLED:
+            return handler
+
+        async def timed_handler(request):
+            current = _current.get()
+            if current is not None:
+                current.validation_start = (time.perf_counter(), current.span_time)
+            try:
+                return await handler(request)
+            finally:
+                # Si la validación falla el endpoint no llega a ejecutarse
+                _end_validation(current)
+        return timed_handler
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime
+from sqlalchemy import Boolean, Column, Integer, String, DateTime, Index
 from sqlalchemy.orm import declarative_base
 
 Base = declarative_base()
@@ -8,10 +8,95 @@ class Message(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     message_id = Column(String, unique=True, index=True)
-    session_id = Column(String, index=True)
+    session_id = Column(String)
     content = Column(String)
     timestamp = Column(DateTime)
     sender = Column(String)
     word_count = Column(Integer)
     character_count = Column(Integer)
     processed_at = Column(DateTime)
+
+    # session_id no lleva índice propio: es el prefijo de los índices compuestos
+    __table_args__ = (
+        # Historial de una sesión ordenado por (timestamp, id): soporta la paginación por cursor
+        Index("ix_messages_session_timestamp_id", "session_id", "timestamp", "id"),
+        # Historial filtrado por remitente, con el mismo orden
+        Index("ix_messages_session_sender_timestamp_id", "session_id", "sender", "timestamp", "id"),
+    )
+
+class SessionStats(Base):
+    """Agregados por (sesión, remitente), actualizados en la misma transacción que cada inserción."""
+
+    __tablename__ = "session_stats"
+
+    session_id = Column(String, primary_key=True)
+    sender = Column(String, primary_key=True)
+    message_count = Column(Integer, nullable=False, default=0)
+    word_count = Column(Integer, nullable=False, default=0)
+    character_count = Column(Integer, nullable=False, default=0)
+    first_timestamp = Column(DateTime)
+    last_timestamp = Column(DateTime)
+
+class MessagePartition(Base):
+    """Catálogo de particiones mensuales de mensajes (ver app/partitioning.py)."""
+
+    __tablename__ = "message_partitions"
+
+    name = Column(String, primary_key=True)
+    # Rango [range_start, range_end) de timestamp que contiene la partición
+    range_start = Column(DateTime, nullable=False)
+    range_end = Column(DateTime, nullable=False)
+    row_count = Column(Integer, nullable=False, default=0)
+    # online: tabla consultable; archived: volcada a archive_path y eliminada
+    state = Column(String, nullable=False, default="online")
+    archive_path = Column(String)
+    archived_at = Column(DateTime)
+
+class PartitionCatalogVersion(Base):
+    """Versión del catálogo de particiones: el mantenimiento la incrementa en cada cambio.
+
+    Cada proceso cachea el catálogo y lo vuelve a leer solo si la versión ha cambiado.
+    """
+
+    __tablename__ = "message_partitions_version"
+
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+class MessageIdRegistry(Base):
+    """message_id de todos los mensajes con particionado activo (ver app/partitioning.py).
+
+    El índice único de ``messages`` solo cubre la tabla activa: esta tabla
+    mantiene la unicidad de los mensajes ya movidos a particiones mensuales.
+    """
+
+    __tablename__ = "message_id_registry"
+
+    message_id = Column(String, primary_key=True)
+
+class ApiKey(Base):
+    """Claves de API por tenant para API_KEY_STORE=db (ver app/api_keys.py); solo se guarda su hash."""
+
+    __tablename__ = "api_keys"
+
+    # SHA-256 en hexadecimal de la clave
+    key_hash = Column(String(64), primary_key=True)
+    tenant = Column(String, nullable=False)
+    # Nivel de limitación de tasa (API_KEY_TIERS); sin nivel se aplican los límites por defecto
+    tier = Column(String)
+    # Para rotar una clave se crea la nueva y se desactiva la anterior
+    active = Column(Boolean, nullable=False, default=True)
+    created_at = Column(DateTime)
+
+# Columnas que devuelven las consultas de lectura (filas de Core, sin instanciar objetos ORM)
+MESSAGE_COLUMNS = (
+    Message.id,
+    Message.message_id,
+    Message.session_id,
+    Message.content,
+    Message.timestamp,
+    Message.sender,
+    Message.word_count,
+    Message.character_count,
+    Message.processed_at,
+)
@@ -0,0 +1,37 @@
+import base64
+import json
+from datetime import datetime
+
+
+class InvalidCursor(ValueError):
+    """El cursor de paginación no es válido para esta consulta."""
+
+
+def encode_cursor(kind: str, values: list) -> str:
+    """Codifica la clave de ordenación de la última fila en un cursor opaco."""
+    payload = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    raw = json.dumps({"k": kind, "v": payload}, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(kind: str, cursor: str) -> list:
+    """Decodifica un cursor generado por ``encode_cursor`` para el mismo tipo de consulta."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        data = json.loads(raw)
+        values = data["v"]
+    except (ValueError, TypeError, KeyError):
+        raise InvalidCursor("Cursor de paginación inválido")
+    if not isinstance(data, dict) or data.get("k") != kind or not isinstance(values, list):
+        raise InvalidCursor("Cursor de paginación inválido")
+    return values
+
+
+def decode_timestamp_cursor(cursor: str) -> tuple[datetime, int]:
+    """Cursor del historial de una sesión: ``(timestamp, id)`` de la última fila."""
+    values = decode_cursor("history", cursor)
+    try:
+        timestamp, message_id = values
+        return datetime.fromisoformat(timestamp), int(message_id)
+    except (ValueError, TypeError):
+        raise InvalidCursor("Cursor de paginación inválido")
@@ -0,0 +1,249 @@
+import argparse
+import gzip
+import json
+import os
+from datetime import datetime
+from typing import NamedTuple
+from weakref import WeakKeyDictionary
+
+from sqlalchemy import Column, Index, MetaData, Table, delete, func, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+from . import models, search, serialization
+
+# Particionado mensual: la tabla messages es la partición activa y recibe todas las escrituras;
+# el mantenimiento (python -m app.partitioning) mueve los meses antiguos a tablas messages_AAAA_MM
+# con los mismos índices y archiva en NDJSON comprimido las que superan la retención.
+# Meses completos que permanecen en la tabla activa además del actual (0 desactiva el particionado)
+PARTITION_HOT_MONTHS = int(os.getenv("PARTITION_HOT_MONTHS", "0"))
+# Antigüedad en meses a partir de la cual una partición se archiva (0: no se archiva nunca)
+PARTITION_RETENTION_MONTHS = int(os.getenv("PARTITION_RETENTION_MONTHS", "0"))
+PARTITION_ARCHIVE_DIR = os.getenv("PARTITION_ARCHIVE_DIR", "./archive")
+PARTITIONING_ENABLED = PARTITION_HOT_MONTHS > 0
+
+# Filas por bloque al volcar una partición al archivo
+ARCHIVE_BATCH_SIZE = 1000
+
+_INSERTS = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}
+
+
+def month_start(value: datetime) -> datetime:
+    return value.replace(day=1, hour=0, minute=0, second=0, microsecond=0, tzinfo=None)
+
+
+def add_months(value: datetime, months: int) -> datetime:
+    index = value.year * 12 + value.month - 1 + months
+    return value.replace(year=index // 12, month=index % 12 + 1)
+
+
+def partition_name(start: datetime) -> str:
+    return f"messages_{start:%Y_%m}"
+
+
+_metadata = MetaData()
+
+
+def partition_table(name: str) -> Table:
+    """Tabla de una partición: las columnas y los índices de ``messages``."""
+    table = _metadata.tables.get(name)
+    if table is not None:
+        return table
+    columns = [
+        Column(column.name, column.type, primary_key=column.primary_key)
+        for column in models.Message.__table__.columns
+    ]
+    return Table(
+        name, _metadata, *columns,
+        # Los nombres de índice son globales en SQLite: llevan el nombre de la partición
+        Index(f"ix_{name}_message_id", "message_id", unique=True),
+        Index(f"ix_{name}_session_timestamp_id", "session_id", "timestamp", "id"),
+        Index(f"ix_{name}_session_sender_timestamp_id", "session_id", "sender", "timestamp", "id"),
+    )
+
+
+class Partition(NamedTuple):
+    name: str
+    range_start: datetime
+    range_end: datetime
+
+    @property
+    def table(self) -> Table:
+        return partition_table(self.name)
+
+
+class PartitionCatalog:
+    """Particiones consultables de cada base de datos, cacheadas en memoria.
+
+    Cada lectura solo consulta la versión del catálogo (una fila por clave
+    primaria); la lista se vuelve a leer cuando el mantenimiento, que puede
+    ejecutarse en otro proceso, la ha incrementado.
+    """
+
+    def __init__(self):
+        # engine -> (versión, particiones en orden cronológico)
+        self._entries: WeakKeyDictionary = WeakKeyDictionary()
+
+    def online(self, db) -> list[Partition]:
+        bind = db.get_bind()
+        versions = models.PartitionCatalogVersion.__table__
+        version = db.execute(select(versions.c.version).where(versions.c.id == 1)).scalar() or 0
+        entry = self._entries.get(bind)
+        if entry is None or entry[0] != version:
+            catalog = models.MessagePartition.__table__
+            rows = db.execute(
+                select(catalog.c.name, catalog.c.range_start, catalog.c.range_end)
+                .where(catalog.c.state == "online")
+                .order_by(catalog.c.range_start)
+            ).all()
+            entry = self._entries[bind] = (version, [Partition(*row) for row in rows])
+        return entry[1]
+
+    def invalidate(self):
+        self._entries.clear()
+
+
+def bump_catalog_version(connection):
+    """Incrementa la versión del catálogo en la transacción del cambio: todos los procesos lo ven."""
+    versions = models.PartitionCatalogVersion.__table__
+    connection.execute(
+        _INSERTS[connection.dialect.name](versions).values(id=1, version=1)
+        .on_conflict_do_update(index_elements=[versions.c.id], set_={"version": versions.c.version + 1})
+    )
+
+
+catalog = PartitionCatalog()
+
+
+def seal_partitions(connection, now: datetime | None = None, hot_months: int = PARTITION_HOT_MONTHS) -> list[dict]:
+    """Mueve los mensajes anteriores a la ventana activa a sus particiones mensuales.
+
+    Se mueve un mes cada vez (INSERT ... SELECT y DELETE en la misma
+    transacción), empezando por el más antiguo. Los mensajes que llegan tarde
+    a un mes ya sellado se añaden a su partición en la siguiente ejecución.
+    El mensaje con el mayor id se queda siempre en la tabla activa para que
+    SQLite no reutilice ids ya movidos.
+
+    Los message_id movidos se añaden a ``message_id_registry``, que mantiene
+    su unicidad fuera de la tabla activa. Solo se borran de ``messages`` las
+    filas copiadas; una fila cuyo message_id ya estaba en la partición se
+    queda en la tabla activa y se cuenta en ``conflicts``.
+    """
+    boundary = add_months(month_start(now or datetime.utcnow()), -hot_months)
+    messages = models.Message.__table__
+    partitions = models.MessagePartition.__table__
+    registry = models.MessageIdRegistry.__table__
+    insert = _INSERTS[connection.dialect.name]
+    max_id = connection.execute(select(func.max(messages.c.id))).scalar()
+    if max_id is None:
+        return []
+    movable = (messages.c.timestamp < boundary) & (messages.c.id < max_id)
+    columns = [column.name for column in messages.columns]
+    sealed = []
+    end = None
+    while True:
+        # Se avanza mes a mes: las filas en conflicto que quedan en la tabla activa no se revisitan
+        pending = movable if end is None else movable & (messages.c.timestamp >= end)
+        oldest = connection.execute(select(func.min(messages.c.timestamp)).where(pending)).scalar()
+        if oldest is None:
+            break
+        start = month_start(oldest)
+        end = add_months(start, 1)
+        name = partition_name(start)
+        table = partition_table(name)
+        table.create(connection, checkfirst=True)
+        # Índice de texto propio: al salir de messages las filas dejan el índice de la tabla activa
+        search.ensure_search_index(connection, name)
+        in_month = movable & (messages.c.timestamp >= start) & (messages.c.timestamp < end)
+        connection.execute(
+            insert(registry).from_select(["message_id"], select(messages.c.message_id).where(in_month))
+            .on_conflict_do_nothing()
+        )
+        moved = connection.execute(
+            insert(table)
+            .from_select(columns, select(*(messages.c[column] for column in columns)).where(in_month))
+            .on_conflict_do_nothing()
+        ).rowcount
+        # Solo las filas que están en la partición: un message_id repetido no se pierde
+        connection.execute(delete(messages).where(in_month & messages.c.id.in_(select(table.c.id))))
+        conflicts = connection.execute(select(func.count()).where(in_month)).scalar()
+        row_count = connection.execute(select(func.count()).select_from(table)).scalar()
+        connection.execute(
+            insert(partitions)
+            .values(name=name, range_start=start, range_end=end, row_count=row_count, state="online")
+            .on_conflict_do_update(index_elements=[partitions.c.name], set_={"row_count": row_count})
+        )
+        entry = {"partition": name, "moved": moved, "rows": row_count}
+        if conflicts:
+            entry["conflicts"] = conflicts
+        sealed.append(entry)
+    if sealed:
+        bump_catalog_version(connection)
+    return sealed
+
+
+def archive_partitions(
+    connection, now: datetime | None = None, retention_months: int = PARTITION_RETENTION_MONTHS,
+    archive_dir: str = PARTITION_ARCHIVE_DIR,
+) -> list[dict]:
+    """Vuelca a ``archive_dir`` (NDJSON con gzip) y elimina las particiones fuera de la retención.
+
+    El fichero se escribe completo antes de eliminar la tabla; si el proceso
+    se interrumpe, la partición sigue en línea y se vuelve a archivar.
+    """
+    if retention_months <= 0:
+        return []
+    boundary = add_months(month_start(now or datetime.utcnow()), -retention_months)
+    partitions = models.MessagePartition.__table__
+    expired = connection.execute(
+        select(partitions.c.name)
+        .where((partitions.c.state == "online") & (partitions.c.range_end <= boundary))
+        .order_by(partitions.c.range_start)
+    ).scalars().all()
+    os.makedirs(archive_dir, exist_ok=True)
+    archived = []
+    for name in expired:
+        table = partition_table(name)
+        path = os.path.join(archive_dir, f"{name}.ndjson.gz")
+        result = connection.execute(
+            select(table).order_by(table.c.timestamp, table.c.id).execution_options(yield_per=ARCHIVE_BATCH_SIZE)
+        )
+        rows = 0
+        with gzip.open(path + ".tmp", "wb") as fh:
+            for batch in result.partitions():
+                fh.write(serialization.dumps_ndjson(batch))
+                rows += len(batch)
+        os.replace(path + ".tmp", path)
+        # Los mensajes archivados dejan de estar en línea: su message_id puede volver a usarse
+        registry = models.MessageIdRegistry.__table__
+        connection.execute(delete(registry).where(registry.c.message_id.in_(select(table.c.message_id))))
+        search.drop_search_index(connection, name)
+        table.drop(connection)
+        connection.execute(
+            update(partitions).where(partitions.c.name == name)
+            .values(state="archived", archive_path=path, archived_at=datetime.utcnow())
+        )
+        archived.append({"partition": name, "rows": rows, "path": path})
+    if archived:
+        bump_catalog_version(connection)
+    return archived
+
+
+def maintain(engine, now: datetime | None = None) -> dict:
+    """Sella los meses fuera de la ventana activa y archiva las particiones caducadas."""
+    with engine.begin() as connection:
+        sealed = seal_partitions(connection, now)
+    with engine.begin() as connection:
+        archived = archive_partitions(connection, now)
+    return {"sealed": sealed, "archived": archived}
+
+
+if __name__ == "__main__":
+    # Pensado para ejecutarse periódicamente (cron o CronJob de Kubernetes)
+    parser = argparse.ArgumentParser(description="Particionado mensual, retención y archivado de mensajes")
+    parser.add_argument("--now", type=datetime.fromisoformat, help="Fecha de referencia (por defecto, ahora)")
+    args = parser.parse_args()
+    if not PARTITIONING_ENABLED:
+        parser.error("Define PARTITION_HOT_MONTHS para activar el particionado")
+    from .database import engine
+
+    print(json.dumps(maintain(engine, args.now), indent=2))
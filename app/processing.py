@@ -0,0 +1,144 @@
+import asyncio
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable
+
+# inline: el filtrado y los metadatos se calculan en el event loop (por defecto);
+# thread / process: se ejecutan por lotes en un pool de hilos o de procesos
+PROCESSING_MODE = os.getenv("PROCESSING_MODE", "inline")
+PROCESSING_WORKERS = int(os.getenv("PROCESSING_WORKERS", str(os.cpu_count() or 1)))
+PROCESSING_BATCH_WINDOW_MS = float(os.getenv("PROCESSING_BATCH_WINDOW_MS", "2"))
+PROCESSING_BATCH_MAX_SIZE = int(os.getenv("PROCESSING_BATCH_MAX_SIZE", "64"))
+
+
+class ProcessingPipeline:
+    """Ejecuta una función CPU por lotes en un pool, fuera del event loop.
+
+    ``fn`` recibe una lista de elementos y devuelve la lista de resultados en
+    el mismo orden; en modo ``process`` debe poder importarse desde los
+    procesos hijo (función de módulo). Los elementos que llegan dentro de una
+    ventana corta se agrupan para amortizar el coste de cada envío al pool, y
+    hay como máximo un lote en vuelo por worker.
+    """
+
+    def __init__(
+        self,
+        fn: Callable[[list], list],
+        mode: str = PROCESSING_MODE,
+        workers: int = PROCESSING_WORKERS,
+        window_ms: float = PROCESSING_BATCH_WINDOW_MS,
+        max_batch_size: int = PROCESSING_BATCH_MAX_SIZE,
+    ):
+        if mode not in ("thread", "process"):
+            raise ValueError(f"Modo de procesamiento no soportado: {mode}")
+        self.fn = fn
+        self.mode = mode
+        self.workers = workers
+        self.window = window_ms / 1000
+        self.max_batch_size = max_batch_size
+        self.executor: Executor | None = None
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._worker: asyncio.Task | None = None
+        self._slots: asyncio.Semaphore | None = None
+        self._in_flight: set[asyncio.Task] = set()
+        self.batches = 0
+        self.items = 0
+
+    async def start(self):
+        if self._worker is not None:
+            return
+        if self.mode == "thread":
+            self.executor = ThreadPoolExecutor(self.workers, thread_name_prefix="processing")
+        else:
+            self.executor = ProcessPoolExecutor(self.workers)
+        self._slots = asyncio.Semaphore(self.workers)
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Termina los lotes pendientes y cierra el pool."""
+        if self._worker is None:
+            return
+        await self._queue.join()
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        if self._in_flight:
+            await asyncio.gather(*self._in_flight, return_exceptions=True)
+        self._worker = None
+        self.executor.shutdown(wait=True)
+        self.executor = None
+
+    async def submit(self, item) -> Any:
+        """Encola un elemento y espera el resultado de su lote."""
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((item, future))
+        return await future
+
+    async def map(self, items: list) -> list:
+        """Procesa una lista ya agrupada (p. ej. un bloque de la ingesta masiva) sin pasar por la cola."""
+        loop = asyncio.get_running_loop()
+        chunks = [items[i:i + self.max_batch_size] for i in range(0, len(items), self.max_batch_size)]
+        results = await asyncio.gather(*(loop.run_in_executor(self.executor, self.fn, chunk) for chunk in chunks))
+        self._record(len(chunks), len(items))
+        return [result for chunk in results for result in chunk]
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.window
+            while len(batch) < self.max_batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                    continue
+                except asyncio.QueueEmpty:
+                    pass
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            await self._slots.acquire()
+            task = asyncio.create_task(self._dispatch(batch))
+            self._in_flight.add(task)
+            task.add_done_callback(self._in_flight.discard)
+
+    async def _dispatch(self, batch: list):
+        try:
+            results = await asyncio.get_running_loop().run_in_executor(
+                self.executor, self.fn, [item for item, _ in batch]
+            )
+        except Exception as exc:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(exc)
+        else:
+            self._record(1, len(batch))
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+        finally:
+            self._slots.release()
+            for _ in batch:
+                self._queue.task_done()
+
+    def _record(self, batches: int, items: int):
+        self.batches += batches
+        self.items += items
+
+    def stats(self) -> dict:
+        return {
+            "mode": self.mode,
+            "workers": self.workers,
+            "queued": self._queue.qsize(),
+            "batches": self.batches,
+            "items": self.items,
+        }
+
+
+# Instancia activa (creada en el arranque si PROCESSING_MODE no es inline)
+pipeline: ProcessingPipeline | None = None
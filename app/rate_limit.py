@@ -0,0 +1,270 @@
+import ipaddress
+import math
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable
+
+from fastapi import Request
+from redis.exceptions import RedisError
+
+from . import metrics
+
+# Limitación de tasa: local (en memoria, por proceso) por defecto; redis la comparte entre réplicas
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() in ("1", "true", "yes")
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "local")
+# Límites por ruta: "POST /api/messages/bulk=2/60,GET /=100/60" (peticiones/segundos)
+RATE_LIMIT_ROUTES = os.getenv("RATE_LIMIT_ROUTES", "")
+RATE_LIMIT_SHARDS = int(os.getenv("RATE_LIMIT_SHARDS", "16"))
+# Claves con estado por shard; se expulsan las usadas hace más tiempo
+RATE_LIMIT_MAX_KEYS_PER_SHARD = int(os.getenv("RATE_LIMIT_MAX_KEYS_PER_SHARD", "10000"))
+# Fracción del límite que cada proceso reserva de Redis de una vez (1 = una petición por viaje)
+RATE_LIMIT_LEASE_FRACTION = float(os.getenv("RATE_LIMIT_LEASE_FRACTION", "0.1"))
+# Proxies (IPs o redes CIDR separadas por comas) cuya cabecera X-Forwarded-For se acepta;
+# vacío: se usa siempre la IP de la conexión
+TRUSTED_PROXIES = [
+    ipaddress.ip_network(proxy.strip(), strict=False)
+    for proxy in os.getenv("TRUSTED_PROXIES", "").split(",") if proxy.strip()
+]
+
+
+@dataclass(frozen=True)
+class Limit:
+    times: int
+    seconds: float
+
+    @classmethod
+    def parse(cls, value: str) -> "Limit":
+        times, seconds = value.split("/")
+        return cls(int(times), float(seconds))
+
+
+def parse_route_limits(value: str) -> dict[str, Limit]:
+    """Convierte "METHOD /ruta=veces/segundos,..." en un dict por "METHOD /ruta"."""
+    limits = {}
+    for rule in filter(None, (part.strip() for part in value.split(","))):
+        route, _, limit = rule.rpartition("=")
+        limits[route.strip()] = Limit.parse(limit)
+    return limits
+
+
+class RateLimitExceeded(Exception):
+    """Se ha superado el límite; ``retry_after`` indica los segundos hasta poder reintentar."""
+
+    def __init__(self, retry_after: float):
+        super().__init__("Demasiadas peticiones")
+        self.retry_after = retry_after
+
+
+class LocalRateLimitBackend:
+    """Token bucket en memoria repartido en shards.
+
+    Cada comprobación es síncrona (sin ``await``), así que en el event loop es
+    atómica sin necesidad de locks. Los shards acotan la memoria: cada uno es
+    un LRU con un máximo de claves, y una clave expulsada equivale a un bucket
+    lleno.
+    """
+
+    name = "local"
+
+    def __init__(self, shards: int = RATE_LIMIT_SHARDS, max_keys_per_shard: int = RATE_LIMIT_MAX_KEYS_PER_SHARD,
+                 clock: Callable[[], float] = time.monotonic):
+        self.max_keys_per_shard = max_keys_per_shard
+        self.clock = clock
+        # clave -> (tokens disponibles, instante de la última actualización)
+        self._shards: list[OrderedDict[str, tuple[float, float]]] = [OrderedDict() for _ in range(shards)]
+        self.allowed = 0
+        self.rejected = 0
+
+    def check(self, key: str, limit: Limit) -> float:
+        """Consume un token; devuelve 0 si se admite o los segundos de espera si no."""
+        shard = self._shards[hash(key) % len(self._shards)]
+        now = self.clock()
+        rate = limit.times / limit.seconds
+        entry = shard.get(key)
+        if entry is None:
+            tokens = float(limit.times)
+        else:
+            tokens = min(float(limit.times), entry[0] + (now - entry[1]) * rate)
+            shard.move_to_end(key)
+        if tokens >= 1:
+            shard[key] = (tokens - 1, now)
+            if len(shard) > self.max_keys_per_shard:
+                shard.popitem(last=False)
+            self.allowed += 1
+            return 0
+        shard[key] = (tokens, now)
+        self.rejected += 1
+        return (1 - tokens) / rate
+
+    async def hit(self, key: str, limit: Limit) -> float:
+        return self.check(key, limit)
+
+    def reset(self):
+        for shard in self._shards:
+            shard.clear()
+        self.allowed = 0
+        self.rejected = 0
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.name,
+            "keys": sum(len(shard) for shard in self._shards),
+            "allowed": self.allowed,
+            "rejected": self.rejected,
+        }
+
+
+class RedisRateLimitBackend:
+    """Ventana fija compartida en Redis con reservas locales (leases).
+
+    En lugar de un viaje a Redis por petición, cada proceso reserva de una vez
+    una fracción del límite de la ventana actual (INCRBY) y la consume en
+    memoria. Cuando Redis indica que la ventana está agotada, el proceso
+    rechaza localmente hasta que empiece la siguiente. Los tokens reservados
+    y no usados por un proceso no los aprovechan los demás: el límite global
+    nunca se supera, aunque puede quedarse algo por debajo. Si Redis falla se
+    aplica el backend local.
+    """
+
+    name = "redis"
+
+    def __init__(self, redis, lease_fraction: float = RATE_LIMIT_LEASE_FRACTION,
+                 prefix: str = "chat:ratelimit", clock: Callable[[], float] = time.time,
+                 fallback: LocalRateLimitBackend | None = None):
+        self.redis = redis
+        self.lease_fraction = lease_fraction
+        self.prefix = prefix
+        self.clock = clock
+        self.fallback = fallback or LocalRateLimitBackend()
+        # clave -> [ventana, tokens reservados restantes, ventana agotada en Redis]
+        self._leases: dict[str, list] = {}
+        self.round_trips = 0
+        self.allowed = 0
+        self.rejected = 0
+        self.errors = 0
+
+    async def hit(self, key: str, limit: Limit) -> float:
+        now = self.clock()
+        window = int(now // limit.seconds)
+        retry_after = (window + 1) * limit.seconds - now
+        lease = self._leases.get(key)
+        if lease is None or lease[0] != window:
+            if len(self._leases) >= RATE_LIMIT_MAX_KEYS_PER_SHARD:
+                # Se descartan las reservas de ventanas pasadas
+                for stale in [k for k, v in self._leases.items() if v[0] < window]:
+                    del self._leases[stale]
+            lease = self._leases[key] = [window, 0, False]
+        if lease[1] == 0 and not lease[2]:
+            try:
+                granted, exhausted = await self._reserve(key, window, limit)
+            except RedisError:
+                self.errors += 1
+                return self.fallback.check(key, limit)
+            # Otras peticiones pueden haber reservado a la vez: se suman las reservas
+            lease[1] += granted
+            lease[2] = lease[2] or exhausted
+        if lease[1] > 0:
+            lease[1] -= 1
+            self.allowed += 1
+            return 0
+        self.rejected += 1
+        return retry_after
+
+    async def _reserve(self, key: str, window: int, limit: Limit) -> tuple[int, bool]:
+        """Reserva tokens de la ventana en Redis; devuelve (concedidos, ventana agotada)."""
+        size = max(1, int(limit.times * self.lease_fraction))
+        redis_key = f"{self.prefix}:{key}:{window}"
+        self.round_trips += 1
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.set(redis_key, 0, ex=math.ceil(limit.seconds) + 1, nx=True)
+            pipe.incrby(redis_key, size)
+            _, used = await pipe.execute()
+        used = int(used)
+        granted = max(0, min(size, limit.times - (used - size)))
+        return granted, used >= limit.times
+
+    def reset(self):
+        self._leases.clear()
+        self.fallback.reset()
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.name,
+            "leases": len(self._leases),
+            "round_trips": self.round_trips,
+            "allowed": self.allowed,
+            "rejected": self.rejected,
+            "errors": self.errors,
+        }
+
+
+def _is_trusted(address: str, proxies) -> bool:
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in network for network in proxies)
+
+
+def client_ip(request: Request, trusted_proxies=None) -> str:
+    """IP del cliente: la de la conexión o, si viene de un proxy de confianza, la de X-Forwarded-For.
+
+    La cabecera se recorre desde la derecha (lo que añadió el último proxy)
+    y se toma la primera dirección que no es de un proxy de confianza: lo que
+    el cliente escriba a la izquierda no se tiene en cuenta.
+    """
+    proxies = TRUSTED_PROXIES if trusted_proxies is None else trusted_proxies
+    ip = request.client.host if request.client else ""
+    forwarded = request.headers.get("X-Forwarded-For")
+    if not forwarded or not _is_trusted(ip, proxies):
+        return ip
+    for hop in reversed([hop.strip() for hop in forwarded.split(",") if hop.strip()]):
+        ip = hop
+        if not _is_trusted(hop, proxies):
+            break
+    return ip
+
+
+def client_identity(request: Request) -> str:
+    """Identidad a la que se aplica el límite: la clave de API ya autenticada o la IP del cliente.
+
+    Una cabecera X-API-Key sin validar no cuenta: si no, rotarla bastaría para esquivar el límite.
+    """
+    api_key = getattr(request.state, "api_key", None)
+    if api_key is not None:
+        return "key:" + api_key.key_hash[:16]
+    return "ip:" + client_ip(request)
+
+
+class RateLimiter:
+    """Dependencia de FastAPI que limita las peticiones por identidad y ruta.
+
+    El límite aplicado es, por orden: ``request.state.rate_limit`` (si otra
+    dependencia lo fija para la clave de API), el de RATE_LIMIT_ROUTES para
+    la ruta y el límite por defecto de la dependencia.
+    """
+
+    def __init__(self, times: int, seconds: float, backend=None,
+                 route_limits: dict[str, Limit] | None = None):
+        self.default = Limit(times, seconds)
+        self.backend = backend or LocalRateLimitBackend()
+        self.route_limits = parse_route_limits(RATE_LIMIT_ROUTES) if route_limits is None else route_limits
+
+    async def __call__(self, request: Request):
+        if not RATE_LIMIT_ENABLED:
+            return
+        with metrics.span("rate_limit"):
+            route = request.scope.get("route")
+            route_key = f"{request.method} {route.path if route is not None else request.url.path}"
+            limit = getattr(request.state, "rate_limit", None) or self.route_limits.get(route_key, self.default)
+            retry_after = await self.backend.hit(f"{client_identity(request)}:{route_key}", limit)
+        if retry_after:
+            raise RateLimitExceeded(retry_after)
+
+    def reset(self):
+        self.backend.reset()
+
+    def stats(self) -> dict:
+        return {"enabled": RATE_LIMIT_ENABLED, **self.backend.stats()}
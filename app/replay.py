@@ -0,0 +1,112 @@
+import os
+from collections import OrderedDict, deque
+from datetime import datetime
+from typing import NamedTuple
+
+# Mensajes recientes que se conservan por sesión para reenviar a clientes que se reconectan
+WS_REPLAY_BUFFER_SIZE = int(os.getenv("WS_REPLAY_BUFFER_SIZE", "200"))
+# Sesiones con buffer en memoria; se descartan las usadas hace más tiempo
+WS_REPLAY_MAX_SESSIONS = int(os.getenv("WS_REPLAY_MAX_SESSIONS", "1000"))
+
+
+class ReplayEntry(NamedTuple):
+    message_id: str
+    sender: str
+    timestamp: datetime
+    message: str
+
+
+def parse_timestamp(value: str) -> datetime:
+    """Timestamp ISO 8601 como se guarda en la BD: se descarta la zona horaria sin convertir la hora."""
+    return datetime.fromisoformat(value).replace(tzinfo=None)
+
+
+class _SessionReplay:
+    """Buffer de una sesión y el instante hasta el que puede faltar algún mensaje.
+
+    Los mensajes pueden llegar con un timestamp anterior a otros ya recibidos,
+    así que el buffer solo está completo para los timestamps posteriores a
+    ``floor``: el del primer mensaje recibido y el mayor de los expulsados.
+    """
+
+    __slots__ = ("entries", "floor")
+
+    def __init__(self, size: int, first: datetime):
+        self.entries: deque[ReplayEntry] = deque(maxlen=size)
+        self.floor = first
+
+
+def _ordered(entries) -> list[ReplayEntry]:
+    # Mismo orden que el historial de la BD: por timestamp y, a igualdad, por orden de llegada (como el id)
+    return sorted(entries, key=lambda entry: entry.timestamp)
+
+
+class ReplayBuffer:
+    """Buffer circular por sesión con los últimos mensajes difundidos por este proceso.
+
+    Guarda el JSON ya serializado para reenviarlo tal cual. Las consultas
+    devuelven ``None`` cuando el buffer no cubre el punto pedido y hay que
+    recurrir a la base de datos; si lo cubren, devuelven los mismos mensajes
+    y en el mismo orden (timestamp, id) que la BD.
+    """
+
+    def __init__(self, size: int = WS_REPLAY_BUFFER_SIZE, max_sessions: int = WS_REPLAY_MAX_SESSIONS):
+        self.size = size
+        self.max_sessions = max_sessions
+        self._sessions: OrderedDict[str, _SessionReplay] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def record(self, session_id: str, entry: ReplayEntry):
+        if self.size <= 0:
+            return
+        session = self._sessions.get(session_id)
+        if session is None:
+            session = self._sessions[session_id] = _SessionReplay(self.size, entry.timestamp)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        else:
+            self._sessions.move_to_end(session_id)
+        if len(session.entries) == self.size:
+            session.floor = max(session.floor, session.entries[0].timestamp)
+        session.entries.append(entry)
+
+    def discard(self, session_id: str):
+        """Olvida el buffer de la sesión (p. ej. tras una ingesta masiva que no pasa por él)."""
+        self._sessions.pop(session_id, None)
+
+    def after_message(self, session_id: str, message_id: str) -> list[ReplayEntry] | None:
+        """Mensajes posteriores a ``message_id`` en orden (timestamp, id), o None si el buffer no los cubre."""
+        session = self._sessions.get(session_id)
+        entries = session.entries if session is not None else ()
+        for position in range(len(entries) - 1, -1, -1):
+            last = entries[position]
+            if last.message_id == message_id:
+                if session.floor > last.timestamp:
+                    break
+                self.hits += 1
+                return _ordered(
+                    entry for index, entry in enumerate(entries)
+                    if entry.timestamp > last.timestamp or (entry.timestamp == last.timestamp and index > position)
+                )
+        self.misses += 1
+        return None
+
+    def after_timestamp(self, session_id: str, since: datetime) -> list[ReplayEntry] | None:
+        """Mensajes con timestamp posterior a ``since``, o None si alguno puede faltar en el buffer."""
+        session = self._sessions.get(session_id)
+        if session is None or session.floor > since:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return _ordered(entry for entry in session.entries if entry.timestamp > since)
+
+    def clear(self):
+        self._sessions.clear()
+
+    def stats(self) -> dict:
+        return {
+            "sessions": len(self._sessions),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
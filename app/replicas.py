@@ -0,0 +1,198 @@
+import asyncio
+import itertools
+import math
+import os
+import time
+from typing import Callable
+
+from fastapi import Request
+from redis.exceptions import RedisError
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from starlette.concurrency import run_in_threadpool
+
+from .cache import LRUTTLCache
+from .database import DB_ASYNC, engine_options, register_sqlite_pragmas, to_async_url
+from .rate_limit import client_identity
+
+# Réplicas de lectura para el historial y la búsqueda: URLs separadas por comas (vacío = solo el primario)
+READ_REPLICA_URLS = [url.strip() for url in os.getenv("READ_REPLICA_URLS", "").split(",") if url.strip()]
+READ_REPLICA_HEALTH_INTERVAL_SECONDS = float(os.getenv("READ_REPLICA_HEALTH_INTERVAL_SECONDS", "5"))
+# Tras un POST, las lecturas del mismo cliente van al primario durante esta ventana (lee tus escrituras)
+READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", "5"))
+READ_YOUR_WRITES_MAX_CLIENTS = int(os.getenv("READ_YOUR_WRITES_MAX_CLIENTS", "100000"))
+# Guarda la ventana en Redis para que valga en todas las réplicas de la app; sin Redis solo vale
+# en el proceso que recibió el POST
+READ_YOUR_WRITES_REDIS_ENABLED = os.getenv("READ_YOUR_WRITES_REDIS_ENABLED", "false").lower() in ("1", "true", "yes")
+
+
+def _sqlite_query_only(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA query_only=ON")
+    cursor.close()
+
+
+class Replica:
+    """Engine de solo lectura de una réplica y su estado de salud."""
+
+    def __init__(self, url: str, is_async: bool = DB_ASYNC):
+        self.url = url
+        if is_async:
+            self.engine = create_async_engine(to_async_url(url), **engine_options(url, is_async=True))
+            self.session_factory = async_sessionmaker(bind=self.engine, autoflush=False, expire_on_commit=False)
+        else:
+            self.engine = create_engine(url, **engine_options(url))
+            self.session_factory = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
+        register_sqlite_pragmas(self.engine)
+        sync_engine = getattr(self.engine, "sync_engine", self.engine)
+        # Cualquier escritura por error sobre la réplica falla en lugar de divergir del primario
+        if sync_engine.dialect.name == "sqlite":
+            event.listen(sync_engine, "connect", _sqlite_query_only)
+        elif sync_engine.dialect.name == "postgresql":
+            self.engine = self.engine.execution_options(postgresql_readonly=True)
+            self.session_factory.configure(bind=self.engine)
+        self.healthy = True
+        self.reads = 0
+        self.failures = 0
+
+    async def check(self) -> bool:
+        try:
+            if isinstance(self.engine, AsyncEngine):
+                async with self.engine.connect() as connection:
+                    await connection.execute(text("SELECT 1"))
+            else:
+                await run_in_threadpool(self._check_sync)
+        except Exception:
+            self.failures += 1
+            self.healthy = False
+        else:
+            self.healthy = True
+        return self.healthy
+
+    def _check_sync(self):
+        with self.engine.connect() as connection:
+            connection.execute(text("SELECT 1"))
+
+    async def dispose(self):
+        result = self.engine.dispose()
+        if asyncio.iscoroutine(result):
+            await result
+
+    def stats(self) -> dict:
+        # La URL puede llevar credenciales: solo se muestra el backend y la base de datos
+        url = self.engine.url
+        return {
+            "database": f"{url.get_backend_name()}:{url.database}",
+            "healthy": self.healthy,
+            "reads": self.reads,
+            "failures": self.failures,
+        }
+
+
+class ReplicaSet:
+    """Reparte las lecturas entre las réplicas sanas por turnos (round-robin).
+
+    Una tarea en segundo plano comprueba cada réplica con ``SELECT 1``; las
+    que fallan dejan de recibir lecturas hasta que vuelven a responder. Si no
+    queda ninguna sana, o el cliente ha escrito hace menos de
+    ``read_your_writes`` segundos, se usa el primario (``None``).
+
+    Los escritores recientes se recuerdan en memoria y, si hay ``redis``, en
+    una clave con caducidad que comparten todos los procesos de la app; si
+    Redis no responde, la lectura va al primario.
+    """
+
+    def __init__(self, replicas: list[Replica], health_interval: float = READ_REPLICA_HEALTH_INTERVAL_SECONDS,
+                 read_your_writes: float = READ_YOUR_WRITES_SECONDS, clock: Callable[[], float] = time.monotonic):
+        self.replicas = replicas
+        self.health_interval = health_interval
+        self._turn = itertools.count()
+        # Identidad del cliente -> instante de su último POST (caduca con la ventana)
+        self.recent_writers = LRUTTLCache(READ_YOUR_WRITES_MAX_CLIENTS, ttl=read_your_writes, clock=clock)
+        self.read_your_writes = read_your_writes
+        self.redis = None
+        self.redis_errors = 0
+        self._health_task: asyncio.Task | None = None
+        self.primary_reads = 0
+
+    @classmethod
+    def from_urls(cls, urls: list[str], **kwargs) -> "ReplicaSet":
+        return cls([Replica(url) for url in urls], **kwargs)
+
+    def _redis_key(self, identity: str) -> str:
+        return f"chat:recent-writer:{identity}"
+
+    async def record_write(self, request: Request):
+        identity = client_identity(request)
+        self.recent_writers.set(identity, True)
+        if self.redis is not None:
+            try:
+                await self.redis.set(self._redis_key(identity), "1", ex=max(1, math.ceil(self.read_your_writes)))
+            except RedisError:
+                self.redis_errors += 1
+
+    async def wrote_recently(self, request: Request) -> bool:
+        identity = client_identity(request)
+        if self.recent_writers.get(identity) is not None:
+            return True
+        if self.redis is None:
+            return False
+        try:
+            return await self.redis.get(self._redis_key(identity)) is not None
+        except RedisError:
+            # Sin saber si escribió en otra réplica, se lee del primario
+            self.redis_errors += 1
+            return True
+
+    async def choose(self, request: Request) -> Replica | None:
+        """Réplica para la lectura de esta petición, o None para leer del primario.
+
+        Deja en ``request.state.recent_writer`` si el cliente ha escrito dentro de la ventana.
+        """
+        request.state.recent_writer = await self.wrote_recently(request)
+        if not request.state.recent_writer:
+            healthy = [replica for replica in self.replicas if replica.healthy]
+            if healthy:
+                replica = healthy[next(self._turn) % len(healthy)]
+                replica.reads += 1
+                return replica
+        self.primary_reads += 1
+        return None
+
+    async def check(self):
+        await asyncio.gather(*(replica.check() for replica in self.replicas))
+
+    async def start(self):
+        if self._health_task is None:
+            await self.check()
+            self._health_task = asyncio.create_task(self._run_health_checks())
+
+    async def stop(self):
+        if self._health_task is not None:
+            self._health_task.cancel()
+            try:
+                await self._health_task
+            except asyncio.CancelledError:
+                pass
+            self._health_task = None
+        for replica in self.replicas:
+            await replica.dispose()
+
+    async def _run_health_checks(self):
+        while True:
+            await asyncio.sleep(self.health_interval)
+            await self.check()
+
+    def stats(self) -> dict:
+        return {
+            "primary_reads": self.primary_reads,
+            "recent_writers": len(self.recent_writers),
+            "redis_enabled": self.redis is not None,
+            "redis_errors": self.redis_errors,
+            "replicas": [replica.stats() for replica in self.replicas],
+        }
+
+
+# Instancia activa: solo existe si READ_REPLICA_URLS tiene alguna URL
+replica_set: ReplicaSet | None = ReplicaSet.from_urls(READ_REPLICA_URLS) if READ_REPLICA_URLS else None
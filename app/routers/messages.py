@@ -1,12 +1,16 @@
-from fastapi import APIRouter, Depends, status, Query
+from fastapi import APIRouter, Depends, status, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from .. import schemas, services
-from ..dependencies import get_db, get_api_key, rate_limit_dependency  # Add rate_limit_dependency import
-from app.routers.websocket import manager # Import the WebSocket manager
+from .. import schemas, services, ingest, serialization, broadcast, metrics, replicas, idempotency
+from . import websocket
+from ..dependencies import get_session, get_read_session, get_session_factory, get_api_key, rate_limit_dependency  # Add rate_limit_dependency import
 
 router = APIRouter(
     prefix="/api/messages",
     tags=["messages"],
+    # Mide la lectura y validación de cada petición como etapa propia
+    route_class=metrics.TimedRoute,
     dependencies=[Depends(get_api_key)],
     responses={
         401: {"description": "Clave de API inválida o faltante"},
@@ -18,91 +22,151 @@ router = APIRouter(
     "/", 
     response_model=schemas.MessageResponse, 
     status_code=status.HTTP_201_CREATED,
-    dependencies=[Depends(rate_limit_dependency)]  # This is already present and correct
+    dependencies=[Depends(rate_limit_dependency)],  # This is already present and correct
+    responses={200: {"model": schemas.MessageResponse, "description": "Reintento: el message_id ya estaba guardado"}},
 )
 async def create_message_endpoint(
-    message: schemas.MessageCreate, db: Session = Depends(get_db)
+    request: Request, message: schemas.MessageCreate, db: Session | AsyncSession = Depends(get_session)
 ):
-    """Recibe, procesa y almacena un nuevo mensaje."""
-    db_message = services.process_and_create_message(db=db, message=message)
+    """Recibe, procesa y almacena un nuevo mensaje.
 
-    # Construye el objeto de respuesta con la estructura anidada correcta
-    response_data = schemas.Message(
-        message_id=db_message.message_id,
-        session_id=db_message.session_id,
-        content=db_message.content,
-        timestamp=db_message.timestamp,
-        sender=db_message.sender,
-        metadata=schemas.MessageMetadata(
-            word_count=db_message.word_count,
-            character_count=db_message.character_count,
-            processed_at=db_message.processed_at,
-        ),
-    )
+    Un reintento con un message_id ya guardado devuelve el mensaje almacenado
+    con 200 y la cabecera ``Idempotent-Replay: true``, sin volver a difundirlo.
+    """
+    tenant = request.state.api_key.tenant
+    try:
+        db_message = await services.process_and_create_message(db=db, message=message, tenant=tenant)
+    except idempotency.DuplicateMessage as exc:
+        return Response(
+            content=serialization.dumps_message_response(exc.message_json),
+            status_code=status.HTTP_200_OK,
+            headers={idempotency.REPLAY_HEADER: "true"},
+            media_type="application/json",
+        )
+    # Las lecturas de este cliente irán al primario hasta que las réplicas tengan el mensaje
+    if replicas.replica_set is not None:
+        await replicas.replica_set.record_write(request)
+
+    # El mensaje se serializa una sola vez para la respuesta y para los WebSockets
+    with metrics.span("serialization"):
+        message_json = serialization.dumps_message(db_message)
+        content = serialization.dumps_message_response(message_json)
+    if idempotency.IDEMPOTENCY_ENABLED:
+        await idempotency.recent_messages.remember(tenant, message.message_id, message_json)
     
-    # Transmitir el nuevo mensaje a todos los clientes WebSocket conectados
-    await manager.broadcast(response_data.model_dump_json())
+    # Transmitir el nuevo mensaje a todos los clientes WebSocket conectados:
+    # se publica una sola vez; cada réplica lo reparte entre sus clientes WebSocket
+    with metrics.span("broadcast"):
+        await broadcast.broadcaster.publish(message_json.decode())
 
-    return schemas.MessageResponse(data=response_data)
+    return Response(
+        content=content,
+        status_code=status.HTTP_201_CREATED,
+        media_type="application/json",
+    )
 
-@router.get("/search", response_model=schemas.MessagesResponse)
-def search_messages_endpoint(
-    query: str = Query(..., min_length=1, description="Texto a buscar en el contenido de los mensajes"),
-    skip: int = 0,
-    limit: int = 100,
-    db: Session = Depends(get_db),
+@router.post(
+    "/bulk",
+    response_model=schemas.BulkIngestResponse,
+    dependencies=[Depends(rate_limit_dependency)],
+    responses={400: {"model": schemas.BulkIngestErrorResponse, "description": "Cuerpo mal formado; data tiene el resultado parcial"}},
+)
+async def bulk_create_messages_endpoint(
+    request: Request,
+    report: str = Query("all", pattern="^(all|errors)$", description="Devolver todos los elementos o solo los no creados"),
+    db: Session | AsyncSession = Depends(get_session),
 ):
-    """Busca mensajes por contenido, con paginación."""
-    db_messages = services.search_messages(
-        db=db, query_text=query, skip=skip, limit=limit
-    )
+    """Ingesta masiva de mensajes desde un array JSON o un flujo NDJSON.
+
+    El cuerpo se procesa a medida que llega y se guarda en bloques; los mensajes
+    ingeridos por esta vía no se transmiten por WebSocket. Si el cuerpo está mal
+    formado se responde 400 con el resultado de los elementos ya guardados.
+    """
+    content_type = request.headers.get("content-type", "")
+    if "ndjson" in content_type or "jsonl" in content_type:
+        raw_items = ingest.iter_ndjson(request.stream())
+    else:
+        raw_items = ingest.iter_json_array(request.stream())
 
-    response_data = [
-        schemas.Message(
-            message_id=msg.message_id,
-            session_id=msg.session_id,
-            content=msg.content,
-            timestamp=msg.timestamp,
-            sender=msg.sender,
-            metadata=schemas.MessageMetadata(
-                word_count=msg.word_count,
-                character_count=msg.character_count,
-                processed_at=msg.processed_at,
-            ),
+    async def reset_replay(session_ids: set[str]):
+        # Estos mensajes no pasan por el buffer de reenvío WebSocket: los backfills de sus sesiones van a la BD
+        for session_id in session_ids:
+            await broadcast.broadcaster.publish(websocket.replay_reset_frame(session_id))
+
+    try:
+        result = await services.ingest_messages(
+            db=db, raw_items=raw_items, report_all=report == "all", on_stored=reset_replay,
         )
-        for msg in db_messages
-    ]
+    finally:
+        # También con un cuerpo mal formado: los bloques anteriores al error ya están guardados
+        if replicas.replica_set is not None:
+            await replicas.replica_set.record_write(request)
+    return schemas.BulkIngestResponse(data=result)
 
-    return schemas.MessagesResponse(data=response_data)
+@router.get("/search", response_model=schemas.MessagesResponse)
+async def search_messages_endpoint(
+    query: str = Query(..., min_length=1, description="Texto a buscar: palabras, \"frases exactas\" o prefijos (hola*)"),
+    session_id: str | None = Query(None, description="Limitar la búsqueda a una sesión"),
+    cursor: str | None = Query(None, description="Cursor devuelto en next_cursor de la página anterior"),
+    skip: int = Query(0, deprecated=True, description="Obsoleto: usar cursor"),
+    limit: int = 100,
+    db: Session | AsyncSession = Depends(get_read_session),
+):
+    """Busca mensajes por contenido, ordenados por relevancia y con paginación por cursor."""
+    content = await services.search_messages(
+        db=db, query_text=query, session_id=session_id, skip=skip, limit=limit, cursor=cursor
+    )
+    return Response(content=content, media_type="application/json")
 
 @router.get("/{session_id}", response_model=schemas.MessagesResponse)
-def read_messages_endpoint(
+async def read_messages_endpoint(
+    request: Request,
     session_id: str,
     sender: str | None = None,
-    skip: int = 0,
+    cursor: str | None = Query(None, description="Cursor devuelto en next_cursor de la página anterior"),
+    skip: int = Query(0, deprecated=True, description="Obsoleto: usar cursor"),
     limit: int = 100,
-    db: Session = Depends(get_db),
+    db: Session | AsyncSession = Depends(get_read_session),
 ):
-    """Recupera mensajes para una sesión, con paginación y filtro."""
-    db_messages = services.get_messages(
-        db=db, session_id=session_id, sender=sender, skip=skip, limit=limit
+    """Recupera mensajes para una sesión en orden cronológico, con paginación por cursor y filtro."""
+    # Quien acaba de escribir no lee de la caché, y solo se cachean las páginas leídas del primario:
+    # una réplica atrasada daría una página sin la última escritura bajo la generación posterior a ella
+    use_cache = not getattr(request.state, "recent_writer", False)
+    content = await services.get_messages(
+        db=db, session_id=session_id, sender=sender, skip=skip, limit=limit, cursor=cursor, use_cache=use_cache,
+        store_in_cache=getattr(request.state, "read_replica", None) is None,
+    )
+    # Se devuelve el JSON ya generado: FastAPI no vuelve a validar ni serializar la respuesta
+    return Response(content=content, media_type="application/json")
+
+@router.get("/{session_id}/stats", response_model=schemas.SessionStatsResponse)
+async def session_stats_endpoint(session_id: str, db: Session | AsyncSession = Depends(get_session)):
+    """Totales de la sesión (mensajes, palabras, caracteres, por remitente) sin recorrer sus mensajes."""
+    stats = await services.get_session_stats(db=db, session_id=session_id)
+    return schemas.SessionStatsResponse(data=stats)
+
+# Tipo de contenido y extensión de cada formato de exportación
+EXPORT_FORMATS = {"ndjson": ("application/x-ndjson", "ndjson"), "csv": ("text/csv; charset=utf-8", "csv")}
+
+@router.get("/{session_id}/export")
+async def export_messages_endpoint(
+    request: Request,
+    session_id: str,
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$", description="Formato de la exportación"),
+    sender: str | None = None,
+    session_factory=Depends(get_session_factory),
+):
+    """Exporta todo el historial de la sesión en streaming, comprimido con gzip si el cliente lo acepta."""
+    media_type, extension = EXPORT_FORMATS[format]
+    compress = "gzip" in request.headers.get("accept-encoding", "")
+    headers = {
+        "Content-Disposition": f'attachment; filename="{session_id.replace(chr(34), "")}.{extension}"',
+        "Vary": "Accept-Encoding",
+    }
+    if compress:
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(
+        services.export_messages(session_factory, session_id, sender, format, compress),
+        media_type=media_type,
+        headers=headers,
     )
-    
-    # Mapear cada objeto de la BD a un esquema de respuesta
-    response_data = [
-        schemas.Message(
-            message_id=msg.message_id,
-            session_id=msg.session_id,
-            content=msg.content,
-            timestamp=msg.timestamp,
-            sender=msg.sender,
-            metadata=schemas.MessageMetadata(
-                word_count=msg.word_count,
-                character_count=msg.character_count,
-                processed_at=msg.processed_at,
-            ),
-        )
-        for msg in db_messages
-    ]
-    
-    return schemas.MessagesResponse(data=response_data)
\ No newline at end of file
@@ -0,0 +1,86 @@
+import asyncio
+
+from fastapi import APIRouter, Depends, Request, status
+from fastapi.responses import JSONResponse, PlainTextResponse
+from redis.exceptions import RedisError
+
+from .. import cache, broadcast, database, metrics, replicas, idempotency, api_keys
+from . import websocket
+from ..dependencies import get_api_key, rate_limit_dependency
+
+router = APIRouter(tags=["monitoring"])
+
+# Tiempo máximo de la comprobación de Redis en /health/ready
+REDIS_HEALTH_TIMEOUT_SECONDS = 1.0
+
+@router.get("/health/live")
+async def liveness_endpoint():
+    """El proceso responde (sondeo de vida; no comprueba dependencias)."""
+    return {"status": "alive"}
+
+@router.get("/health/ready")
+async def readiness_endpoint(request: Request):
+    """Arranque completado y base de datos accesible (sondeo de disponibilidad).
+
+    Sin Redis la réplica sigue atendiendo con las alternativas locales: se
+    indica ``degraded`` pero responde 200.
+    """
+    checks = {"startup": "ok" if request.app.state.ready else "pending"}
+    try:
+        await database.ping()
+        checks["database"] = "ok"
+    except Exception:
+        checks["database"] = "unavailable"
+    redis = request.app.state.redis
+    if redis is None:
+        checks["redis"] = "disabled"
+    else:
+        try:
+            await asyncio.wait_for(redis.ping(), REDIS_HEALTH_TIMEOUT_SECONDS)
+            checks["redis"] = "ok"
+        except (RedisError, OSError, asyncio.TimeoutError):
+            checks["redis"] = "unavailable"
+    if checks["startup"] != "ok" or checks["database"] != "ok":
+        return JSONResponse(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, content={"status": "unavailable", "checks": checks})
+    return {"status": "degraded" if checks["redis"] == "unavailable" else "ready", "checks": checks}
+
+@router.get("/cache/stats", dependencies=[Depends(get_api_key)])
+async def cache_stats_endpoint():
+    """Contadores de aciertos, fallos y expulsiones de la caché del historial."""
+    return {"status": "success", "data": cache.history_cache.stats()}
+
+@router.get("/idempotency/stats", dependencies=[Depends(get_api_key)])
+async def idempotency_stats_endpoint():
+    """Mensajes recientes recordados y reintentos respondidos sin tocar la BD."""
+    return {"status": "success", "data": idempotency.recent_messages.stats()}
+
+@router.get("/broadcast/stats", dependencies=[Depends(get_api_key)])
+async def broadcast_stats_endpoint():
+    """Estado del backend de difusión y de las conexiones WebSocket de esta réplica."""
+    return {
+        "status": "success",
+        "data": {**broadcast.broadcaster.stats(), "websocket": websocket.manager.stats()},
+    }
+
+@router.get("/rate-limit/stats", dependencies=[Depends(get_api_key)])
+async def rate_limit_stats_endpoint():
+    """Peticiones admitidas y rechazadas por el limitador de tasa de esta réplica."""
+    return {"status": "success", "data": rate_limit_dependency.stats()}
+
+@router.get("/api-keys/stats", dependencies=[Depends(get_api_key)])
+async def api_key_stats_endpoint():
+    """Claves cargadas, antigüedad de la copia en memoria y peticiones rechazadas."""
+    return {"status": "success", "data": api_keys.key_cache.stats()}
+
+@router.get("/db/pool/stats", dependencies=[Depends(get_api_key)])
+async def db_pool_stats_endpoint():
+    """Checkouts, esperas y timeouts de los pools de conexiones y estado de las réplicas de lectura."""
+    data = {name: pool.stats() for name, pool in database.pool_metrics.items()}
+    if replicas.replica_set is not None:
+        data["replicas"] = replicas.replica_set.stats()
+    return {"status": "success", "data": data}
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint():
+    """Métricas en formato de texto de Prometheus (sin clave de API, para el scraper)."""
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
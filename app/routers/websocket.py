@@ -1,36 +1,325 @@
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+import asyncio
+import json
+import os
+from fastapi import APIRouter, Depends, WebSocket, WebSocketDisconnect
+
+from .. import services
+from ..database import open_session
+from ..dependencies import get_session_factory
+from ..replay import ReplayBuffer, ReplayEntry, parse_timestamp
 
 router = APIRouter(prefix="/ws")
 
+# Mensajes pendientes por conexión antes de aplicar la política de consumidor lento
+WS_SEND_QUEUE_SIZE = int(os.getenv("WS_SEND_QUEUE_SIZE", "256"))
+# drop_oldest: descarta el mensaje más antiguo; drop_new: descarta el nuevo; disconnect: cierra la conexión
+WS_SLOW_CONSUMER_POLICY = os.getenv("WS_SLOW_CONSUMER_POLICY", "drop_oldest")
+# Un envío que tarda más que esto se considera una conexión muerta
+WS_SEND_TIMEOUT_SECONDS = float(os.getenv("WS_SEND_TIMEOUT_SECONDS", "10"))
+
+# Máximo de sesiones a las que puede suscribirse una conexión
+WS_MAX_SUBSCRIPTIONS = int(os.getenv("WS_MAX_SUBSCRIPTIONS", "100"))
+
+# Máximo de mensajes en un backfill; si hay más se devuelve el cursor del historial HTTP
+WS_BACKFILL_MAX_MESSAGES = int(os.getenv("WS_BACKFILL_MAX_MESSAGES", "500"))
+
+# Aviso difundido a todos los procesos (no a los clientes) para que olviden el buffer de una sesión
+REPLAY_RESET_PREFIX = '{"type": "replay_reset"'
+
+def replay_reset_frame(session_id: str) -> str:
+    return json.dumps({"type": "replay_reset", "session_id": session_id})
+
+# Código de cierre WebSocket "Try Again Later" para consumidores lentos
+SLOW_CONSUMER_CLOSE_CODE = 1013
+# Código de cierre "Internal Error" cuando un envío falla
+SEND_FAILED_CLOSE_CODE = 1011
+
+class ClientConnection:
+    """Conexión de un cliente con su cola de envío y su tarea escritora."""
+
+    def __init__(self, websocket: WebSocket, manager: "ConnectionManager"):
+        self.websocket = websocket
+        self.manager = manager
+        self.queue: asyncio.Queue[str] = asyncio.Queue(maxsize=manager.queue_size)
+        self.writer: asyncio.Task | None = None
+        # session_id -> remitentes aceptados (None = todos); vacío = recibe todos los mensajes
+        self.subscriptions: dict[str, set[str] | None] = {}
+
+    def start(self):
+        self.writer = asyncio.create_task(self._write_loop())
+
+    def stop(self):
+        if self.writer is not None and self.writer is not asyncio.current_task():
+            self.writer.cancel()
+
+    def enqueue(self, message: str) -> bool:
+        """Encola sin bloquear; devuelve False si el cliente debe desconectarse."""
+        try:
+            self.queue.put_nowait(message)
+            return True
+        except asyncio.QueueFull:
+            pass
+        self.manager.dropped += 1
+        if self.manager.policy == "disconnect":
+            return False
+        if self.manager.policy == "drop_oldest":
+            self.queue.get_nowait()
+            self.queue.put_nowait(message)
+        return True
+
+    async def _write_loop(self):
+        while True:
+            message = await self.queue.get()
+            try:
+                await asyncio.wait_for(self.websocket.send_text(message), self.manager.send_timeout)
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                # Socket muerto o bloqueado: se retira y se cierra sin afectar al resto de clientes
+                self.manager.disconnect(self.websocket)
+                timed_out = isinstance(exc, asyncio.TimeoutError)
+                await self.close(SLOW_CONSUMER_CLOSE_CODE if timed_out else SEND_FAILED_CLOSE_CODE)
+                return
+            self.manager.delivered += 1
+
+    async def close(self, code: int):
+        try:
+            await self.websocket.close(code=code)
+        except Exception:
+            pass
+
 class ConnectionManager:
-    def __init__(self):
-        self.active_connections: list[WebSocket] = []
+    def __init__(self, queue_size: int = WS_SEND_QUEUE_SIZE, policy: str = WS_SLOW_CONSUMER_POLICY,
+                 send_timeout: float = WS_SEND_TIMEOUT_SECONDS, replay: ReplayBuffer | None = None,
+                 backfill_limit: int = WS_BACKFILL_MAX_MESSAGES):
+        self.queue_size = queue_size
+        self.policy = policy
+        self.send_timeout = send_timeout
+        self.active_connections: dict[WebSocket, ClientConnection] = {}
+        # Índice session_id -> conexiones suscritas; las conexiones sin suscripciones
+        # (clientes antiguos) reciben todos los mensajes
+        self._by_session: dict[str, set[ClientConnection]] = {}
+        self._firehose: set[ClientConnection] = set()
+        # Últimos mensajes de cada sesión para reenviarlos a los clientes que se reconectan
+        self.replay = replay if replay is not None else ReplayBuffer()
+        self.backfill_limit = backfill_limit
+        self.backfills_from_buffer = 0
+        self.backfills_from_database = 0
+        self.backfill_errors = 0
+        self.delivered = 0
+        self.dropped = 0
+        self.disconnected_slow = 0
+        # Referencias a las tareas de cierre para que no se recojan antes de terminar
+        self._closing: set[asyncio.Task] = set()
 
     async def connect(self, websocket: WebSocket):
         await websocket.accept()
-        self.active_connections.append(websocket)
+        self.register(websocket)
+
+    def register(self, websocket: WebSocket) -> ClientConnection:
+        """Da de alta una conexión ya aceptada y arranca su tarea escritora."""
+        connection = ClientConnection(websocket, self)
+        self.active_connections[websocket] = connection
+        self._firehose.add(connection)
+        connection.start()
+        return connection
 
     def disconnect(self, websocket: WebSocket):
-        self.active_connections.remove(websocket)
+        connection = self.active_connections.pop(websocket, None)
+        if connection is not None:
+            self._firehose.discard(connection)
+            for session_id in connection.subscriptions:
+                self._unindex(session_id, connection)
+            connection.stop()
+
+    def subscribe(self, websocket: WebSocket, session_id: str, sender: str | None = None):
+        """Suscribe la conexión a una sesión, opcionalmente solo a un remitente."""
+        connection = self.active_connections[websocket]
+        if session_id not in connection.subscriptions:
+            if len(connection.subscriptions) >= WS_MAX_SUBSCRIPTIONS:
+                raise ValueError(f"Máximo de {WS_MAX_SUBSCRIPTIONS} suscripciones por conexión")
+            connection.subscriptions[session_id] = set() if sender else None
+            self._by_session.setdefault(session_id, set()).add(connection)
+            self._firehose.discard(connection)
+        senders = connection.subscriptions[session_id]
+        if sender is None:
+            connection.subscriptions[session_id] = None
+        elif senders is not None:
+            senders.add(sender)
+
+    def unsubscribe(self, websocket: WebSocket, session_id: str):
+        connection = self.active_connections[websocket]
+        # Aunque se quede sin suscripciones, la conexión no vuelve a recibir todos los mensajes
+        if connection.subscriptions.pop(session_id, False) is not False:
+            self._unindex(session_id, connection)
+
+    def _unindex(self, session_id: str, connection: ClientConnection):
+        subscribers = self._by_session.get(session_id)
+        if subscribers is not None:
+            subscribers.discard(connection)
+            if not subscribers:
+                del self._by_session[session_id]
+
+    async def handle_client_message(self, websocket: WebSocket, data: str, session_factory=None):
+        """Procesa un comando del cliente: {"action": "subscribe"|"unsubscribe", "session_id", "sender"}.
+
+        Al suscribirse, ``last_message_id`` o ``since`` (timestamp ISO) piden los
+        mensajes perdidos desde entonces, que se envían en un único marco
+        ``{"type": "backfill", ...}``. El texto que no es un comando se ignora,
+        como hacía el endpoint original.
+        """
+        try:
+            command = json.loads(data)
+        except ValueError:
+            return
+        if not isinstance(command, dict) or "action" not in command:
+            return
+        action, session_id, sender = command["action"], command.get("session_id"), command.get("sender")
+        last_message_id, since = command.get("last_message_id"), command.get("since")
+        connection = self.active_connections.get(websocket)
+        if connection is None:
+            return
+        try:
+            if action not in ("subscribe", "unsubscribe"):
+                raise ValueError(f"Acción desconocida: {action}")
+            if not isinstance(session_id, str) or not session_id:
+                raise ValueError("'session_id' es obligatorio")
+            if sender is not None and not isinstance(sender, str):
+                raise ValueError("'sender' debe ser una cadena")
+            if last_message_id is not None and not isinstance(last_message_id, str):
+                raise ValueError("'last_message_id' debe ser una cadena")
+            if since is not None:
+                if not isinstance(since, str):
+                    raise ValueError("'since' debe ser un timestamp ISO 8601")
+                since = parse_timestamp(since)
+            if action == "subscribe":
+                self.subscribe(websocket, session_id, sender)
+            else:
+                self.unsubscribe(websocket, session_id)
+        except ValueError as exc:
+            connection.enqueue(json.dumps({"status": "error", "action": action, "message": str(exc)}))
+            return
+        connection.enqueue(json.dumps(
+            {"status": "ok", "action": action, "session_id": session_id, "sender": sender}
+        ))
+        if action == "subscribe" and (last_message_id is not None or since is not None):
+            await self._backfill(connection, session_id, sender, last_message_id, since, session_factory)
+
+    async def _backfill(self, connection: ClientConnection, session_id: str, sender: str | None,
+                        last_message_id: str | None, since, session_factory):
+        # La consulta al buffer y la suscripción ocurren sin ceder el event loop,
+        # así que el backfill del buffer no se solapa con los mensajes en vivo
+        if last_message_id is not None:
+            entries = self.replay.after_message(session_id, last_message_id)
+        else:
+            entries = self.replay.after_timestamp(session_id, since)
+        if entries is not None:
+            messages = [entry.message for entry in entries if sender is None or entry.sender == sender]
+            if len(messages) <= self.backfill_limit:
+                self.backfills_from_buffer += 1
+                connection.enqueue(_backfill_frame(session_id, "buffer", messages, None))
+                return
+        if session_factory is None:
+            return
+        # Desde la BD puede haber solapamiento con mensajes en vivo: el cliente deduplica por message_id
+        self.backfills_from_database += 1
+        try:
+            async with open_session(session_factory) as db:
+                result = await services.get_backfill(
+                    db, session_id, sender, self.backfill_limit, last_message_id=last_message_id, since=since,
+                )
+        except Exception:
+            # Un fallo de la BD no cierra la conexión: la suscripción sigue activa y el cliente
+            # puede recuperar los mensajes con el historial HTTP
+            self.backfill_errors += 1
+            connection.enqueue(json.dumps({
+                "status": "error", "action": "subscribe",
+                "message": f"No se pudieron recuperar los mensajes perdidos de la sesión {session_id}",
+            }))
+            return
+        if result is None:
+            connection.enqueue(json.dumps({
+                "status": "error", "action": "subscribe",
+                "message": f"'last_message_id' desconocido en la sesión {session_id}",
+            }))
+            return
+        messages, next_cursor = result
+        connection.enqueue(_backfill_frame(session_id, "database", messages, next_cursor))
 
     async def send_personal_message(self, message: str, websocket: WebSocket):
         await websocket.send_text(message)
 
-    async def broadcast(self, message: str):
-        for connection in self.active_connections:
-            await connection.send_text(message)
+    async def broadcast(self, message: str, session_id: str | None = None, sender: str | None = None):
+        """Encola el mensaje (ya serializado) en las conexiones interesadas sin esperar a los envíos.
+
+        El coste es proporcional a los suscriptores de la sesión más las conexiones
+        sin suscripciones; si no se indican ``session_id``/``sender`` se leen del JSON.
+        Un aviso ``replay_reset`` solo vacía el buffer de reenvío de su sesión.
+        """
+        if message.startswith(REPLAY_RESET_PREFIX):
+            self.replay.discard(json.loads(message)["session_id"])
+            return
+        recipients = list(self._firehose)
+        if session_id is None and (self._by_session or self.replay.size > 0):
+            session_id, sender = self._record(message)
+        if self._by_session:
+            for connection in self._by_session.get(session_id, ()):
+                senders = connection.subscriptions[session_id]
+                if senders is None or sender in senders:
+                    recipients.append(connection)
+        for connection in recipients:
+            if not connection.enqueue(message):
+                self.disconnected_slow += 1
+                self.disconnect(connection.websocket)
+                task = asyncio.create_task(connection.close(SLOW_CONSUMER_CLOSE_CODE))
+                self._closing.add(task)
+                task.add_done_callback(self._closing.discard)
+
+    def _record(self, message: str) -> tuple[str | None, str | None]:
+        """Guarda el mensaje en el buffer de su sesión y devuelve (session_id, sender)."""
+        try:
+            data = json.loads(message)
+            session_id, sender = data.get("session_id"), data.get("sender")
+        except (ValueError, AttributeError):
+            return None, None
+        try:
+            entry = ReplayEntry(data["message_id"], sender, parse_timestamp(data["timestamp"]), message)
+        except (KeyError, TypeError, ValueError):
+            return session_id, sender
+        self.replay.record(session_id, entry)
+        return session_id, sender
+
+    def stats(self) -> dict:
+        return {
+            "connections": len(self.active_connections),
+            "subscribed_sessions": len(self._by_session),
+            "replay": self.replay.stats(),
+            "backfills_from_buffer": self.backfills_from_buffer,
+            "backfills_from_database": self.backfills_from_database,
+            "backfill_errors": self.backfill_errors,
+            "delivered": self.delivered,
+            "dropped": self.dropped,
+            "disconnected_slow": self.disconnected_slow,
+        }
+
+def _backfill_frame(session_id: str, source: str, messages: list[str], next_cursor: str | None) -> str:
+    """Marco de backfill: los mensajes ya serializados se insertan sin volver a codificarlos."""
+    header = json.dumps({"type": "backfill", "session_id": session_id, "source": source, "next_cursor": next_cursor})
+    return f'{header[:-1]},"messages":[{",".join(messages)}]}}'
 
 manager = ConnectionManager()
 
 @router.websocket("/ws/messages")
-async def websocket_endpoint(websocket: WebSocket):
+async def websocket_endpoint(websocket: WebSocket, session_factory=Depends(get_session_factory)):
     await manager.connect(websocket)
     try:
         while True:
-            # Los WebSockets pueden recibir mensajes, pero para este caso
-            # solo nos interesa enviar actualizaciones, así que esperamos
-            # un mensaje para mantener la conexión abierta.
+            # Los clientes pueden suscribirse a sesiones concretas; los que no
+            # envían comandos siguen recibiendo todos los mensajes.
             data = await websocket.receive_text()
-            # Opcional: podrías procesar 'data' si los clientes envían mensajes
+            await manager.handle_client_message(websocket, data, session_factory)
     except WebSocketDisconnect:
+        pass
+    finally:
+        # Con cualquier salida del bucle (también un error inesperado) se retira la conexión y su tarea escritora
         manager.disconnect(websocket)
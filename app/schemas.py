@@ -19,6 +19,10 @@ class SuccessResponse(BaseModel, Generic[T]):
     status: Literal["success"] = "success"
     data: T
 
+# Respuesta paginada: next_cursor permite pedir la página siguiente
+class PaginatedResponse(SuccessResponse[T], Generic[T]):
+    next_cursor: str | None = None
+
 # Esquemas de Mensajes
 class MessageBase(BaseModel):
     message_id: str
@@ -45,4 +49,39 @@ class Message(MessageBase):
 MessageResponse = SuccessResponse[Message]
 
 # Tipo específico para la respuesta de una lista de mensajes
-MessagesResponse = SuccessResponse[list[Message]]
+MessagesResponse = PaginatedResponse[list[Message]]
+
+# Resultado por elemento de una ingesta masiva
+class BulkItemResult(BaseModel):
+    index: int
+    message_id: str | None = None
+    status: Literal["created", "duplicate", "invalid"]
+    details: str | None = None
+
+class BulkIngestResult(BaseModel):
+    received: int = 0
+    created: int = 0
+    duplicates: int = 0
+    invalid: int = 0
+    items: list[BulkItemResult] = []
+
+# Tipo específico para la respuesta de la ingesta masiva
+BulkIngestResponse = SuccessResponse[BulkIngestResult]
+
+# Cuerpo masivo mal formado: data es el resultado de los elementos leídos antes del error
+class BulkIngestErrorResponse(ErrorResponse):
+    data: BulkIngestResult | None = None
+
+# Totales de una sesión, leídos de la tabla de agregados
+class SenderStats(BaseModel):
+    message_count: int = 0
+    word_count: int = 0
+    character_count: int = 0
+
+class SessionStats(SenderStats):
+    session_id: str
+    first_timestamp: datetime | None = None
+    last_timestamp: datetime | None = None
+    senders: dict[str, SenderStats] = {}
+
+SessionStatsResponse = SuccessResponse[SessionStats]
@@ -0,0 +1,219 @@
+import os
+import re
+from dataclasses import dataclass
+from sqlalchemy import DDL, Table, column, event, func, literal_column, select, table, text, tuple_
+from sqlalchemy.engine import Row
+from sqlalchemy.orm import Session
+from . import models
+from .pagination import InvalidCursor
+
+# SEARCH_BACKEND=like fuerza la búsqueda por subcadena (ILIKE) en cualquier base de datos
+SEARCH_BACKEND = os.getenv("SEARCH_BACKEND", "auto")
+
+# --- Índice FTS5 de SQLite, sincronizado con la tabla de mensajes mediante triggers ---
+# La tabla activa y cada partición mensual (messages_AAAA_MM) tienen su propio índice
+
+def sqlite_fts_ddl(name: str) -> list[str]:
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {name}_fts USING fts5("
+        f"content, content='{name}', content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+        f"CREATE TRIGGER IF NOT EXISTS {name}_fts_ai AFTER INSERT ON {name} BEGIN "
+        f"INSERT INTO {name}_fts(rowid, content) VALUES (new.id, new.content); END",
+        f"CREATE TRIGGER IF NOT EXISTS {name}_fts_ad AFTER DELETE ON {name} BEGIN "
+        f"INSERT INTO {name}_fts({name}_fts, rowid, content) VALUES ('delete', old.id, old.content); END",
+        f"CREATE TRIGGER IF NOT EXISTS {name}_fts_au AFTER UPDATE OF content ON {name} BEGIN "
+        f"INSERT INTO {name}_fts({name}_fts, rowid, content) VALUES ('delete', old.id, old.content); "
+        f"INSERT INTO {name}_fts(rowid, content) VALUES (new.id, new.content); END",
+    ]
+
+
+SQLITE_FTS_DDL = sqlite_fts_ddl("messages")
+
+# --- Índice GIN sobre tsvector para PostgreSQL ---
+
+def postgres_fts_ddl(name: str) -> list[str]:
+    return [
+        f"CREATE INDEX IF NOT EXISTS ix_{name}_content_tsv "
+        f"ON {name} USING GIN (to_tsvector('simple', content))",
+    ]
+
+
+POSTGRES_FTS_DDL = postgres_fts_ddl("messages")
+
+for statement in SQLITE_FTS_DDL:
+    event.listen(models.Message.__table__, "after_create", DDL(statement).execute_if(dialect="sqlite"))
+for statement in POSTGRES_FTS_DDL:
+    event.listen(models.Message.__table__, "after_create", DDL(statement).execute_if(dialect="postgresql"))
+event.listen(
+    models.Message.__table__, "before_drop",
+    DDL("DROP TABLE IF EXISTS messages_fts").execute_if(dialect="sqlite"),
+)
+
+
+def ensure_search_index(connection, name: str = "messages"):
+    """Crea el índice de texto completo de la tabla ``name`` si aún no existe.
+
+    Si la tabla FTS5 es nueva se reconstruye a partir de los mensajes guardados.
+    """
+    dialect = connection.dialect.name
+    if dialect == "sqlite":
+        existed = connection.execute(
+            text("SELECT 1 FROM sqlite_master WHERE name = :name"), {"name": f"{name}_fts"}
+        ).first()
+        for statement in sqlite_fts_ddl(name):
+            connection.execute(text(statement))
+        if not existed:
+            connection.execute(text(f"INSERT INTO {name}_fts({name}_fts) VALUES ('rebuild')"))
+    elif dialect == "postgresql":
+        for statement in postgres_fts_ddl(name):
+            connection.execute(text(statement))
+
+
+def drop_search_index(connection, name: str):
+    """Elimina la tabla FTS5 de una partición (sus triggers desaparecen con la tabla)."""
+    if connection.dialect.name == "sqlite":
+        connection.execute(text(f"DROP TABLE IF EXISTS {name}_fts"))
+
+
+# --- Análisis de la consulta ---
+
+@dataclass(frozen=True)
+class SearchTerm:
+    words: tuple[str, ...]
+    prefix: bool = False
+
+
+_TOKEN_RE = re.compile(r'"([^"]*)"|(\S+)')
+
+
+def parse_query(query_text: str) -> list[SearchTerm]:
+    """Convierte el texto buscado en términos: palabras, "frases exactas" y prefijos (hola*)."""
+    terms = []
+    for phrase, token in _TOKEN_RE.findall(query_text):
+        raw = phrase if phrase else token
+        words = tuple(word.lower() for word in re.findall(r"\w+", raw))
+        if words:
+            terms.append(SearchTerm(words, prefix=not phrase and token.endswith("*")))
+    return terms
+
+
+# --- Backends de búsqueda ---
+
+def _check_after(after: list, size: int) -> list:
+    if len(after) != size or not all(isinstance(value, (int, float)) for value in after):
+        raise InvalidCursor("Cursor de paginación inválido")
+    return after
+
+
+def _columns(source: Table):
+    return [source.c[column.key] for column in models.MESSAGE_COLUMNS]
+
+
+class SearchBackend:
+    """Interfaz común: devuelve los mensajes que coinciden, ordenados por relevancia.
+
+    Cada resultado va acompañado de su clave de ordenación, que sirve como
+    cursor (``after``) para pedir la página siguiente sin OFFSET. ``source``
+    es la tabla activa o una partición mensual con la misma estructura.
+    """
+
+    name = "base"
+
+    def search(
+        self, db: Session, query_text: str, session_id: str | None, skip: int, limit: int,
+        after: list | None = None, source: Table = models.Message.__table__,
+    ) -> list[tuple[Row, list]]:
+        raise NotImplementedError
+
+
+class LikeSearchBackend(SearchBackend):
+    """Búsqueda por subcadena con ILIKE; no usa índices (recorre toda la tabla)."""
+
+    name = "like"
+
+    def search(self, db, query_text, session_id, skip, limit, after=None, source=models.Message.__table__):
+        query = select(*_columns(source)).where(source.c.content.ilike(f"%{query_text}%"))
+        if session_id:
+            query = query.where(source.c.session_id == session_id)
+        if after:
+            query = query.where(source.c.id > _check_after(after, 1)[0])
+        rows = db.execute(query.order_by(source.c.id).offset(skip).limit(limit))
+        return [(row, [row.id]) for row in rows]
+
+
+class SQLiteFTSBackend(SearchBackend):
+    """Búsqueda sobre la tabla virtual FTS5 ordenada por bm25."""
+
+    name = "sqlite"
+
+    @staticmethod
+    def build_match(terms: list[SearchTerm]) -> str:
+        # Las palabras solo contienen caracteres \w, así que entrecomillarlas es seguro
+        return " ".join(
+            f'"{" ".join(term.words)}"' + ("*" if term.prefix else "") for term in terms
+        )
+
+    def search(self, db, query_text, session_id, skip, limit, after=None, source=models.Message.__table__):
+        terms = parse_query(query_text)
+        if not terms:
+            return LikeSearchBackend().search(db, query_text, session_id, skip, limit, after, source)
+        fts_name = f"{source.name}_fts"
+        fts = table(fts_name, column("rowid"), column("rank"))
+        rank = fts.c.rank
+        stmt = (
+            select(*_columns(source), rank)
+            .join(fts, fts.c.rowid == source.c.id)
+            .where(literal_column(fts_name).op("MATCH")(self.build_match(terms)))
+        )
+        if session_id:
+            stmt = stmt.where(source.c.session_id == session_id)
+        if after:
+            stmt = stmt.where(tuple_(rank, source.c.id) > tuple_(*_check_after(after, 2)))
+        stmt = stmt.order_by(rank, source.c.id).offset(skip).limit(limit)
+        return [(row, [row.rank, row.id]) for row in db.execute(stmt)]
+
+
+class PostgresFTSBackend(SearchBackend):
+    """Búsqueda con tsvector/tsquery sobre el índice GIN, ordenada por ts_rank."""
+
+    name = "postgresql"
+
+    @staticmethod
+    def build_tsquery(terms: list[SearchTerm]) -> str:
+        parts = []
+        for term in terms:
+            words = list(term.words)
+            if term.prefix:
+                words[-1] += ":*"
+            parts.append(" <-> ".join(words))
+        return " & ".join(f"({part})" for part in parts)
+
+    def search(self, db, query_text, session_id, skip, limit, after=None, source=models.Message.__table__):
+        terms = parse_query(query_text)
+        if not terms:
+            return LikeSearchBackend().search(db, query_text, session_id, skip, limit, after, source)
+        vector = func.to_tsvector("simple", source.c.content)
+        tsquery = func.to_tsquery("simple", self.build_tsquery(terms))
+        # Se ordena por -ts_rank para que el cursor sea una comparación ascendente
+        rank = -func.ts_rank(vector, tsquery)
+        stmt = select(*_columns(source), rank.label("rank")).where(vector.op("@@")(tsquery))
+        if session_id:
+            stmt = stmt.where(source.c.session_id == session_id)
+        if after:
+            stmt = stmt.where(tuple_(rank, source.c.id) > tuple_(*_check_after(after, 2)))
+        stmt = stmt.order_by(rank, source.c.id).offset(skip).limit(limit)
+        return [(row, [row.rank, row.id]) for row in db.execute(stmt)]
+
+
+BACKENDS: dict[str, SearchBackend] = {
+    "like": LikeSearchBackend(),
+    "sqlite": SQLiteFTSBackend(),
+    "postgresql": PostgresFTSBackend(),
+}
+
+
+def get_backend(dialect_name: str) -> SearchBackend:
+    """Selecciona el backend según SEARCH_BACKEND o el dialecto de la conexión."""
+    if SEARCH_BACKEND != "auto":
+        return BACKENDS[SEARCH_BACKEND]
+    return BACKENDS.get(dialect_name, BACKENDS["like"])
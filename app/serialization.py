@@ -0,0 +1,70 @@
+import csv
+import io
+from datetime import datetime
+from typing import Iterable
+
+from pydantic_core import to_json
+
+# Serialización directa de filas de la BD a JSON, sin construir modelos Pydantic.
+# El formato es el mismo que producen schemas.Message / schemas.MessagesResponse.
+
+
+def message_dict(row) -> dict:
+    """Convierte una fila (o un objeto ORM) de mensaje en el dict de la respuesta."""
+    return {
+        "message_id": row.message_id,
+        "session_id": row.session_id,
+        "content": row.content,
+        "timestamp": row.timestamp,
+        "sender": row.sender,
+        "metadata": {
+            "word_count": row.word_count,
+            "character_count": row.character_count,
+            "processed_at": row.processed_at,
+        },
+    }
+
+
+def dumps_message(row) -> bytes:
+    """JSON de un único mensaje (el mismo que se transmite por WebSocket)."""
+    return to_json(message_dict(row))
+
+
+def dumps_message_response(message_json: bytes) -> bytes:
+    """Envuelve un mensaje ya serializado en la respuesta estándar de éxito."""
+    return b'{"status":"success","data":' + message_json + b"}"
+
+
+def dumps_messages_page(rows: Iterable, next_cursor: str | None) -> bytes:
+    """JSON de una página de mensajes con su cursor, en una sola pasada."""
+    return to_json({
+        "status": "success",
+        "data": [message_dict(row) for row in rows],
+        "next_cursor": next_cursor,
+    })
+
+
+def dumps_ndjson(rows: Iterable) -> bytes:
+    """Una línea JSON por mensaje (formato de exportación NDJSON)."""
+    return b"".join(to_json(message_dict(row)) + b"\n" for row in rows)
+
+
+# Columnas de la exportación CSV, en orden
+CSV_COLUMNS = (
+    "message_id", "session_id", "timestamp", "sender", "content",
+    "word_count", "character_count", "processed_at",
+)
+
+
+def dumps_csv(rows: Iterable, header: bool = False) -> bytes:
+    """Filas CSV de los mensajes; ``header`` antepone la fila de nombres de columna."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(CSV_COLUMNS)
+    for row in rows:
+        writer.writerow([
+            value.isoformat() if isinstance(value, datetime) else value
+            for value in (getattr(row, column) for column in CSV_COLUMNS)
+        ])
+    return buffer.getvalue().encode()
@@ -1,46 +1,357 @@
-import re
+import os
+import zlib
+from typing import Any, AsyncIterator, Awaitable, Callable
+from pydantic import ValidationError
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from datetime import datetime
-from . import crud, schemas, models
+from . import crud, schemas, models, write_queue, filtering, pagination, cache, serialization, processing, metrics, idempotency
+from starlette.concurrency import iterate_in_threadpool
+from .database import open_session, run_db
+from .ingest import BulkFormatError
 
 # Lista simple de palabras prohibidas para el ejemplo
 BANNED_WORDS = {"inapropiada", "prohibida", "baneada"}
 
+# Con BANNED_WORDS_FILE la lista se lee de un fichero (una palabra por línea) y se recarga al cambiar.
+# BANNED_WORDS_MODE=word filtra solo palabras completas; por defecto se filtran subcadenas.
+BANNED_WORDS_WHOLE = os.getenv("BANNED_WORDS_MODE", "substring") == "word"
+_banned_words_file = (
+    filtering.WordListFile(os.environ["BANNED_WORDS_FILE"], whole_words=BANNED_WORDS_WHOLE)
+    if os.getenv("BANNED_WORDS_FILE")
+    else None
+)
+
+# Filas que se leen de la BD y se codifican por bloque en las exportaciones
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+
+# Mayor clave primaria posible (BIGINT con signo)
+MAX_MESSAGE_PK = 2**63 - 1
+
 def _filter_content(content: str) -> str:
     """Filtra palabras prohibidas del contenido (insensible a mayúsculas)."""
-    for word in BANNED_WORDS:
-        # Usamos re.sub con el flag re.IGNORECASE para reemplazar sin importar may/min
-        content = re.sub(re.escape(word), "****", content, flags=re.IGNORECASE)
-    return content
-
-def process_and_create_message(db: Session, message: schemas.MessageCreate) -> models.Message:
-    """Procesa y guarda un nuevo mensaje."""
-    # 1. Filtrado de contenido
-    filtered_content = _filter_content(message.content)
-    message.content = filtered_content
+    # Toda la lista está compilada en una sola regex: una pasada por mensaje
+    if _banned_words_file is not None:
+        return _banned_words_file.get_filter().filter(content)
+    return filtering.compiled_filter(BANNED_WORDS, BANNED_WORDS_WHOLE).filter(content)
+
+# Número de mensajes por INSERT en la ingesta masiva
+BULK_CHUNK_SIZE = 1000
 
-    # 2. Cálculo de metadatos
-    metadata = schemas.MessageMetadata(
-        word_count=len(filtered_content.split()),
-        character_count=len(filtered_content),
+def _process_content(content: str) -> tuple[str, int, int]:
+    """Paso de CPU: filtra el contenido y cuenta palabras y caracteres."""
+    filtered_content = _filter_content(content)
+    return filtered_content, len(filtered_content.split()), len(filtered_content)
+
+def process_contents(contents: list[str]) -> list[tuple[str, int, int]]:
+    """Versión por lotes de ``_process_content`` que ejecuta el pipeline en un hilo o proceso."""
+    return [_process_content(content) for content in contents]
+
+def _apply_processing(message: schemas.MessageCreate, processed: tuple[str, int, int]) -> schemas.MessageMetadata:
+    filtered_content, word_count, character_count = processed
+    message.content = filtered_content
+    return schemas.MessageMetadata(
+        word_count=word_count,
+        character_count=character_count,
         processed_at=datetime.utcnow()
     )
 
-    # 3. Llamada al CRUD para guardar en BD
-    return crud.create_message(db=db, message=message, metadata=metadata)
+def _prepare_message(message: schemas.MessageCreate) -> schemas.MessageMetadata:
+    """Filtra el contenido del mensaje y calcula sus metadatos en el propio event loop."""
+    return _apply_processing(message, _process_content(message.content))
+
+async def _prepare_messages(messages: list[schemas.MessageCreate]) -> list[schemas.MessageMetadata]:
+    """Prepara varios mensajes, en el pool de procesamiento si está activo."""
+    with metrics.span("filter"):
+        if processing.pipeline is None:
+            return [_prepare_message(message) for message in messages]
+        results = await processing.pipeline.map([message.content for message in messages])
+    return [_apply_processing(message, processed) for message, processed in zip(messages, results)]
 
-def get_messages(
-    db: Session, session_id: str, sender: str | None, skip: int, limit: int
-) -> list[models.Message]:
-    """Obtiene mensajes por sesión con formato estandarizado."""
-    return crud.get_messages_by_session(
-        db=db, session_id=session_id, sender=sender, skip=skip, limit=limit
+async def process_and_create_message(
+    db: Session | AsyncSession, message: schemas.MessageCreate, tenant: str | None = None,
+) -> models.Message:
+    """Procesa y guarda un nuevo mensaje.
+
+    Si el message_id ya está guardado (un reintento del cliente) se lanza
+    ``idempotency.DuplicateMessage`` con el mensaje almacenado. Los reintentos
+    recientes se recuerdan por ``tenant`` (el de la clave de API) y message_id.
+    """
+    # 0. Reintento reciente: se responde sin filtrar ni consultar la BD
+    if idempotency.IDEMPOTENCY_ENABLED:
+        replay = await idempotency.recent_messages.get(tenant, message.message_id)
+        if replay is not None:
+            raise idempotency.DuplicateMessage(replay)
+
+    # 1-2. Filtrado de contenido y metadatos (fuera del event loop si PROCESSING_MODE lo indica)
+    with metrics.span("filter"):
+        if processing.pipeline is None:
+            metadata = _prepare_message(message)
+        else:
+            metadata = _apply_processing(message, await processing.pipeline.submit(message.content))
+
+    # 3. Llamada al CRUD para guardar en BD (agrupada en lotes si la cola de escritura está activa)
+    try:
+        if write_queue.write_queue is not None:
+            with metrics.span("db"):
+                db_message = await write_queue.write_queue.submit(message, metadata)
+        else:
+            db_message = await run_db(db, crud.create_message, message=message, metadata=metadata)
+    except IntegrityError:
+        # Reintento que ya no está en memoria (o concurrente con el original): lo detecta la restricción única
+        await run_db(db, Session.rollback)
+        stored = await run_db(db, crud.get_message_by_message_id, message.message_id)
+        if stored is None:
+            raise
+        message_json = serialization.dumps_message(stored)
+        if idempotency.IDEMPOTENCY_ENABLED:
+            await idempotency.recent_messages.remember(tenant, message.message_id, message_json)
+        raise idempotency.DuplicateMessage(message_json)
+
+    # 4. Las páginas cacheadas de la sesión ya no están completas
+    await cache.history_cache.invalidate(message.session_id)
+    return db_message
+
+async def get_messages(
+    db: Session | AsyncSession, session_id: str, sender: str | None, skip: int, limit: int,
+    cursor: str | None = None, use_cache: bool = True, store_in_cache: bool = True,
+) -> bytes:
+    """Obtiene una página del historial de una sesión ya serializada a JSON.
+
+    Las páginas se sirven desde la caché de lectura cuando es posible; con
+    ``use_cache=False`` se lee de la BD (y se guarda el resultado salvo con
+    ``store_in_cache=False``, p. ej. si se ha leído de una réplica).
+    """
+    after = pagination.decode_timestamp_cursor(cursor) if cursor else None
+    skip = 0 if after else skip
+    page = (skip, limit, cursor)
+    generation = None
+    if cache.CACHE_ENABLED:
+        # La generación se lee antes que la BD: la página se guarda bajo ella
+        generation = await cache.history_cache.generation(session_id)
+        if use_cache and generation is not None:
+            cached = await cache.history_cache.get(session_id, sender, page, generation)
+            if cached is not None:
+                return cached
+
+    db_messages = await run_db(
+        db, crud.get_messages_by_session,
+        session_id=session_id, sender=sender, skip=skip, limit=limit, after=after,
     )
+    next_cursor = None
+    if limit and len(db_messages) == limit:
+        last = db_messages[-1]
+        next_cursor = pagination.encode_cursor("history", [last.timestamp, last.id])
+    with metrics.span("serialization"):
+        response = serialization.dumps_messages_page(db_messages, next_cursor)
 
-def search_messages(
-    db: Session, query_text: str, skip: int = 0, limit: int = 100
-) -> list[models.Message]:
-    """Busca mensajes por contenido con paginación."""
-    return crud.search_messages_by_content(
-        db=db, query_text=query_text, skip=skip, limit=limit
+    if cache.CACHE_ENABLED and store_in_cache:
+        await cache.history_cache.set(session_id, sender, page, response, generation=generation)
+    return response
+
+async def search_messages(
+    db: Session | AsyncSession, query_text: str, session_id: str | None = None, skip: int = 0, limit: int = 100,
+    cursor: str | None = None,
+) -> bytes:
+    """Busca mensajes por contenido, ordenados por relevancia, y devuelve la página en JSON."""
+    after = pagination.decode_cursor("search", cursor) if cursor else None
+    results = await run_db(
+        db, crud.search_messages_by_content,
+        query_text=query_text, session_id=session_id, skip=0 if after else skip, limit=limit, after=after,
     )
+    next_cursor = None
+    if limit and len(results) == limit:
+        next_cursor = pagination.encode_cursor("search", results[-1][1])
+    with metrics.span("serialization"):
+        return serialization.dumps_messages_page((row for row, _ in results), next_cursor)
+
+async def get_backfill(
+    db: Session | AsyncSession, session_id: str, sender: str | None, limit: int,
+    last_message_id: str | None = None, since: datetime | None = None,
+) -> tuple[list[str], str | None] | None:
+    """Mensajes de la sesión posteriores al último visto, leídos de la BD.
+
+    Devuelve el JSON de cada mensaje y el cursor del historial si hay más de
+    ``limit``; None si ``last_message_id`` no pertenece a la sesión.
+    """
+    if last_message_id is not None:
+        last = await run_db(db, crud.get_message_by_message_id, last_message_id)
+        if last is None or last.session_id != session_id:
+            return None
+        after = (last.timestamp, last.id)
+    else:
+        # Con el id máximo la comparación de tuplas equivale a timestamp > since
+        after = (since, MAX_MESSAGE_PK)
+    rows = await run_db(
+        db, crud.get_messages_by_session, session_id=session_id, sender=sender, limit=limit, after=after,
+    )
+    next_cursor = None
+    if len(rows) == limit:
+        next_cursor = pagination.encode_cursor("history", [rows[-1].timestamp, rows[-1].id])
+    return [serialization.dumps_message(row).decode() for row in rows], next_cursor
+
+
+async def get_session_stats(db: Session | AsyncSession, session_id: str) -> schemas.SessionStats:
+    """Totales de la sesión sumando sus filas de agregados (una por remitente)."""
+    rows = await run_db(db, crud.get_session_stats, session_id)
+    stats = schemas.SessionStats(session_id=session_id)
+    for row in rows:
+        stats.senders[row.sender] = schemas.SenderStats(
+            message_count=row.message_count, word_count=row.word_count, character_count=row.character_count,
+        )
+        stats.message_count += row.message_count
+        stats.word_count += row.word_count
+        stats.character_count += row.character_count
+        if stats.first_timestamp is None or row.first_timestamp < stats.first_timestamp:
+            stats.first_timestamp = row.first_timestamp
+        if stats.last_timestamp is None or row.last_timestamp > stats.last_timestamp:
+            stats.last_timestamp = row.last_timestamp
+    return stats
+
+async def _history_batches(db: AsyncSession, session_id: str, sender: str | None, batch_size: int):
+    """Recorre la sesión por páginas con cursor (timestamp, id) sobre una ``AsyncSession``.
+
+    Cada página pasa por ``crud.get_messages_by_session``, que mezcla la tabla
+    activa con las particiones mensuales: un único ``stream`` de la tabla
+    activa dejaría fuera los meses ya sellados.
+    """
+    after = None
+    while True:
+        rows = await run_db(
+            db, crud.get_messages_by_session, session_id=session_id, sender=sender, limit=batch_size, after=after,
+        )
+        if rows:
+            yield rows
+        if len(rows) < batch_size:
+            return
+        after = (rows[-1].timestamp, rows[-1].id)
+
+async def export_messages(
+    session_factory, session_id: str, sender: str | None, fmt: str = "ndjson", compress: bool = False,
+    batch_size: int = EXPORT_BATCH_SIZE,
+) -> AsyncIterator[bytes]:
+    """Genera la exportación completa de una sesión (NDJSON o CSV), opcionalmente en gzip.
+
+    La sesión de BD se abre dentro del generador porque la respuesta se emite
+    después de que FastAPI cierre las dependencias; la memoria usada depende
+    de ``batch_size`` y no del tamaño de la sesión.
+    """
+    encode = serialization.dumps_ndjson if fmt == "ndjson" else serialization.dumps_csv
+    # wbits=31: formato gzip (cabecera y CRC) en lugar de zlib
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+
+    def output(data: bytes) -> bytes:
+        return compressor.compress(data) if compressor else data
+
+    if fmt == "csv":
+        yield output(serialization.dumps_csv((), header=True))
+    async with open_session(session_factory) as db:
+        if isinstance(db, AsyncSession):
+            partitions = _history_batches(db, session_id, sender, batch_size)
+        else:
+            partitions = iterate_in_threadpool(
+                crud.iter_messages_by_session(db, session_id, sender, batch_size)
+            )
+        async for rows in partitions:
+            chunk = output(encode(rows))
+            if chunk:
+                yield chunk
+    if compressor:
+        yield compressor.flush()
+
+def _validation_details(exc: ValidationError) -> str:
+    first_error = exc.errors()[0]
+    field = ".".join(str(loc) for loc in first_error["loc"])
+    return f"{field}: {first_error['msg']}" if field else first_error["msg"]
+
+async def ingest_messages(
+    db: Session | AsyncSession,
+    raw_items: AsyncIterator[Any],
+    chunk_size: int = BULK_CHUNK_SIZE,
+    report_all: bool = True,
+    on_stored: Callable[[set[str]], Awaitable[None]] | None = None,
+) -> schemas.BulkIngestResult:
+    """Valida, procesa y guarda mensajes en bloques a medida que se leen del cuerpo.
+
+    Los message_id repetidos (en la BD o dentro del mismo bloque) se informan
+    como duplicados; con ``report_all=False`` solo se devuelven los elementos
+    que no se han creado. Si el cuerpo está mal formado se guardan los
+    elementos leídos hasta ese punto y se lanza ``BulkFormatError`` con el
+    resultado parcial. ``on_stored`` recibe, tras cada bloque, las sesiones
+    con mensajes nuevos.
+    """
+    result = schemas.BulkIngestResult()
+    chunk: list[tuple[int, schemas.MessageCreate]] = []
+    chunk_ids: set[str] = set()
+
+    def report(index: int, message_id: str | None, status: str, details: str | None = None):
+        if status == "created":
+            result.created += 1
+        elif status == "duplicate":
+            result.duplicates += 1
+        else:
+            result.invalid += 1
+        if report_all or status != "created":
+            result.items.append(schemas.BulkItemResult(
+                index=index, message_id=message_id, status=status, details=details
+            ))
+
+    async def flush():
+        # El bloque entero se procesa de una vez (en lotes del pool si está activo)
+        metadatas = await _prepare_messages([message for _, message in chunk])
+        rows = [
+            {
+                **message.model_dump(),
+                "word_count": metadata.word_count,
+                "character_count": metadata.character_count,
+                "processed_at": metadata.processed_at,
+            }
+            for (_, message), metadata in zip(chunk, metadatas)
+        ]
+        inserted = await run_db(db, crud.bulk_insert_messages, rows)
+        for session_id in {row["session_id"] for row in rows}:
+            await cache.history_cache.invalidate(session_id)
+        if on_stored is not None and inserted:
+            await on_stored({row["session_id"] for row in rows if row["message_id"] in inserted})
+        for (index, _), row in zip(chunk, rows):
+            if row["message_id"] in inserted:
+                report(index, row["message_id"], "created")
+            else:
+                report(index, row["message_id"], "duplicate", "message_id ya existente")
+        chunk.clear()
+        chunk_ids.clear()
+
+    format_error = None
+    try:
+        async for raw in raw_items:
+            index = result.received
+            result.received += 1
+            try:
+                if isinstance(raw, (bytes, str)):
+                    message = schemas.MessageCreate.model_validate_json(raw)
+                else:
+                    message = schemas.MessageCreate.model_validate(raw)
+            except ValidationError as exc:
+                message_id = raw.get("message_id") if isinstance(raw, dict) else None
+                report(index, message_id if isinstance(message_id, str) else None, "invalid", _validation_details(exc))
+                continue
+            if message.message_id in chunk_ids:
+                report(index, message.message_id, "duplicate", "message_id repetido en la petición")
+                continue
+            chunk.append((index, message))
+            chunk_ids.add(message.message_id)
+            if len(chunk) >= chunk_size:
+                await flush()
+    except BulkFormatError as exc:
+        # Los bloques anteriores ya están confirmados: también se guarda el bloque en curso
+        # para que el resultado parcial cubra exactamente los elementos anteriores al error
+        format_error = exc
+    if chunk:
+        await flush()
+
+    result.items.sort(key=lambda item: item.index)
+    if format_error is not None:
+        format_error.result = result
+        raise format_error
+    return result
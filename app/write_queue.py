@@ -0,0 +1,143 @@
+import asyncio
+import os
+from sqlalchemy.exc import IntegrityError
+
+from . import crud, models, schemas
+from .database import open_session, run_db
+
+# Configuración del pipeline de escritura agrupada (group commit)
+WRITE_BATCH_ENABLED = os.getenv("WRITE_BATCH_ENABLED", "false").lower() in ("1", "true", "yes")
+WRITE_BATCH_WINDOW_MS = float(os.getenv("WRITE_BATCH_WINDOW_MS", "5"))
+WRITE_BATCH_MAX_SIZE = int(os.getenv("WRITE_BATCH_MAX_SIZE", "500"))
+WRITE_QUEUE_MAX_SIZE = int(os.getenv("WRITE_QUEUE_MAX_SIZE", "10000"))
+WRITE_QUEUE_TIMEOUT_MS = float(os.getenv("WRITE_QUEUE_TIMEOUT_MS", "100"))
+
+
+class WriteQueueFull(Exception):
+    """La cola de escritura está llena y no admite más mensajes."""
+
+
+class MessageWriteQueue:
+    """Agrupa los mensajes que llegan dentro de una ventana corta en una sola transacción.
+
+    Cada petición espera un futuro que se resuelve cuando su lote hace commit.
+    Si un lote falla por una restricción de unicidad se reintenta fila a fila
+    para que solo falle el mensaje duplicado.
+    """
+
+    def __init__(
+        self,
+        session_factory,
+        window_ms: float = WRITE_BATCH_WINDOW_MS,
+        max_batch_size: int = WRITE_BATCH_MAX_SIZE,
+        max_queue_size: int = WRITE_QUEUE_MAX_SIZE,
+        enqueue_timeout_ms: float = WRITE_QUEUE_TIMEOUT_MS,
+    ):
+        self.session_factory = session_factory
+        self.window = window_ms / 1000
+        self.max_batch_size = max_batch_size
+        self.enqueue_timeout = enqueue_timeout_ms / 1000
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue_size)
+        self._worker: asyncio.Task | None = None
+        self.batches_committed = 0
+        self.messages_committed = 0
+
+    async def start(self):
+        if self._worker is None:
+            self._worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Espera a que se escriban los mensajes pendientes y detiene el worker."""
+        if self._worker is None:
+            return
+        await self._queue.join()
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        self._worker = None
+
+    async def submit(
+        self, message: schemas.MessageCreate, metadata: schemas.MessageMetadata
+    ) -> models.Message:
+        """Encola un mensaje y espera a que su lote se confirme en la BD."""
+        future = asyncio.get_running_loop().create_future()
+        item = (message, metadata, future)
+        try:
+            if self.enqueue_timeout > 0:
+                await asyncio.wait_for(self._queue.put(item), self.enqueue_timeout)
+            else:
+                self._queue.put_nowait(item)
+        except (asyncio.QueueFull, asyncio.TimeoutError):
+            raise WriteQueueFull("La cola de escritura está llena")
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.window
+            while len(batch) < self.max_batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                    continue
+                except asyncio.QueueEmpty:
+                    pass
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                await self._flush(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _flush(self, batch):
+        try:
+            db_messages = await self._write(
+                crud.create_messages, [(message, metadata) for message, metadata, _ in batch]
+            )
+        except IntegrityError:
+            # Aislamos el mensaje conflictivo escribiendo el lote fila a fila
+            for message, metadata, future in batch:
+                try:
+                    db_message = await self._write(crud.create_message, message, metadata)
+                except Exception as exc:
+                    _set_exception(future, exc)
+                else:
+                    self._record(1)
+                    _set_result(future, db_message)
+        except Exception as exc:
+            for _, _, future in batch:
+                _set_exception(future, exc)
+        else:
+            self._record(len(db_messages))
+            for (_, _, future), db_message in zip(batch, db_messages):
+                _set_result(future, db_message)
+
+    async def _write(self, fn, *args):
+        async with open_session(self.session_factory) as db:
+            return await run_db(db, fn, *args)
+
+    def _record(self, count: int):
+        self.batches_committed += 1
+        self.messages_committed += count
+
+
+def _set_result(future: asyncio.Future, value):
+    if not future.done():
+        future.set_result(value)
+
+
+def _set_exception(future: asyncio.Future, exc: Exception):
+    if not future.done():
+        future.set_exception(exc)
+
+
+# Instancia activa (creada en el arranque de la aplicación si WRITE_BATCH_ENABLED)
+write_queue: MessageWriteQueue | None = None
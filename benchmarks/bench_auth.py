@@ -0,0 +1,85 @@
+"""Benchmark del coste por petición de la autenticación con clave de API.
+
+Mide ``ApiKeyCache.authenticate`` (SHA-256, búsqueda por prefijo del hash y
+``hmac.compare_digest``) con almacenes de distinto tamaño, para claves
+válidas y desconocidas, frente a la comparación directa con una única clave
+que se usaba antes. También mide la dependencia ``get_api_key`` completa:
+
+    python -m benchmarks.bench_auth --keys 1 10000 100000
+"""
+import argparse
+import asyncio
+import json
+import secrets
+import time
+
+from starlette.requests import Request
+
+from app import api_keys
+from app.dependencies import get_api_key
+
+
+class ListKeyStore:
+    def __init__(self, keys: list[api_keys.ApiKeyInfo]):
+        self.keys = keys
+
+    def load(self):
+        return self.keys
+
+
+def _per_call_us(fn, *args, budget: float) -> float:
+    calls = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < budget:
+        for _ in range(1000):
+            fn(*args)
+        calls += 1000
+    return round((time.perf_counter() - start) / calls * 1e6, 3)
+
+
+def _dependency_us(budget: float, key: str) -> float:
+    request = Request({"type": "http", "method": "GET", "path": "/", "headers": []})
+
+    async def run():
+        calls = 0
+        start = time.perf_counter()
+        while time.perf_counter() - start < budget:
+            for _ in range(1000):
+                await get_api_key(request, key)
+            calls += 1000
+        return (time.perf_counter() - start) / calls
+
+    return round(asyncio.run(run()) * 1e6, 3)
+
+
+def run(key_counts=(1, 10_000, 100_000), budget: float = 0.2) -> list[dict]:
+    secret = api_keys.API_KEY_SECRET
+    results = [{"store": "single_key_compare", "keys": 1,
+                "hit_us": _per_call_us(lambda key: key == secret, secret, budget=budget)}]
+    previous = api_keys.key_cache
+    try:
+        for count in key_counts:
+            keys = [secret] + [secrets.token_urlsafe(32) for _ in range(count - 1)]
+            cache = api_keys.ApiKeyCache(ListKeyStore([
+                api_keys.ApiKeyInfo(api_keys.hash_key(key), tenant=f"tenant-{i}") for i, key in enumerate(keys)
+            ]))
+            cache.refresh_sync()
+            api_keys.key_cache = cache
+            results.append({
+                "store": "cache",
+                "keys": count,
+                "hit_us": _per_call_us(cache.authenticate, keys[-1], budget=budget),
+                "miss_us": _per_call_us(cache.authenticate, "clave-desconocida", budget=budget),
+                "dependency_us": _dependency_us(budget, keys[-1]),
+            })
+    finally:
+        api_keys.key_cache = previous
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--keys", nargs="+", type=int, default=[1, 10_000, 100_000])
+    parser.add_argument("--budget", type=float, default=0.2, help="Segundos por medición")
+    args = parser.parse_args()
+    print(json.dumps(run(args.keys, args.budget), indent=2))
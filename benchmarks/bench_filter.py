@@ -0,0 +1,78 @@
+"""Microbenchmark del filtro de palabras prohibidas.
+
+Compara el filtro anterior (un ``re.sub`` por palabra) con el filtro compilado
+en una sola regex, para listas de 10, 1k y 50k términos sobre mensajes cortos
+y largos:
+
+    python -m benchmarks.bench_filter
+"""
+import argparse
+import json
+import random
+import re
+import string
+import time
+
+from app.filtering import BannedWordFilter
+
+SIZES = (10, 1_000, 50_000)
+
+
+def legacy_filter(words, content: str) -> str:
+    for word in words:
+        content = re.sub(re.escape(word), "****", content, flags=re.IGNORECASE)
+    return content
+
+
+def _random_words(count: int, rng: random.Random) -> set[str]:
+    words: set[str] = set()
+    while len(words) < count:
+        words.add("".join(rng.choices(string.ascii_lowercase, k=rng.randint(5, 12))))
+    return words
+
+
+def _message(words: list[str], length: int, rng: random.Random) -> str:
+    vocabulary = ["hola", "mundo", "mensaje", "chat", "sesión", "texto", "prueba"] + words[:5]
+    return " ".join(rng.choice(vocabulary) for _ in range(length))
+
+
+def _time_per_call(fn, content: str, budget: float) -> tuple[float, int]:
+    calls, start = 0, time.perf_counter()
+    while True:
+        fn(content)
+        calls += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= budget:
+            return elapsed / calls, calls
+
+
+def run(sizes=SIZES, budget: float = 0.5, seed: int = 42) -> list[dict]:
+    rng = random.Random(seed)
+    results = []
+    for size in sizes:
+        words = _random_words(size, rng)
+        word_list = sorted(words)
+        start = time.perf_counter()
+        engine = BannedWordFilter(words)
+        compile_ms = (time.perf_counter() - start) * 1000
+        for label, length in (("short", 12), ("long", 2_000)):
+            content = _message(word_list, length, rng)
+            compiled, _ = _time_per_call(engine.filter, content, budget)
+            legacy, _ = _time_per_call(lambda text: legacy_filter(word_list, text), content, budget)
+            results.append({
+                "words": size,
+                "message": label,
+                "compile_ms": round(compile_ms, 1),
+                "compiled_us": round(compiled * 1e6, 2),
+                "legacy_us": round(legacy * 1e6, 2),
+                "speedup": round(legacy / compiled, 1),
+            })
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", nargs="+", type=int, default=list(SIZES))
+    parser.add_argument("--budget", type=float, default=0.5, help="Segundos por medición")
+    args = parser.parse_args()
+    print(json.dumps(run(args.sizes, args.budget), indent=2))
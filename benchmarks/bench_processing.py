@@ -0,0 +1,97 @@
+"""Latencia del event loop con carga mixta según el modo de procesamiento.
+
+Procesa mensajes largos con una lista grande de palabras prohibidas (el paso
+de CPU de ``process_and_create_message``) mientras una sonda mide cuánto se
+retrasa el event loop, que es lo que sufren las demás peticiones y los
+WebSockets. Compara el modo en línea con los pools de hilos y de procesos:
+
+    python -m benchmarks.bench_processing --messages 2000 --words 20000
+"""
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import string
+import time
+
+from app import services
+from app.processing import ProcessingPipeline
+
+MODES = ("inline", "thread", "process")
+
+
+def _percentile(values: list[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def _random_word(rng: random.Random) -> str:
+    return "".join(rng.choices(string.ascii_lowercase, k=rng.randint(4, 10)))
+
+
+async def _run_mode(mode: str, contents: list[str], concurrency: int, workers: int) -> dict:
+    pipeline = None
+    if mode != "inline":
+        pipeline = ProcessingPipeline(services.process_contents, mode=mode, workers=workers)
+        await pipeline.start()
+    loop_lags: list[float] = []
+    latencies: list[float] = []
+
+    async def probe_loop_lag(interval: float = 0.005):
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(interval)
+            loop_lags.append(time.perf_counter() - start - interval)
+
+    async def worker(offset: int):
+        for content in contents[offset::concurrency]:
+            start = time.perf_counter()
+            if pipeline is None:
+                services.process_contents([content])
+            else:
+                await pipeline.submit(content)
+            latencies.append(time.perf_counter() - start)
+            # Cede el control como lo haría una petición real entre pasos
+            await asyncio.sleep(0)
+
+    probe = asyncio.create_task(probe_loop_lag())
+    try:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(offset) for offset in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    finally:
+        probe.cancel()
+        if pipeline is not None:
+            await pipeline.stop()
+    return {
+        "mode": mode,
+        "messages": len(contents),
+        "throughput_msgs_per_s": round(len(contents) / elapsed, 1),
+        "p50_ms": round(statistics.median(latencies) * 1000, 2),
+        "p99_ms": round(_percentile(latencies, 99) * 1000, 2),
+        "loop_lag_p99_ms": round(_percentile(loop_lags or [0.0], 99) * 1000, 2),
+        "loop_lag_max_ms": round(max(loop_lags or [0.0]) * 1000, 2),
+    }
+
+
+async def main(args: argparse.Namespace) -> list[dict]:
+    rng = random.Random(42)
+    # La lista se fija antes de crear los pools: los procesos hijo la heredan
+    services.BANNED_WORDS = {_random_word(rng) for _ in range(args.words)}
+    contents = [
+        " ".join(_random_word(rng) for _ in range(args.message_words)) for _ in range(args.messages)
+    ]
+    services.process_contents(contents[:1])  # compila el filtro fuera de la medición
+    return [await _run_mode(mode, contents, args.concurrency, args.workers) for mode in args.modes]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--message-words", type=int, default=300, help="Palabras por mensaje")
+    parser.add_argument("--words", type=int, default=20_000, help="Tamaño de la lista de palabras prohibidas")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    print(json.dumps(asyncio.run(main(parser.parse_args())), indent=2))
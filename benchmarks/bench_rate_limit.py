@@ -0,0 +1,108 @@
+"""Benchmark del coste por petición de cada backend de limitación de tasa.
+
+Compara el token bucket en memoria, Redis con reservas locales (leases) y
+Redis con un viaje por petición (como hacía ``fastapi_limiter``). Sin
+``--redis-url`` se usa un Redis simulado con la latencia de red indicada:
+
+    python -m benchmarks.bench_rate_limit --requests 20000 --rtt-ms 0.5
+    python -m benchmarks.bench_rate_limit --redis-url redis://localhost:6379/0
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from app.rate_limit import Limit, LocalRateLimitBackend, RedisRateLimitBackend
+
+
+class SimulatedPipeline:
+    def __init__(self, redis: "SimulatedRedis"):
+        self.redis = redis
+        self.commands = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def set(self, key, value, ex=None, nx=False):
+        self.commands.append(("set", key, value, nx))
+
+    def incrby(self, key, amount):
+        self.commands.append(("incrby", key, amount))
+
+    async def execute(self):
+        await asyncio.sleep(self.redis.rtt)
+        results = []
+        for command in self.commands:
+            if command[0] == "set":
+                if not (command[3] and command[1] in self.redis.data):
+                    self.redis.data[command[1]] = command[2]
+                results.append(True)
+            else:
+                self.redis.data[command[1]] = int(self.redis.data.get(command[1], 0)) + command[2]
+                results.append(self.redis.data[command[1]])
+        return results
+
+
+class SimulatedRedis:
+    """Redis en memoria con una latencia fija por ida y vuelta."""
+
+    def __init__(self, rtt: float):
+        self.rtt = rtt
+        self.data: dict = {}
+
+    def pipeline(self, transaction: bool = True):
+        return SimulatedPipeline(self)
+
+
+async def measure(name: str, backend, requests: int, keys: int, concurrency: int) -> dict:
+    # Límite alto para medir el coste de admitir, no el de rechazar
+    limit = Limit(times=requests, seconds=3600)
+    latencies: list[float] = []
+
+    async def worker(offset: int):
+        for i in range(offset, requests, concurrency):
+            start = time.perf_counter()
+            await backend.hit(f"key-{i % keys}", limit)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(offset) for offset in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "backend": name,
+        "requests": requests,
+        "checks_per_second": round(requests / elapsed),
+        "p50_us": round(latencies[len(latencies) // 2] * 1e6, 2),
+        "p99_us": round(latencies[int(len(latencies) * 0.99)] * 1e6, 2),
+        "round_trips": getattr(backend, "round_trips", 0),
+    }
+
+
+async def main(args: argparse.Namespace) -> list[dict]:
+    if args.redis_url:
+        from redis.asyncio import Redis
+
+        redis = Redis.from_url(args.redis_url)
+        await redis.flushdb()
+    else:
+        redis = SimulatedRedis(args.rtt_ms / 1000)
+    results = [await measure("local", LocalRateLimitBackend(), args.requests, args.keys, args.concurrency)]
+    for name, fraction in (("redis_leases", args.lease_fraction), ("redis_per_request", 0)):
+        backend = RedisRateLimitBackend(redis, lease_fraction=fraction, prefix=f"bench:{name}")
+        results.append(await measure(name, backend, args.requests, args.keys, args.concurrency))
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=20_000)
+    parser.add_argument("--keys", type=int, default=100, help="Claves de API / IPs distintas")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--rtt-ms", type=float, default=0.5, help="Latencia del Redis simulado")
+    parser.add_argument("--lease-fraction", type=float, default=0.1)
+    parser.add_argument("--redis-url", help="Medir contra un Redis real")
+    print(json.dumps(asyncio.run(main(parser.parse_args())), indent=2))
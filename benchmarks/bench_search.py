@@ -0,0 +1,97 @@
+"""Benchmark de búsqueda: índice FTS5 frente a ILIKE '%q%'.
+
+Siembra una base SQLite temporal (1M de filas por defecto) y mide la latencia
+de ``crud.search_messages_by_content`` con ambos backends:
+
+    python -m benchmarks.bench_search --rows 1000000
+"""
+import argparse
+import itertools
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+from app import models, search
+from app.models import Base
+
+COMMON_WORDS = (
+    "hola mundo mensaje chat sesión usuario sistema respuesta pregunta ayuda cuenta pago pedido "
+    "envío factura error problema gracias saludo cliente soporte producto precio tienda servicio"
+).split()
+# Términos de frecuencia alta, media y baja, frase, prefijo y sin resultados
+QUERIES = ("hola", "w120", "w4000", '"error pago"', "w12*", "xyzzy")
+
+
+def _vocabulary(size: int = 20_000) -> tuple[list[str], list[float]]:
+    """Vocabulario con distribución de Zipf: pocas palabras muy frecuentes y una cola larga."""
+    words = COMMON_WORDS + [f"w{i}" for i in range(size - len(COMMON_WORDS))]
+    cum_weights = list(itertools.accumulate(1 / rank for rank in range(1, len(words) + 1)))
+    return words, cum_weights
+
+
+def seed(db_path: str, rows: int, seed_value: int = 7, batch: int = 20_000):
+    """Crea la base de datos con ``rows`` mensajes aleatorios."""
+    rng = random.Random(seed_value)
+    words, cum_weights = _vocabulary()
+    engine = create_engine(f"sqlite:///{db_path}")
+    Base.metadata.create_all(bind=engine)
+    start = datetime(2024, 1, 1)
+    with engine.begin() as connection:
+        for offset in range(0, rows, batch):
+            connection.execute(insert(models.Message), [
+                {
+                    "message_id": f"m-{i}",
+                    "session_id": f"s-{i % 5000}",
+                    "content": " ".join(rng.choices(words, cum_weights=cum_weights, k=rng.randint(4, 20))),
+                    "timestamp": start + timedelta(seconds=i),
+                    "sender": "user" if i % 2 else "system",
+                    "word_count": 0,
+                    "character_count": 0,
+                    "processed_at": start,
+                }
+                for i in range(offset, min(rows, offset + batch))
+            ])
+    return engine
+
+
+def _measure(fn, repeat: int) -> dict:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return {"median_ms": round(statistics.median(timings) * 1000, 2), "max_ms": round(max(timings) * 1000, 2)}
+
+
+def run(rows: int, repeat: int = 5, limit: int = 100) -> list[dict]:
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = seed(os.path.join(tmp, "search.db"), rows)
+        Session = sessionmaker(bind=engine)
+        with Session() as db:
+            for query_text in QUERIES:
+                row = {"rows": rows, "query": query_text}
+                for name in ("like", "sqlite"):
+                    backend = search.BACKENDS[name]
+                    row[name] = _measure(
+                        lambda: backend.search(db, query_text, session_id=None, skip=0, limit=limit), repeat
+                    )
+                    row[name]["hits"] = len(backend.search(db, query_text, session_id=None, skip=0, limit=limit))
+                results.append(row)
+        engine.dispose()
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    print(json.dumps(run(args.rows, args.repeat), indent=2))
@@ -0,0 +1,98 @@
+"""Benchmark del coste por fila de serializar una página de mensajes.
+
+Compara el camino anterior (objetos ORM -> schemas.Message -> validación y
+serialización de response_model) con el actual (filas de Core -> JSON con
+pydantic-core) para limit=100 y limit=1000:
+
+    python -m benchmarks.bench_serialization
+"""
+import argparse
+import json
+import time
+from datetime import datetime, timedelta
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+from app import crud, models, schemas, serialization
+from app.models import Base
+
+LIMITS = (100, 1000)
+
+
+def _seed(rows: int):
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(bind=engine)
+    start = datetime(2024, 1, 1)
+    with engine.begin() as connection:
+        connection.execute(insert(models.Message), [
+            {
+                "message_id": f"m-{i}", "session_id": "bench", "content": f"mensaje de prueba número {i}",
+                "timestamp": start + timedelta(seconds=i), "sender": "user", "word_count": 4,
+                "character_count": 27, "processed_at": start,
+            }
+            for i in range(rows)
+        ])
+    return engine
+
+
+def legacy_page(db, limit: int) -> bytes:
+    """Camino anterior: ORM, esquemas construidos a mano y response_model de FastAPI."""
+    db_messages = db.query(models.Message).filter(models.Message.session_id == "bench").limit(limit).all()
+    response = schemas.MessagesResponse(data=[
+        schemas.Message(
+            message_id=msg.message_id, session_id=msg.session_id, content=msg.content,
+            timestamp=msg.timestamp, sender=msg.sender,
+            metadata=schemas.MessageMetadata(
+                word_count=msg.word_count, character_count=msg.character_count, processed_at=msg.processed_at,
+            ),
+        )
+        for msg in db_messages
+    ])
+    # Equivalente a lo que hace FastAPI con response_model: validar de nuevo y codificar
+    validated = _response_adapter.validate_python(response, from_attributes=True)
+    return json.dumps(jsonable_encoder(_response_adapter.dump_python(validated, mode="json"))).encode()
+
+
+def fast_page(db, limit: int) -> bytes:
+    """Camino actual: filas de Core directamente a JSON."""
+    rows = crud.get_messages_by_session(db, "bench", sender=None, limit=limit)
+    return serialization.dumps_messages_page(rows, None)
+
+
+_response_adapter = TypeAdapter(schemas.MessagesResponse)
+
+
+def _per_row_us(fn, db, limit: int, repeat: int) -> float:
+    fn(db, limit)  # calentamiento
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn(db, limit)
+    return (time.perf_counter() - start) / repeat / limit * 1e6
+
+
+def run(limits=LIMITS, repeat: int = 50) -> list[dict]:
+    engine = _seed(max(limits))
+    results = []
+    with sessionmaker(bind=engine)() as db:
+        for limit in limits:
+            legacy = _per_row_us(legacy_page, db, limit, repeat)
+            fast = _per_row_us(fast_page, db, limit, repeat)
+            results.append({
+                "limit": limit,
+                "legacy_us_per_row": round(legacy, 2),
+                "fast_us_per_row": round(fast, 2),
+                "speedup": round(legacy / fast, 1),
+            })
+    engine.dispose()
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--limits", nargs="+", type=int, default=list(LIMITS))
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+    print(json.dumps(run(args.limits, args.repeat), indent=2))
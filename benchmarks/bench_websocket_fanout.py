@@ -0,0 +1,103 @@
+"""Benchmark de la difusión WebSocket con miles de clientes simulados.
+
+Mide cuánto tarda ``broadcast`` en devolver el control (lo que espera el POST)
+y el retraso de entrega por cliente, comparando el envío secuencial anterior
+con el ConnectionManager actual (cola por conexión y tarea escritora):
+
+    python -m benchmarks.bench_websocket_fanout --clients 5000 --messages 20
+"""
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import time
+
+from app.routers.websocket import ConnectionManager
+
+
+class SimulatedClient:
+    """Cliente con latencia de red simulada; registra el retraso de cada mensaje."""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.lags: list[float] = []
+
+    async def send_text(self, message: str):
+        await asyncio.sleep(self.latency)
+        sent_at = float(json.loads(message)["sent_at"])
+        self.lags.append(time.perf_counter() - sent_at)
+
+    async def close(self, code: int = 1000):
+        pass
+
+
+def _clients(count: int, slow_ratio: float, rng: random.Random) -> list[SimulatedClient]:
+    return [
+        SimulatedClient(0.2 if rng.random() < slow_ratio else rng.uniform(0.0001, 0.001))
+        for _ in range(count)
+    ]
+
+
+def _summary(mode: str, broadcast_times: list[float], clients: list[SimulatedClient]) -> dict:
+    lags = sorted(lag for client in clients for lag in client.lags)
+    return {
+        "mode": mode,
+        "clients": len(clients),
+        "broadcast_p50_ms": round(statistics.median(broadcast_times) * 1000, 3),
+        "broadcast_max_ms": round(max(broadcast_times) * 1000, 3),
+        "delivered": len(lags),
+        "lag_p50_ms": round(lags[len(lags) // 2] * 1000, 2) if lags else None,
+        "lag_p99_ms": round(lags[int(len(lags) * 0.99)] * 1000, 2) if lags else None,
+    }
+
+
+async def run_legacy(clients: list[SimulatedClient], messages: int, interval: float) -> dict:
+    """Envío secuencial dentro de broadcast, como hacía la versión anterior."""
+    broadcast_times = []
+    for _ in range(messages):
+        payload = json.dumps({"sent_at": time.perf_counter()})
+        start = time.perf_counter()
+        for client in clients:
+            await client.send_text(payload)
+        broadcast_times.append(time.perf_counter() - start)
+        await asyncio.sleep(interval)
+    return _summary("legacy", broadcast_times, clients)
+
+
+async def run_queued(clients: list[SimulatedClient], messages: int, interval: float) -> dict:
+    manager = ConnectionManager(queue_size=64, policy="drop_oldest")
+    for client in clients:
+        manager.register(client)
+    broadcast_times = []
+    for _ in range(messages):
+        payload = json.dumps({"sent_at": time.perf_counter()})
+        start = time.perf_counter()
+        await manager.broadcast(payload)
+        broadcast_times.append(time.perf_counter() - start)
+        await asyncio.sleep(interval)
+    await asyncio.sleep(0.5)  # deja terminar las entregas pendientes
+    for client in clients:
+        manager.disconnect(client)
+    result = _summary("queued", broadcast_times, clients)
+    result["dropped"] = manager.dropped
+    return result
+
+
+async def main(args: argparse.Namespace) -> list[dict]:
+    results = []
+    for mode, runner in (("legacy", run_legacy), ("queued", run_queued)):
+        if mode in args.modes:
+            clients = _clients(args.clients, args.slow_ratio, random.Random(1))
+            results.append(await runner(clients, args.messages, args.interval))
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--clients", type=int, default=2000)
+    parser.add_argument("--messages", type=int, default=10)
+    parser.add_argument("--interval", type=float, default=0.01, help="Segundos entre mensajes")
+    parser.add_argument("--slow-ratio", type=float, default=0.01, help="Fracción de clientes lentos (200 ms)")
+    parser.add_argument("--modes", nargs="+", choices=("legacy", "queued"), default=["legacy", "queued"])
+    print(json.dumps(asyncio.run(main(parser.parse_args())), indent=2))
@@ -0,0 +1,56 @@
+"""Compara dos resultados de ``benchmarks.suite`` y marca las regresiones.
+
+Las métricas en ``_ms``/``_us`` empeoran al subir y las de ``_rps`` al bajar;
+un cambio peor que el umbral cuenta como regresión y el proceso sale con
+código 1:
+
+    python -m benchmarks.compare base.json head.json --threshold 0.15
+"""
+import argparse
+import json
+import sys
+
+LOWER_IS_BETTER = ("_ms", "_us")
+HIGHER_IS_BETTER = ("_rps",)
+
+
+def compare(before: dict, after: dict, threshold: float) -> list[dict]:
+    rows = []
+    for scenario, metrics in after["results"].items():
+        previous = before["results"].get(scenario, {})
+        for metric, value in metrics.items():
+            old = previous.get(metric)
+            if not isinstance(value, (int, float)) or not isinstance(old, (int, float)) or not old:
+                continue
+            change = (value - old) / old
+            if metric.endswith(LOWER_IS_BETTER):
+                worse = change
+            elif metric.endswith(HIGHER_IS_BETTER):
+                worse = -change
+            else:
+                continue
+            rows.append({
+                "scenario": scenario,
+                "metric": metric,
+                "before": old,
+                "after": value,
+                "change_pct": round(change * 100, 1),
+                "regression": worse > threshold,
+            })
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("before")
+    parser.add_argument("after")
+    parser.add_argument("--threshold", type=float, default=0.1, help="Empeoramiento relativo tolerado")
+    parser.add_argument("--regressions-only", action="store_true", help="Mostrar solo las regresiones")
+    args = parser.parse_args()
+    with open(args.before, encoding="utf-8") as fh:
+        before = json.load(fh)
+    with open(args.after, encoding="utf-8") as fh:
+        after = json.load(fh)
+    rows = compare(before, after, args.threshold)
+    print(json.dumps([row for row in rows if row["regression"]] if args.regressions_only else rows, indent=2))
+    sys.exit(1 if any(row["regression"] for row in rows) else 0)
@@ -0,0 +1,132 @@
+"""Redis en memoria para los benchmarks: implementa solo los comandos que usa la app.
+
+Cubre la caché del historial (GET/SET/INCR/EXPIRE), las reservas
+del limitador de tasa (SET NX/INCRBY) y el pub/sub de la difusión. Cada
+comando cede el control al event loop y puede simular la latencia de red con
+``rtt``; no aplica caducidades.
+"""
+import asyncio
+
+
+class FakePipeline:
+    def __init__(self, redis: "FakeRedis"):
+        self.redis = redis
+        self.commands: list[tuple] = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def __getattr__(self, name):
+        # Los comandos se encolan y se ejecutan juntos en un solo viaje
+        def queue(*args, **kwargs):
+            self.commands.append((name, args, kwargs))
+            return self
+        return queue
+
+    async def execute(self):
+        await self.redis._round_trip()
+        results = [getattr(self.redis, f"_{name}")(*args, **kwargs) for name, args, kwargs in self.commands]
+        self.commands.clear()
+        return results
+
+
+class FakePubSub:
+    def __init__(self, redis: "FakeRedis"):
+        self.redis = redis
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.channels: set[str] = set()
+
+    async def subscribe(self, channel: str):
+        self.channels.add(channel)
+        self.redis.subscribers.setdefault(channel, []).append(self)
+
+    async def get_message(self, ignore_subscribe_messages: bool = False, timeout: float = 0):
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    async def close(self):
+        for channel in self.channels:
+            self.redis.subscribers[channel].remove(self)
+        self.channels.clear()
+
+
+class FakeRedis:
+    def __init__(self, rtt: float = 0):
+        self.rtt = rtt
+        self.data: dict = {}
+        self.subscribers: dict[str, list[FakePubSub]] = {}
+        self.round_trips = 0
+
+    async def _round_trip(self):
+        self.round_trips += 1
+        await asyncio.sleep(self.rtt)
+
+    def pipeline(self, transaction: bool = True):
+        return FakePipeline(self)
+
+    def pubsub(self):
+        return FakePubSub(self)
+
+    async def get(self, key):
+        await self._round_trip()
+        return self._get(key)
+
+    async def set(self, key, value, ex=None, nx=False):
+        await self._round_trip()
+        return self._set(key, value, ex=ex, nx=nx)
+
+    async def smembers(self, key):
+        await self._round_trip()
+        return set(self.data.get(key, ()))
+
+    async def delete(self, *keys):
+        await self._round_trip()
+        return self._delete(*keys)
+
+    async def publish(self, channel: str, data: str):
+        await self._round_trip()
+        subscribers = self.subscribers.get(channel, [])
+        for pubsub in subscribers:
+            pubsub.queue.put_nowait({"type": "message", "channel": channel, "data": data})
+        return len(subscribers)
+
+    async def close(self):
+        pass
+
+    def flushall(self):
+        self.data.clear()
+
+    # Implementación síncrona de cada comando, compartida con los pipelines
+
+    def _get(self, key):
+        return self.data.get(key)
+
+    def _set(self, key, value, ex=None, nx=False):
+        if nx and key in self.data:
+            return None
+        self.data[key] = value
+        return True
+
+    def _sadd(self, key, *members):
+        values = self.data.setdefault(key, set())
+        before = len(values)
+        values.update(members)
+        return len(values) - before
+
+    def _expire(self, key, seconds):
+        return key in self.data
+
+    def _incr(self, key):
+        return self._incrby(key, 1)
+
+    def _incrby(self, key, amount):
+        self.data[key] = int(self.data.get(key, 0)) + amount
+        return self.data[key]
+
+    def _delete(self, *keys):
+        return sum(self.data.pop(key, None) is not None for key in keys)
@@ -0,0 +1,144 @@
+"""Prueba de carga de POST /api/messages/ con peticiones concurrentes.
+
+Compara el comportamiento anterior (commit bloqueante dentro del event loop)
+con la sesión síncrona en threadpool, la sesión asíncrona y la escritura
+agrupada en lotes (group commit):
+
+    python -m benchmarks.load_create_messages --requests 2000 --concurrency 50
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import tempfile
+import time
+from datetime import datetime
+
+import httpx
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import services, write_queue
+from app.dependencies import get_async_db, get_db, rate_limit_dependency
+from app.main import app
+from app.models import Base
+
+API_KEY = "my-super-secret-key"
+MODES = ("blocking", "sync", "async", "batched")
+
+
+def _percentile(values: list[float], pct: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def _run_mode(mode: str, total: int, concurrency: int, db_path: str) -> dict:
+    url = f"sqlite:///{db_path}"
+    # Pool dimensionado a la concurrencia: en modo bloqueante una espera del pool congelaría el loop
+    sync_engine = create_engine(
+        url, connect_args={"check_same_thread": False}, pool_size=concurrency, max_overflow=concurrency
+    )
+    Base.metadata.create_all(bind=sync_engine)
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{db_path}")
+    sync_factory = sessionmaker(autoflush=False, bind=sync_engine)
+    async_factory = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+
+    def override_sync():
+        db = sync_factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    async def override_async():
+        async with async_factory() as db:
+            yield db
+
+    override = override_async if mode in ("async", "batched") else override_sync
+    app.dependency_overrides[get_db] = override
+    app.dependency_overrides[get_async_db] = override
+    app.dependency_overrides[rate_limit_dependency] = lambda: None
+
+    original_run_db = services.run_db
+    if mode == "blocking":
+        # Reproduce el comportamiento previo: la llamada CRUD se ejecuta en el event loop
+        async def blocking_run_db(db, fn, *args, **kwargs):
+            return fn(db, *args, **kwargs)
+        services.run_db = blocking_run_db
+
+    if mode == "batched":
+        write_queue.write_queue = write_queue.MessageWriteQueue(async_factory)
+        await write_queue.write_queue.start()
+
+    latencies: list[float] = []
+    loop_lags: list[float] = []
+    semaphore = asyncio.Semaphore(concurrency)
+    transport = httpx.ASGITransport(app=app)
+
+    async def send(client: httpx.AsyncClient, index: int):
+        payload = {
+            "message_id": f"load-{mode}-{index}",
+            "session_id": f"load-session-{index % 50}",
+            "content": "Mensaje de carga con algo de texto para filtrar",
+            "timestamp": datetime.utcnow().isoformat(),
+            "sender": "user",
+        }
+        async with semaphore:
+            start = time.perf_counter()
+            response = await client.post("/api/messages/", json=payload, headers={"X-API-Key": API_KEY})
+            latencies.append(time.perf_counter() - start)
+            response.raise_for_status()
+
+    async def probe_loop_lag(interval: float = 0.005):
+        # Mide cuánto se retrasa el event loop respecto a un sleep fijo (lo que sufrirían los WebSockets)
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(interval)
+            loop_lags.append(time.perf_counter() - start - interval)
+
+    probe = asyncio.create_task(probe_loop_lag())
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            started = time.perf_counter()
+            await asyncio.gather(*(send(client, i) for i in range(total)))
+            elapsed = time.perf_counter() - started
+    finally:
+        probe.cancel()
+        if write_queue.write_queue is not None:
+            await write_queue.write_queue.stop()
+            write_queue.write_queue = None
+        services.run_db = original_run_db
+        app.dependency_overrides.clear()
+        await async_engine.dispose()
+        sync_engine.dispose()
+
+    return {
+        "mode": mode,
+        "requests": total,
+        "concurrency": concurrency,
+        "throughput_rps": round(total / elapsed, 1),
+        "p50_ms": round(statistics.median(latencies) * 1000, 2),
+        "p99_ms": round(_percentile(latencies, 99) * 1000, 2),
+        "loop_lag_p99_ms": round(_percentile(loop_lags or [0.0], 99) * 1000, 2),
+        "loop_lag_max_ms": round(max(loop_lags or [0.0]) * 1000, 2),
+    }
+
+
+async def main(args: argparse.Namespace) -> list[dict]:
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode in args.modes:
+            db_path = os.path.join(tmp, f"{mode}.db")
+            results.append(await _run_mode(mode, args.requests, args.concurrency, db_path))
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    print(json.dumps(asyncio.run(main(parser.parse_args())), indent=2))
@@ -0,0 +1,308 @@
+"""Suite de benchmarks de la API para detectar regresiones de rendimiento.
+
+Ejecuta la aplicación en el propio proceso (``httpx.ASGITransport``, sin
+servidor ni red) sobre una base SQLite temporal, con un Redis simulado para
+la caché del historial y la difusión por pub/sub. Mide:
+
+- ``create``: POST /api/messages/ concurrentes.
+- ``read_limit_<n>``: lectura del historial de una sesión con y sin caché.
+- ``search_<filas>``: búsqueda sobre bases sembradas de 10k (y 1M con ``--full``).
+- ``filter_<palabras>_<mensaje>``: coste del filtro de palabras prohibidas.
+- ``auth_<claves>``: coste de validar la clave de API según el número de claves.
+- ``ws_fanout``: difusión de cada POST a clientes WebSocket simulados.
+
+El resultado es un JSON con claves estables que puede compararse entre
+commits con ``benchmarks.compare``:
+
+    python -m benchmarks.suite --output base.json
+    python -m benchmarks.suite --output head.json
+    python -m benchmarks.compare base.json head.json
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import statistics
+import subprocess
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import httpx
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import broadcast, cache, crud, schemas
+from app.database import engine_options, register_sqlite_pragmas, to_async_url
+from app.dependencies import get_async_db, get_db, get_session_factory, rate_limit_dependency
+from app.main import app
+from app.models import Base
+from app.routers.websocket import manager
+from benchmarks import bench_auth, bench_filter, bench_search
+from benchmarks.fake_redis import FakeRedis
+
+API_KEY = "my-super-secret-key"
+HEADERS = {"X-API-Key": API_KEY}
+PAGE_SIZES = (10, 100, 1000)
+# Nombre estable de cada consulta de bench_search.QUERIES en las claves del resultado
+SEARCH_LABELS = ("frequent", "medium", "rare", "phrase", "prefix", "no_hits")
+
+
+def _percentile(values: list[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def _latency(prefix: str, timings: list[float]) -> dict:
+    return {
+        f"{prefix}p50_ms": round(statistics.median(timings) * 1000, 3),
+        f"{prefix}p99_ms": round(_percentile(timings, 99) * 1000, 3),
+    }
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+@contextlib.asynccontextmanager
+async def bench_client(db_path: str, redis: FakeRedis):
+    """Cliente ASGI contra la app con la BD indicada y el Redis simulado.
+
+    Los engines se crean con las mismas opciones y PRAGMAs que los de la
+    aplicación; el limitador de tasa se desactiva para no medir rechazos.
+    """
+    url = f"sqlite:///{db_path}"
+    sync_engine = create_engine(url, **engine_options(url))
+    async_engine = create_async_engine(to_async_url(url), **engine_options(url, is_async=True))
+    register_sqlite_pragmas(sync_engine)
+    register_sqlite_pragmas(async_engine)
+    Base.metadata.create_all(bind=sync_engine)
+    sync_factory = sessionmaker(autoflush=False, bind=sync_engine)
+    async_factory = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+
+    def override_sync():
+        with sync_factory() as db:
+            yield db
+
+    async def override_async():
+        async with async_factory() as db:
+            yield db
+
+    previous_overrides = dict(app.dependency_overrides)
+    app.dependency_overrides[get_db] = override_sync
+    app.dependency_overrides[get_async_db] = override_async
+    app.dependency_overrides[get_session_factory] = lambda: async_factory
+    app.dependency_overrides[rate_limit_dependency] = lambda: None
+    # Caché propia de la ejecución, con Redis como segundo nivel (sin heredar entradas ni contadores)
+    previous_broadcaster, previous_cache, previous_enabled = broadcast.broadcaster, cache.history_cache, cache.CACHE_ENABLED
+    cache.history_cache = cache.SessionHistoryCache(redis=redis, dumps=previous_cache.dumps, loads=previous_cache.loads)
+    cache.CACHE_ENABLED = True
+    broadcast.broadcaster = broadcast.RedisBroadcast(redis, manager.broadcast)
+    await broadcast.broadcaster.start()
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+            yield client, sync_factory
+    finally:
+        await broadcast.broadcaster.stop()
+        broadcast.broadcaster, cache.history_cache = previous_broadcaster, previous_cache
+        cache.CACHE_ENABLED = previous_enabled
+        manager.replay.clear()
+        app.dependency_overrides.clear()
+        app.dependency_overrides.update(previous_overrides)
+        await async_engine.dispose()
+        sync_engine.dispose()
+
+
+def _payload(message_id: str, session_id: str, index: int) -> dict:
+    return {
+        "message_id": message_id,
+        "session_id": session_id,
+        "content": f"Mensaje de prueba número {index} con algo de texto para filtrar",
+        "timestamp": (datetime(2024, 1, 1) + timedelta(seconds=index)).isoformat(),
+        "sender": "user" if index % 2 else "system",
+    }
+
+
+async def bench_create(client: httpx.AsyncClient, total: int, concurrency: int) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    timings: list[float] = []
+
+    async def send(index: int):
+        async with semaphore:
+            start = time.perf_counter()
+            response = await client.post(
+                "/api/messages/", json=_payload(f"create-{index}", f"create-{index % 50}", index), headers=HEADERS
+            )
+            timings.append(time.perf_counter() - start)
+            response.raise_for_status()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(send(i) for i in range(total)))
+    elapsed = time.perf_counter() - started
+    return {"requests": total, "concurrency": concurrency, "throughput_rps": round(total / elapsed, 1),
+            **_latency("", timings)}
+
+
+def seed_session(sync_factory, session_id: str, rows: int):
+    """Guarda ``rows`` mensajes en una sesión directamente con el CRUD."""
+    metadata = schemas.MessageMetadata(word_count=10, character_count=60)
+    items = [
+        (schemas.MessageCreate(**_payload(f"{session_id}-{i}", session_id, i)), metadata)
+        for i in range(rows)
+    ]
+    with sync_factory() as db:
+        crud.create_messages(db, items)
+
+
+async def bench_read(client: httpx.AsyncClient, redis: FakeRedis, session_id: str, repeat: int) -> dict:
+    results = {}
+    for limit in PAGE_SIZES:
+        url = f"/api/messages/{session_id}?limit={limit}"
+        uncached, cached = [], []
+        for _ in range(repeat):
+            cache.history_cache.clear()
+            redis.flushall()
+            start = time.perf_counter()
+            response = await client.get(url, headers=HEADERS)
+            uncached.append(time.perf_counter() - start)
+            response.raise_for_status()
+            start = time.perf_counter()
+            response = await client.get(url, headers=HEADERS)
+            cached.append(time.perf_counter() - start)
+        results[f"read_limit_{limit}"] = {
+            "rows": len(response.json()["data"]), **_latency("uncached_", uncached), **_latency("cached_", cached),
+        }
+    return results
+
+
+async def bench_search_api(client: httpx.AsyncClient, rows: int, repeat: int) -> dict:
+    result = {"rows": rows}
+    for label, query_text in zip(SEARCH_LABELS, bench_search.QUERIES):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            response = await client.get("/api/messages/search", params={"query": query_text}, headers=HEADERS)
+            timings.append(time.perf_counter() - start)
+            response.raise_for_status()
+        result[f"{label}_p50_ms"] = round(statistics.median(timings) * 1000, 3)
+    return result
+
+
+class FanoutClient:
+    """WebSocket simulado: anota cuándo recibe cada mensaje."""
+
+    def __init__(self):
+        self.received: list[tuple[str, float]] = []
+
+    async def send_text(self, message: str):
+        self.received.append((message, time.perf_counter()))
+
+    async def close(self, code: int = 1000):
+        pass
+
+
+async def bench_ws_fanout(client: httpx.AsyncClient, clients: int, messages: int) -> dict:
+    sockets = [FanoutClient() for _ in range(clients)]
+    for socket in sockets:
+        manager.register(socket)
+    sent_at: dict[str, float] = {}
+    post_timings = []
+    try:
+        for index in range(messages):
+            message_id = f"fanout-{index}"
+            start = sent_at[message_id] = time.perf_counter()
+            response = await client.post("/api/messages/", json=_payload(message_id, "fanout", index), headers=HEADERS)
+            post_timings.append(time.perf_counter() - start)
+            response.raise_for_status()
+        # Espera a que el lote de Redis y las colas de envío se vacíen
+        deadline = time.perf_counter() + 5
+        while sum(len(s.received) for s in sockets) < clients * messages and time.perf_counter() < deadline:
+            await asyncio.sleep(0.005)
+    finally:
+        for socket in sockets:
+            manager.disconnect(socket)
+    lags = [
+        received_at - sent_at[json.loads(message)["message_id"]]
+        for socket in sockets for message, received_at in socket.received
+    ]
+    return {
+        "clients": clients,
+        "messages": messages,
+        "delivered": len(lags),
+        **_latency("post_", post_timings),
+        **_latency("delivery_", lags or [0.0]),
+    }
+
+
+def bench_filters(budget: float) -> dict:
+    return {
+        f"filter_{row['words']}_{row['message']}": {"compiled_us": row["compiled_us"]}
+        for row in bench_filter.run(budget=budget)
+    }
+
+
+def bench_auth_keys(budget: float) -> dict:
+    return {
+        f"auth_{row['keys']}": {name: value for name, value in row.items() if name.endswith("_us")}
+        for row in bench_auth.run(key_counts=(1, 10_000), budget=budget)
+        if row["store"] == "cache"
+    }
+
+
+async def main(args: argparse.Namespace) -> dict:
+    results: dict = {}
+    redis = FakeRedis(rtt=args.redis_rtt_ms / 1000)
+    with tempfile.TemporaryDirectory() as tmp:
+        async with bench_client(os.path.join(tmp, "api.db"), redis) as (client, sync_factory):
+            results["create"] = await bench_create(client, args.requests, args.concurrency)
+            seed_session(sync_factory, "read", args.read_rows)
+            results.update(await bench_read(client, redis, "read", args.repeat))
+            results["ws_fanout"] = await bench_ws_fanout(client, args.ws_clients, args.ws_messages)
+        for rows in args.search_rows:
+            db_path = os.path.join(tmp, f"search-{rows}.db")
+            bench_search.seed(db_path, rows).dispose()
+            async with bench_client(db_path, redis) as (client, _):
+                results[f"search_{rows}"] = await bench_search_api(client, rows, args.repeat)
+    results.update(bench_filters(args.filter_budget))
+    results.update(bench_auth_keys(args.filter_budget))
+    params = {name: value for name, value in vars(args).items() if name != "output"}
+    return {
+        "meta": {"commit": _git_commit(), "python": platform.python_version(), "params": params},
+        "results": results,
+    }
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=500, help="POST del escenario create")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--read-rows", type=int, default=5000, help="Mensajes de la sesión leída")
+    parser.add_argument("--repeat", type=int, default=20, help="Repeticiones de cada lectura y búsqueda")
+    parser.add_argument("--search-rows", nargs="+", type=int, default=[10_000])
+    parser.add_argument("--full", action="store_true", help="Añade la búsqueda sobre 1M de filas")
+    parser.add_argument("--ws-clients", type=int, default=1000)
+    parser.add_argument("--ws-messages", type=int, default=20)
+    parser.add_argument("--filter-budget", type=float, default=0.2, help="Segundos por medición del filtro y de la autenticación")
+    parser.add_argument("--redis-rtt-ms", type=float, default=0, help="Latencia simulada de Redis")
+    parser.add_argument("--output", help="Fichero JSON de salida (por defecto, la salida estándar)")
+    return parser
+
+
+if __name__ == "__main__":
+    args = build_parser().parse_args()
+    if args.full and 1_000_000 not in args.search_rows:
+        args.search_rows.append(1_000_000)
+    report = json.dumps(asyncio.run(main(args)), indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fh:
+            fh.write(report + "\n")
+    else:
+        print(report)
@@ -5,8 +5,11 @@ from sqlalchemy.orm import sessionmaker
 from sqlalchemy.pool import StaticPool
 
 from app.main import app
+from app.cache import history_cache
+from app.idempotency import recent_messages
 from app.database import Base
-from app.dependencies import get_db
+from app.dependencies import get_db, get_async_db, get_session_factory, rate_limit_dependency
+from app.routers.websocket import manager
 
 # Configuración de la base de datos de prueba en memoria
 SQLALCHEMY_DATABASE_URL = "sqlite:///:memory:"
@@ -18,6 +21,20 @@ engine = create_engine(
 )
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# La caché del historial, los mensajes recientes, el buffer de reenvío WebSocket y el limitador de tasa son
+# globales: se vacían para que no se filtre estado entre pruebas
+@pytest.fixture(autouse=True)
+def clear_history_cache():
+    history_cache.clear()
+    recent_messages.clear()
+    manager.replay.clear()
+    rate_limit_dependency.reset()
+    yield
+    history_cache.clear()
+    recent_messages.clear()
+    manager.replay.clear()
+    rate_limit_dependency.reset()
+
 # Fixture para crear y destruir las tablas en cada prueba
 @pytest.fixture(scope="function")
 def db_session():
@@ -38,6 +55,11 @@ def client(db_session):
         finally:
             db_session.close()
 
+    # La sesión síncrona de prueba sirve tanto para el modo síncrono como el asíncrono
     app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_async_db] = override_get_db
+    app.dependency_overrides[get_session_factory] = lambda: TestingSessionLocal
     yield TestClient(app)
     del app.dependency_overrides[get_db]
+    del app.dependency_overrides[get_async_db]
+    del app.dependency_overrides[get_session_factory]
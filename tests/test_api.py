@@ -1,3 +1,4 @@
+import json
 from fastapi.testclient import TestClient
 from datetime import datetime
 
@@ -143,3 +144,218 @@ def test_validation_error_handler(client: TestClient):
     assert data["error"]["code"] == "INVALID_FORMAT"
     assert "Error de validación en el campo 'timestamp'" in data["error"]["message"]
     assert "Input should be a valid datetime or date, invalid character in year" in data["error"]["details"]
+
+# --- Pruebas para el endpoint POST /api/messages/bulk ---
+
+def test_bulk_create_messages_json_array(client: TestClient):
+    """Prueba la ingesta masiva con un array JSON, duplicados y elementos inválidos."""
+    timestamp = datetime.utcnow().isoformat() + "Z"
+    client.post("/api/messages/", headers=HEADERS, json={"message_id": "bulk-0", "session_id": "sb", "content": "previo", "timestamp": timestamp, "sender": "user"})
+    payload = [
+        {"message_id": "bulk-0", "session_id": "sb", "content": "ya existe", "timestamp": timestamp, "sender": "user"},
+        {"message_id": "bulk-1", "session_id": "sb", "content": "palabra prohibida", "timestamp": timestamp, "sender": "user"},
+        {"message_id": "bulk-1", "session_id": "sb", "content": "repetido", "timestamp": timestamp, "sender": "user"},
+        {"message_id": "bulk-2", "session_id": "sb", "content": "x", "timestamp": timestamp, "sender": "bot"},
+    ]
+    response = client.post("/api/messages/bulk", headers=HEADERS, json=payload)
+    assert response.status_code == 200
+    data = response.json()["data"]
+    assert (data["received"], data["created"], data["duplicates"], data["invalid"]) == (4, 1, 2, 1)
+    assert [item["status"] for item in data["items"]] == ["duplicate", "created", "duplicate", "invalid"]
+
+    messages = client.get("/api/messages/sb", headers=HEADERS).json()["data"]
+    assert len(messages) == 2
+
+def test_bulk_create_messages_ndjson(client: TestClient):
+    """Prueba la ingesta masiva de un cuerpo NDJSON enviado por fragmentos."""
+    timestamp = datetime.utcnow().isoformat() + "Z"
+    lines = [
+        f'{{"message_id": "nd-{i}", "session_id": "snd", "content": "linea {i}", "timestamp": "{timestamp}", "sender": "system"}}\n'
+        for i in range(3)
+    ] + ["{no es json}\n"]
+
+    def body():
+        for line in lines:
+            yield line.encode()
+
+    response = client.post(
+        "/api/messages/bulk?report=errors",
+        headers={**HEADERS, "Content-Type": "application/x-ndjson"},
+        content=body(),
+    )
+    assert response.status_code == 200
+    data = response.json()["data"]
+    assert data["created"] == 3
+    assert [item["index"] for item in data["items"]] == [3]
+
+def test_bulk_create_messages_invalid_body(client: TestClient):
+    """Prueba que un cuerpo que no es un array JSON se rechaza."""
+    response = client.post("/api/messages/bulk", headers=HEADERS, content=b'{"message_id": "x"}')
+    assert response.status_code == 400
+    assert response.json()["error"]["code"] == "INVALID_FORMAT"
+
+def test_bulk_syntax_error_keeps_earlier_chunks(client: TestClient):
+    """Prueba que un error de sintaxis tras el primer bloque se informa como tal, con el resultado parcial."""
+    timestamp = datetime.utcnow().isoformat() + "Z"
+    items = [
+        json.dumps({"message_id": f"chunk-{i}", "session_id": "sc", "content": "hola", "timestamp": timestamp, "sender": "user"})
+        for i in range(1001)
+    ]
+    response = client.post("/api/messages/bulk?report=errors", headers=HEADERS, content=f"[{','.join(items)},{{oops}}]".encode())
+    assert response.status_code == 400
+    body = response.json()
+    assert body["error"]["code"] == "INVALID_FORMAT"
+    assert body["error"]["details"].startswith("JSON inválido en el elemento 1001")
+    assert body["data"]["received"] == 1001
+    assert body["data"]["created"] == 1001
+    assert client.get("/api/messages/sc/stats", headers=HEADERS).json()["data"]["message_count"] == 1001
+
+    truncated = client.post("/api/messages/bulk", headers=HEADERS, content=b'[{"message_id": "cut"')
+    assert truncated.json()["error"]["details"] == "Array JSON incompleto"
+    assert truncated.json()["data"]["received"] == 0
+
+def test_search_messages_phrase_prefix_and_session(client: TestClient):
+    """Prueba la búsqueda por frase exacta, por prefijo y filtrada por sesión."""
+    timestamp = datetime.utcnow().isoformat() + "Z"
+    client.post("/api/messages/", headers=HEADERS, json={"message_id": "fts-1", "session_id": "f1", "content": "El gato negro duerme", "timestamp": timestamp, "sender": "user"})
+    client.post("/api/messages/", headers=HEADERS, json={"message_id": "fts-2", "session_id": "f1", "content": "Negro es el gato", "timestamp": timestamp, "sender": "user"})
+    client.post("/api/messages/", headers=HEADERS, json={"message_id": "fts-3", "session_id": "f2", "content": "Los gatitos juegan", "timestamp": timestamp, "sender": "user"})
+
+    phrase = client.get('/api/messages/search?query="gato negro"', headers=HEADERS).json()["data"]
+    assert [msg["message_id"] for msg in phrase] == ["fts-1"]
+
+    prefix = client.get("/api/messages/search?query=gat*", headers=HEADERS).json()["data"]
+    assert {msg["message_id"] for msg in prefix} == {"fts-1", "fts-2", "fts-3"}
+
+    scoped = client.get("/api/messages/search?query=gat*&session_id=f2", headers=HEADERS).json()["data"]
+    assert [msg["message_id"] for msg in scoped] == ["fts-3"]
+
+# --- Pruebas de paginación por cursor ---
+
+def test_read_messages_cursor_pagination(client: TestClient):
+    """Prueba que el cursor recorre la sesión en orden sin repetir ni saltar mensajes."""
+    for i in range(5):
+        client.post("/api/messages/", headers=HEADERS, json={"message_id": f"cur-{i}", "session_id": "sc", "content": f"{i}", "timestamp": f"2024-01-01T00:00:0{4 - i}Z", "sender": "user"})
+
+    seen, cursor = [], None
+    while True:
+        url = "/api/messages/sc?limit=2" + (f"&cursor={cursor}" if cursor else "")
+        body = client.get(url, headers=HEADERS).json()
+        seen += [msg["message_id"] for msg in body["data"]]
+        cursor = body["next_cursor"]
+        if not cursor:
+            break
+    assert seen == [f"cur-{i}" for i in reversed(range(5))]
+
+def test_search_messages_cursor_pagination(client: TestClient):
+    """Prueba la paginación por cursor de la búsqueda."""
+    for i in range(3):
+        client.post("/api/messages/", headers=HEADERS, json={"message_id": f"scur-{i}", "session_id": "ss", "content": "texto paginado", "timestamp": datetime.utcnow().isoformat() + "Z", "sender": "user"})
+
+    first = client.get("/api/messages/search?query=paginado&limit=2", headers=HEADERS).json()
+    second = client.get(f"/api/messages/search?query=paginado&limit=2&cursor={first['next_cursor']}", headers=HEADERS).json()
+    ids = [msg["message_id"] for msg in first["data"] + second["data"]]
+    assert sorted(ids) == ["scur-0", "scur-1", "scur-2"]
+    assert second["next_cursor"] is None
+
+def test_invalid_cursor(client: TestClient):
+    """Prueba que un cursor manipulado devuelve un error 400."""
+    response = client.get("/api/messages/sc?cursor=no-es-un-cursor", headers=HEADERS)
+    assert response.status_code == 400
+    assert response.json()["error"]["code"] == "INVALID_CURSOR"
+
+# --- Pruebas del WebSocket ---
+
+def test_websocket_resume_backfill(client: TestClient):
+    """Prueba que al reconectar se reciben los mensajes perdidos, del buffer y de la BD."""
+    from app.routers.websocket import manager
+
+    for i in range(3):
+        client.post("/api/messages/", headers=HEADERS, json={"message_id": f"ws-{i}", "session_id": "ws-s", "content": f"{i}", "timestamp": f"2024-01-01T00:00:0{i}Z", "sender": "user"})
+
+    def resume():
+        with client.websocket_connect("/ws/ws/messages") as websocket:
+            websocket.send_text('{"action": "subscribe", "session_id": "ws-s", "last_message_id": "ws-0"}')
+            assert websocket.receive_json()["status"] == "ok"
+            return websocket.receive_json()
+
+    backfill = resume()
+    assert backfill["source"] == "buffer"
+    assert [msg["message_id"] for msg in backfill["messages"]] == ["ws-1", "ws-2"]
+
+    # Sin buffer (p. ej. tras un despliegue) se recurre a la base de datos
+    manager.replay.clear()
+    backfill = resume()
+    assert backfill["source"] == "database"
+    assert [msg["message_id"] for msg in backfill["messages"]] == ["ws-1", "ws-2"]
+    assert backfill["next_cursor"] is None
+
+    # Los mensajes de la ingesta masiva no pasan por el buffer: tras ella el backfill se lee de la BD
+    resume()
+    client.post("/api/messages/", headers=HEADERS, json={"message_id": "ws-3", "session_id": "ws-s", "content": "3", "timestamp": "2024-01-01T00:00:03Z", "sender": "user"})
+    client.post("/api/messages/bulk", headers=HEADERS, json=[{"message_id": "ws-bulk", "session_id": "ws-s", "content": "b", "timestamp": "2024-01-01T00:00:04Z", "sender": "user"}])
+    backfill = resume()
+    assert backfill["source"] == "database"
+    assert [msg["message_id"] for msg in backfill["messages"]] == ["ws-1", "ws-2", "ws-3", "ws-bulk"]
+
+def test_websocket_backfill_failure_keeps_connection(client: TestClient, monkeypatch):
+    """Prueba que un backfill que falla en la BD responde con un error sin cerrar la conexión."""
+    from app import services
+    from app.routers.websocket import manager
+
+    async def failing_backfill(*args, **kwargs):
+        raise RuntimeError("base de datos no disponible")
+
+    monkeypatch.setattr(services, "get_backfill", failing_backfill)
+    errors = manager.backfill_errors
+    with client.websocket_connect("/ws/ws/messages") as websocket:
+        websocket.send_text('{"action": "subscribe", "session_id": "ws-f", "last_message_id": "ws-0"}')
+        assert websocket.receive_json()["status"] == "ok"
+        error = websocket.receive_json()
+        assert error["status"] == "error" and error["action"] == "subscribe"
+        websocket.send_text('{"action": "unsubscribe", "session_id": "ws-f"}')
+        assert websocket.receive_json()["status"] == "ok"
+    assert manager.stats()["backfill_errors"] == errors + 1
+    assert manager.active_connections == {}
+
+def test_session_stats(client: TestClient):
+    """Prueba que los agregados de la sesión se mantienen con altas individuales y masivas."""
+    client.post("/api/messages/", headers=HEADERS, json={"message_id": "st-1", "session_id": "st", "content": "hola mundo", "timestamp": "2024-01-01T10:00:00Z", "sender": "user"})
+    payload = [
+        {"message_id": "st-2", "session_id": "st", "content": "respuesta del sistema", "timestamp": "2024-01-01T09:00:00Z", "sender": "system"},
+        {"message_id": "st-3", "session_id": "st", "content": "adiós", "timestamp": "2024-01-01T11:00:00Z", "sender": "user"},
+        {"message_id": "st-1", "session_id": "st", "content": "duplicado", "timestamp": "2024-01-01T12:00:00Z", "sender": "user"},
+    ]
+    client.post("/api/messages/bulk", headers=HEADERS, json=payload)
+
+    response = client.get("/api/messages/st/stats", headers=HEADERS)
+    assert response.status_code == 200
+    data = response.json()["data"]
+    assert data["message_count"] == 3
+    assert data["word_count"] == 6
+    assert data["first_timestamp"] == "2024-01-01T09:00:00"
+    assert data["last_timestamp"] == "2024-01-01T11:00:00"
+    assert data["senders"]["user"]["message_count"] == 2
+    assert data["senders"]["system"]["word_count"] == 3
+
+    empty = client.get("/api/messages/otra/stats", headers=HEADERS).json()["data"]
+    assert empty["message_count"] == 0 and empty["senders"] == {}
+
+def test_export_session_ndjson_and_csv(client: TestClient):
+    """Prueba la exportación de la sesión completa en NDJSON, CSV y con gzip."""
+    import csv
+    import io
+    import json
+
+    for i in range(3):
+        client.post("/api/messages/", headers=HEADERS, json={"message_id": f"ex-{i}", "session_id": "ex", "content": f"texto, {i}", "timestamp": f"2024-01-01T00:00:0{i}Z", "sender": "user"})
+
+    response = client.get("/api/messages/ex/export", headers={**HEADERS, "Accept-Encoding": "identity"})
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert [json.loads(line)["message_id"] for line in response.text.splitlines()] == ["ex-0", "ex-1", "ex-2"]
+
+    response = client.get("/api/messages/ex/export?format=csv", headers={**HEADERS, "Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert [row["content"] for row in rows] == ["texto, 0", "texto, 1", "texto, 2"]
@@ -0,0 +1,95 @@
+import asyncio
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import NullPool
+
+from app import idempotency, services
+from app.database import Base, register_sqlite_pragmas
+from app.dependencies import get_async_db, get_session_factory
+from app.main import app
+
+HEADERS = {"X-API-Key": "my-super-secret-key"}
+
+# Estas pruebas usan un engine sqlite+aiosqlite real en lugar de la sesión síncrona de conftest,
+# así que recorren AsyncSession, run_db (run_sync) y la exportación por lotes asíncrona
+@pytest.fixture
+def async_client(tmp_path, monkeypatch):
+    # NullPool: cada sesión abre su conexión en el event loop de la petición
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'async.db'}", poolclass=NullPool)
+    register_sqlite_pragmas(engine)
+    session_factory = async_sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
+    sessions = []
+
+    async def override_get_async_db():
+        async with session_factory() as db:
+            sessions.append(db)
+            yield db
+
+    run_sync_calls = []
+    original_run_sync = AsyncSession.run_sync
+
+    async def counting_run_sync(self, fn, *args, **kwargs):
+        run_sync_calls.append(getattr(fn, "__name__", repr(fn)))
+        return await original_run_sync(self, fn, *args, **kwargs)
+
+    monkeypatch.setattr(AsyncSession, "run_sync", counting_run_sync)
+    monkeypatch.setattr(idempotency, "recent_messages", idempotency.RecentMessages())
+    app.dependency_overrides[get_async_db] = override_get_async_db
+    app.dependency_overrides[get_session_factory] = lambda: session_factory
+    asyncio.run(_create_tables(engine))
+    client = TestClient(app)
+    client.sessions, client.run_sync_calls = sessions, run_sync_calls
+    yield client
+    del app.dependency_overrides[get_async_db]
+    del app.dependency_overrides[get_session_factory]
+
+async def _create_tables(engine):
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+    await engine.dispose()
+
+def _message(message_id: str, second: int, session_id: str = "async-s") -> dict:
+    return {
+        "message_id": message_id, "session_id": session_id, "content": f"mensaje {message_id}",
+        "timestamp": f"2024-01-01T10:00:{second:02d}", "sender": "user",
+    }
+
+def test_create_and_read_through_async_session(async_client: TestClient):
+    """Prueba que el alta, el reintento y el historial funcionan sobre una AsyncSession real."""
+    created = async_client.post("/api/messages/", headers=HEADERS, json=_message("a-1", 1))
+    assert created.status_code == 201
+    replay = async_client.post("/api/messages/", headers=HEADERS, json=_message("a-1", 1))
+    assert replay.status_code == 200
+    assert replay.json()["data"] == created.json()["data"]
+
+    history = async_client.get("/api/messages/async-s", headers=HEADERS)
+    assert [msg["message_id"] for msg in history.json()["data"]] == ["a-1"]
+    assert async_client.sessions and all(isinstance(db, AsyncSession) for db in async_client.sessions)
+    assert {"create_message", "get_messages_by_session"} <= set(async_client.run_sync_calls)
+
+def test_bulk_and_export_through_async_session(async_client: TestClient, monkeypatch):
+    """Prueba la ingesta masiva y la exportación en varios lotes con el driver asíncrono."""
+    batches = []
+    history_batches = services._history_batches
+
+    async def small_batches(db, session_id, sender, batch_size):
+        assert isinstance(db, AsyncSession)
+        async for rows in history_batches(db, session_id, sender, 2):
+            batches.append(len(rows))
+            yield rows
+
+    monkeypatch.setattr(services, "_history_batches", small_batches)
+    payload = [_message(f"b-{i}", i) for i in range(5)]
+    response = async_client.post("/api/messages/bulk", headers=HEADERS, json=payload)
+    assert response.status_code == 200
+    assert response.json()["data"]["created"] == 5
+
+    ndjson = async_client.get("/api/messages/async-s/export", headers=HEADERS)
+    assert [json.loads(line)["message_id"] for line in ndjson.text.splitlines()] == [f"b-{i}" for i in range(5)]
+    assert batches == [2, 2, 1]
+
+    csv = async_client.get("/api/messages/async-s/export?format=csv", headers=HEADERS)
+    assert len(csv.text.strip().splitlines()) == 6  # cabecera + 5 filas
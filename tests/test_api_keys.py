@@ -0,0 +1,81 @@
+import json
+import os
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import api_keys, models
+from app.models import Base
+from app.rate_limit import Limit
+
+
+def _write_keys(path, entries, mtime: float):
+    path.write_text(json.dumps(entries), encoding="utf-8")
+    # El almacén detecta los cambios por mtime: se fija explícitamente para no depender de su resolución
+    os.utime(path, (mtime, mtime))
+
+
+@pytest.fixture()
+def key_file(tmp_path, monkeypatch):
+    path = tmp_path / "keys.json"
+    _write_keys(path, [
+        {"key": "free-key", "tenant": "acme", "tier": "free"},
+        {"key_hash": api_keys.hash_key("pro-key"), "tenant": "globex", "tier": "pro"},
+    ], mtime=1_000)
+    cache = api_keys.ApiKeyCache(api_keys.FileKeyStore(str(path)))
+    monkeypatch.setattr(api_keys, "key_cache", cache)
+    monkeypatch.setattr(api_keys, "TIER_LIMITS", {"free": Limit(1, 60), "pro": Limit(100, 60)})
+    return path
+
+
+def test_tenant_keys_and_tier_limits(client: TestClient, key_file):
+    """Prueba que cada clave del fichero autentica y aplica el límite de su nivel."""
+    assert client.get("/cache/stats", headers={"X-API-Key": "my-super-secret-key"}).status_code == 401
+
+    free = {"X-API-Key": "free-key"}
+    assert client.get("/", headers=free).status_code == 200
+    assert client.get("/api/messages/s1", headers=free).status_code == 200
+    # El nivel free admite una petición por minuto en cada ruta limitada
+    assert client.post("/api/messages/", headers=free, json={}).status_code == 422
+    assert client.post("/api/messages/", headers=free, json={}).status_code == 429
+
+    pro = {"X-API-Key": "pro-key"}
+    for _ in range(10):
+        assert client.post("/api/messages/", headers=pro, json={}).status_code == 422
+    assert api_keys.key_cache.stats()["keys"] == 2
+
+
+def test_rotation_and_failed_refresh(key_file):
+    """Prueba que una recarga aplica la rotación y que un fichero inválido conserva las claves anteriores."""
+    cache = api_keys.key_cache
+    assert cache.authenticate("free-key").tenant == "acme"
+
+    _write_keys(key_file, [{"key": "free-key-2", "tenant": "acme", "tier": "free"}], mtime=2_000)
+    assert cache.refresh_sync() is True
+    assert cache.authenticate("free-key") is None
+    assert cache.authenticate("free-key-2").tier == "free"
+
+    key_file.write_text("{no es json", encoding="utf-8")
+    os.utime(key_file, (3_000, 3_000))
+    assert cache.refresh_sync() is False
+    assert cache.authenticate("free-key-2") is not None
+    assert cache.stats()["refresh_errors"] == 1
+
+
+def test_database_store_loads_active_keys(tmp_path):
+    """Prueba que el almacén en BD solo carga las claves activas."""
+    engine = create_engine(f"sqlite:///{tmp_path / 'keys.db'}")
+    Base.metadata.create_all(bind=engine)
+    session_factory = sessionmaker(bind=engine)
+    with session_factory() as db:
+        db.add_all([
+            models.ApiKey(key_hash=api_keys.hash_key("new"), tenant="acme", tier="pro", active=True),
+            models.ApiKey(key_hash=api_keys.hash_key("old"), tenant="acme", tier="pro", active=False),
+        ])
+        db.commit()
+    cache = api_keys.ApiKeyCache(api_keys.DatabaseKeyStore(session_factory))
+    assert cache.authenticate("new") == api_keys.ApiKeyInfo(api_keys.hash_key("new"), "acme", "pro")
+    assert cache.authenticate("old") is None
+    engine.dispose()
@@ -0,0 +1,32 @@
+import asyncio
+import os
+
+from benchmarks import compare, suite
+from benchmarks.fake_redis import FakeRedis
+
+
+def test_suite_scenarios_smoke(tmp_path):
+    """Prueba que los escenarios de la suite se ejecutan contra la app con tamaños mínimos."""
+    async def scenario():
+        redis = FakeRedis()
+        async with suite.bench_client(os.path.join(tmp_path, "bench.db"), redis) as (client, sync_factory):
+            created = await suite.bench_create(client, total=10, concurrency=5)
+            suite.seed_session(sync_factory, "read", 20)
+            reads = await suite.bench_read(client, redis, "read", repeat=1)
+            fanout = await suite.bench_ws_fanout(client, clients=3, messages=2)
+        return created, reads, fanout
+
+    created, reads, fanout = asyncio.run(scenario())
+    assert created["requests"] == 10
+    assert [reads[f"read_limit_{limit}"]["rows"] for limit in suite.PAGE_SIZES] == [10, 20, 20]
+    assert fanout["delivered"] == 6
+
+
+def test_compare_flags_regressions():
+    """Prueba que la comparación distingue métricas de latencia y de throughput."""
+    before = {"results": {"create": {"throughput_rps": 100.0, "p50_ms": 10.0, "requests": 500}}}
+    after = {"results": {"create": {"throughput_rps": 80.0, "p50_ms": 10.5, "requests": 500}}}
+    rows = {row["metric"]: row for row in compare.compare(before, after, threshold=0.1)}
+    assert set(rows) == {"throughput_rps", "p50_ms"}
+    assert rows["throughput_rps"]["regression"] is True
+    assert rows["p50_ms"]["regression"] is False
@@ -0,0 +1,246 @@
+import asyncio
+import json
+
+from redis.exceptions import ConnectionError as RedisConnectionError
+
+from app.broadcast import RedisBroadcast
+from app.routers.websocket import ConnectionManager, SEND_FAILED_CLOSE_CODE, SLOW_CONSUMER_CLOSE_CODE
+
+class FakeWebSocket:
+    """WebSocket simulado que registra los mensajes recibidos."""
+
+    def __init__(self, delay: float = 0, fail: bool = False):
+        self.delay = delay
+        self.fail = fail
+        self.received: list[str] = []
+        self.closed_with: int | None = None
+
+    async def send_text(self, message: str):
+        if self.fail:
+            raise RuntimeError("socket cerrado")
+        await asyncio.sleep(self.delay)
+        self.received.append(message)
+
+    async def close(self, code: int = 1000):
+        self.closed_with = code
+
+class FakePubSub:
+    def __init__(self, broker: "FakeRedis"):
+        self.broker = broker
+        self.queue: asyncio.Queue = asyncio.Queue()
+
+    async def subscribe(self, channel: str):
+        self.broker.subscribers.setdefault(channel, []).append(self)
+
+    async def get_message(self, ignore_subscribe_messages: bool = False, timeout: float = 0):
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    async def close(self):
+        for subscribers in self.broker.subscribers.values():
+            if self in subscribers:
+                subscribers.remove(self)
+
+class FakeRedis:
+    """Sustituto mínimo de Redis pub/sub compartido por varias "réplicas" en memoria."""
+
+    def __init__(self, fail: bool = False):
+        self.fail = fail
+        self.subscribers: dict[str, list[FakePubSub]] = {}
+        self.published: list[str] = []
+
+    async def publish(self, channel: str, data: str):
+        if self.fail:
+            raise RedisConnectionError("redis no disponible")
+        self.published.append(data)
+        for pubsub in self.subscribers.get(channel, []):
+            pubsub.queue.put_nowait({"type": "message", "channel": channel, "data": data})
+
+    def pubsub(self):
+        return FakePubSub(self)
+
+def test_broadcast_does_not_wait_for_slow_clients():
+    """Prueba que un cliente lento no retrasa la entrega a los demás."""
+    async def scenario():
+        manager = ConnectionManager()
+        fast, slow = FakeWebSocket(), FakeWebSocket(delay=5)
+        manager.register(fast)
+        manager.register(slow)
+        await asyncio.wait_for(manager.broadcast("hola"), timeout=0.1)
+        await asyncio.sleep(0.01)
+        for websocket in (fast, slow):
+            manager.disconnect(websocket)
+        return fast.received, slow.received
+
+    fast_received, slow_received = asyncio.run(scenario())
+    assert fast_received == ["hola"]
+    assert slow_received == []
+
+def test_broadcast_removes_dead_sockets():
+    """Prueba que un socket que falla o se bloquea se retira y se cierra sin romper la difusión."""
+    async def scenario():
+        manager = ConnectionManager(send_timeout=0.05)
+        dead, stuck, alive = FakeWebSocket(fail=True), FakeWebSocket(delay=5), FakeWebSocket()
+        for websocket in (dead, stuck, alive):
+            manager.register(websocket)
+        await manager.broadcast("uno")
+        await asyncio.sleep(0.01)
+        await manager.broadcast("dos")
+        await asyncio.sleep(0.1)
+        connections = list(manager.active_connections)
+        manager.disconnect(alive)
+        return connections, alive.received, dead, stuck
+
+    connections, received, dead, stuck = asyncio.run(scenario())
+    assert len(connections) == 1
+    assert received == ["uno", "dos"]
+    assert dead.closed_with == SEND_FAILED_CLOSE_CODE
+    assert stuck.closed_with == SLOW_CONSUMER_CLOSE_CODE
+
+def test_slow_consumer_policies():
+    """Prueba las políticas drop_oldest y disconnect con la cola llena."""
+    async def scenario(policy: str):
+        manager = ConnectionManager(queue_size=2, policy=policy)
+        blocked = FakeWebSocket(delay=5)
+        manager.register(blocked)
+        for message in ("m1", "m2", "m3", "m4"):
+            await manager.broadcast(message)
+            await asyncio.sleep(0)
+        connection = manager.active_connections.get(blocked)
+        pending = list(connection.queue._queue) if connection else None
+        manager.disconnect(blocked)
+        return manager, pending, blocked
+
+    manager, pending, _ = asyncio.run(scenario("drop_oldest"))
+    # m1 está en vuelo en la tarea escritora; de los restantes se conservan los más recientes
+    assert pending == ["m3", "m4"]
+    assert manager.dropped == 1
+
+    manager, pending, blocked = asyncio.run(scenario("disconnect"))
+    assert pending is None
+    assert manager.disconnected_slow == 1
+    assert blocked.closed_with == SLOW_CONSUMER_CLOSE_CODE
+
+def test_redis_broadcast_reaches_every_replica():
+    """Prueba que un mensaje publicado en una réplica llega a los clientes de todas, en un solo lote."""
+    async def scenario():
+        redis = FakeRedis()
+        replicas = []
+        for _ in range(2):
+            manager = ConnectionManager()
+            client = FakeWebSocket()
+            manager.register(client)
+            backend = RedisBroadcast(redis, manager.broadcast, window_ms=20)
+            await backend.start()
+            replicas.append((manager, client, backend))
+        for message in ("a", "b", "c"):
+            await replicas[0][2].publish(message)
+        await asyncio.sleep(0.1)
+        for manager, client, backend in replicas:
+            await backend.stop()
+            manager.disconnect(client)
+        return redis, replicas
+
+    redis, replicas = asyncio.run(scenario())
+    assert redis.published == ["a\nb\nc"]
+    for _, client, _ in replicas:
+        assert client.received == ["a", "b", "c"]
+
+def test_redis_broadcast_falls_back_to_local_delivery():
+    """Prueba que sin Redis el mensaje se entrega al menos a los clientes locales."""
+    async def scenario():
+        manager = ConnectionManager()
+        client = FakeWebSocket()
+        manager.register(client)
+        backend = RedisBroadcast(FakeRedis(fail=True), manager.broadcast, window_ms=1)
+        await backend.start()
+        await backend.publish("hola")
+        await asyncio.sleep(0.05)
+        await backend.stop()
+        manager.disconnect(client)
+        return backend, client
+
+    backend, client = asyncio.run(scenario())
+    assert client.received == ["hola"]
+    assert backend.errors == 1
+
+def test_session_subscriptions_route_messages():
+    """Prueba que los suscritos solo reciben su sesión (y remitente) y los clientes antiguos reciben todo."""
+    async def scenario():
+        manager = ConnectionManager()
+        legacy, session, only_user = FakeWebSocket(), FakeWebSocket(), FakeWebSocket()
+        for websocket in (legacy, session, only_user):
+            manager.register(websocket)
+        await manager.handle_client_message(session, '{"action": "subscribe", "session_id": "s1"}')
+        await manager.handle_client_message(only_user, '{"action": "subscribe", "session_id": "s1", "sender": "user"}')
+        await manager.handle_client_message(only_user, '{"action": "subscribe"}')
+        await manager.handle_client_message(legacy, "ping")
+        await asyncio.sleep(0.01)
+        for websocket in (session, only_user):
+            websocket.received.clear()
+        for message in (
+            '{"session_id": "s1", "sender": "user"}',
+            '{"session_id": "s1", "sender": "system"}',
+            '{"session_id": "s2", "sender": "user"}',
+        ):
+            await manager.broadcast(message)
+        await asyncio.sleep(0.01)
+        manager.unsubscribe(session, "s1")
+        await manager.broadcast('{"session_id": "s1", "sender": "user"}')
+        await asyncio.sleep(0.01)
+        stats = manager.stats()
+        for websocket in (legacy, session, only_user):
+            manager.disconnect(websocket)
+        return legacy, session, only_user, stats, manager
+
+    legacy, session, only_user, stats, manager = asyncio.run(scenario())
+    assert len(legacy.received) == 4
+    assert [json.loads(m)["sender"] for m in session.received] == ["user", "system"]
+    assert [json.loads(m)["sender"] for m in only_user.received] == ["user", "user"]
+    assert stats["subscribed_sessions"] == 1
+    assert manager._by_session == {}
+
+def test_replay_buffer_falls_back_when_late_messages_were_evicted():
+    """Prueba que un mensaje tardío expulsado del buffer hace que el backfill por instante vaya a la BD."""
+    from datetime import datetime
+    from app.replay import ReplayBuffer, ReplayEntry, parse_timestamp
+
+    def entry(message_id: str, minute: int):
+        return ReplayEntry(message_id, "user", datetime(2024, 1, 1, 10, minute), message_id)
+
+    replay = ReplayBuffer(size=3)
+    for message_id, minute in (("m1", 1), ("m5", 5), ("late", 3), ("m6", 6)):
+        replay.record("s", entry(message_id, minute))
+    # El buffer empieza en m5, pero "late" (10:03) sigue dentro y se devuelve en orden de timestamp
+    assert [e.message_id for e in replay.after_timestamp("s", datetime(2024, 1, 1, 10, 2))] == ["late", "m5", "m6"]
+    assert [e.message_id for e in replay.after_message("s", "late")] == ["m5", "m6"]
+
+    replay.record("s", entry("m7", 7))
+    replay.record("s", entry("m8", 8))
+    # Se ha expulsado m5 (10:05): un instante anterior ya no está cubierto aunque el primero sea "late"
+    assert replay.after_timestamp("s", datetime(2024, 1, 1, 10, 4)) is None
+    assert replay.after_message("s", "late") is None
+    assert [e.message_id for e in replay.after_timestamp("s", datetime(2024, 1, 1, 10, 5))] == ["m6", "m7", "m8"]
+
+    # Misma normalización que la BD: se descarta la zona horaria sin convertir
+    assert parse_timestamp("2024-01-01T10:00:00+02:00") == datetime(2024, 1, 1, 10, 0)
+
+def test_replay_reset_is_not_delivered():
+    """Prueba que el aviso replay_reset vacía el buffer de la sesión sin llegar a los clientes."""
+    from app.routers.websocket import replay_reset_frame
+
+    async def scenario():
+        manager = ConnectionManager()
+        client = FakeWebSocket()
+        manager.register(client)
+        await manager.broadcast(json.dumps({"message_id": "a", "session_id": "s", "sender": "user", "timestamp": "2024-01-01T10:00:00"}))
+        await manager.broadcast(replay_reset_frame("s"))
+        await asyncio.sleep(0.01)
+        manager.disconnect(client)
+        return manager, client
+
+    manager, client = asyncio.run(scenario())
+    assert len(client.received) == 1
+    assert manager.replay.after_message("s", "a") is None
@@ -0,0 +1,107 @@
+import asyncio
+from datetime import datetime
+
+from fastapi.testclient import TestClient
+
+from app import cache
+from app.cache import LRUTTLCache, SessionHistoryCache
+from benchmarks.fake_redis import FakeRedis
+
+HEADERS = {"X-API-Key": "my-super-secret-key"}
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def test_lru_ttl_cache_eviction_and_expiry():
+    """Prueba la expulsión LRU y la caducidad por TTL con sus contadores."""
+    clock = FakeClock()
+    lru = LRUTTLCache(max_entries=2, ttl=10, clock=clock)
+    lru.set("a", 1)
+    lru.set("b", 2)
+    assert lru.get("a") == 1
+    lru.set("c", 3)  # expulsa "b", el menos usado
+    assert lru.get("b") is None
+    clock.now = 11
+    assert lru.get("a") is None
+    assert (lru.hits, lru.misses, lru.evictions, lru.expirations) == (1, 2, 1, 1)
+
+def test_session_cache_skips_stale_page_after_write():
+    """Prueba que una página leída antes de una escritura no se guarda en la caché."""
+    async def scenario():
+        history = SessionHistoryCache(local=LRUTTLCache())
+        generation = await history.generation("s")
+        await history.invalidate("s")
+        await history.set("s", None, (0, 10, None), "pagina", generation=generation)
+        return await history.get("s", None, (0, 10, None))
+
+    assert asyncio.run(scenario()) is None
+
+def test_redis_generation_invalidates_every_replica():
+    """Prueba que, con Redis, una escritura en una réplica invalida las páginas (también locales) de las demás."""
+    async def scenario():
+        redis = FakeRedis()
+        pod_a, pod_b = SessionHistoryCache(local=LRUTTLCache(), redis=redis), SessionHistoryCache(local=LRUTTLCache(), redis=redis)
+        page = (0, 10, None)
+        # A lee la generación y las filas antiguas; B escribe antes de que A guarde la página
+        generation = await pod_a.generation("s")
+        await pod_b.invalidate("s")
+        await pod_a.set("s", None, page, "antigua", generation=generation)
+        stale = [await pod_a.get("s", None, page), await pod_b.get("s", None, page)]
+
+        await pod_a.set("s", None, page, "nueva", generation=await pod_a.generation("s"))
+        fresh = await pod_b.get("s", None, page)
+        await pod_b.invalidate("s")
+        after_write = await pod_a.get("s", None, page)
+        return stale, fresh, after_write
+
+    assert asyncio.run(scenario()) == ([None, None], "nueva", None)
+
+def test_local_generations_are_bounded():
+    """Prueba que los contadores de generación se podan con las entradas sin volver a servir páginas antiguas."""
+    async def scenario():
+        history = SessionHistoryCache(local=LRUTTLCache(max_entries=2))
+        page = (0, 10, None)
+        await history.set("s0", None, page, "s0", generation=await history.generation("s0"))
+        for i in range(1, 10):
+            await history.invalidate(f"s{i}")
+        return history, await history.get("s0", None, page)
+
+    history, pruned = asyncio.run(scenario())
+    assert len(history._generations) == history.max_generations == 4
+    assert pruned is None
+
+def test_cache_is_off_by_default_without_redis():
+    """Prueba que sin un canal de invalidación compartido (Redis) la caché está desactivada por defecto."""
+    import os, subprocess, sys
+
+    def enabled(**env) -> str:
+        environment = {k: v for k, v in os.environ.items() if not k.startswith("CACHE_")}
+        result = subprocess.run(
+            [sys.executable, "-c", "import app.cache; print(app.cache.CACHE_ENABLED)"],
+            env={**environment, **env}, capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        )
+        return result.stdout.strip()
+
+    assert enabled() == "False"
+    assert enabled(CACHE_REDIS_ENABLED="true") == "True"
+    assert enabled(CACHE_ENABLED="true") == "True"
+
+def test_history_endpoint_uses_cache_and_invalidates(client: TestClient, monkeypatch):
+    """Prueba que el historial se sirve desde la caché y se invalida al escribir."""
+    monkeypatch.setattr(cache, "CACHE_ENABLED", True)
+    def post(message_id: str):
+        client.post("/api/messages/", headers=HEADERS, json={"message_id": message_id, "session_id": "cache-s", "content": "hola", "timestamp": datetime.utcnow().isoformat() + "Z", "sender": "user"})
+
+    post("cache-1")
+    assert len(client.get("/api/messages/cache-s", headers=HEADERS).json()["data"]) == 1
+    assert len(client.get("/api/messages/cache-s", headers=HEADERS).json()["data"]) == 1
+    stats = client.get("/cache/stats", headers=HEADERS).json()["data"]
+    assert stats["hits"] == 1
+
+    post("cache-2")
+    assert len(client.get("/api/messages/cache-s", headers=HEADERS).json()["data"]) == 2
@@ -0,0 +1,94 @@
+import asyncio
+
+from fastapi.testclient import TestClient
+
+from app import idempotency, models, schemas, services
+from app.idempotency import recent_messages
+
+HEADERS = {"X-API-Key": "my-super-secret-key"}
+PAYLOAD = {
+    "message_id": "retry-1",
+    "session_id": "retry-s",
+    "content": "Hola, reintento",
+    "timestamp": "2024-01-01T10:00:00",
+    "sender": "user",
+}
+
+
+def test_retry_is_answered_from_memory(client: TestClient, db_session, monkeypatch):
+    """Prueba que un reintento devuelve el mensaje guardado con 200 sin filtrarlo ni duplicarlo."""
+    created = client.post("/api/messages/", headers=HEADERS, json=PAYLOAD)
+    assert created.status_code == 201
+    assert idempotency.REPLAY_HEADER not in created.headers
+
+    def fail(message):
+        raise AssertionError("un reintento no debe volver a filtrarse")
+
+    monkeypatch.setattr(services, "_prepare_message", fail)
+    replay = client.post("/api/messages/", headers=HEADERS, json={**PAYLOAD, "content": "otro contenido"})
+    assert replay.status_code == 200
+    assert replay.headers[idempotency.REPLAY_HEADER] == "true"
+    assert replay.json() == created.json()
+    assert db_session.query(models.Message).count() == 1
+    assert recent_messages.stats()["replays"] == 1
+
+
+def test_forgotten_retry_falls_back_to_unique_constraint(client: TestClient, db_session):
+    """Prueba que un reintento fuera de la ventana en memoria responde 200 en lugar de 500."""
+    created = client.post("/api/messages/", headers=HEADERS, json=PAYLOAD)
+    recent_messages.clear()
+
+    replay = client.post("/api/messages/", headers=HEADERS, json=PAYLOAD)
+    assert replay.status_code == 200
+    assert replay.headers[idempotency.REPLAY_HEADER] == "true"
+    assert replay.json()["data"] == created.json()["data"]
+    assert db_session.query(models.Message).count() == 1
+    # El mensaje recuperado de la BD queda recordado para los siguientes reintentos
+    assert len(recent_messages.local) == 1
+
+
+def test_duplicate_in_write_batch(tmp_path, monkeypatch):
+    """Prueba que dos envíos concurrentes del mismo mensaje en un lote de escritura crean una sola fila."""
+    from sqlalchemy import create_engine, func, select
+    from sqlalchemy.orm import sessionmaker
+    from app import write_queue
+    from app.models import Base
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'batch.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    session_factory = sessionmaker(bind=engine)
+
+    async def scenario():
+        queue = write_queue.MessageWriteQueue(session_factory, window_ms=50)
+        await queue.start()
+        monkeypatch.setattr(write_queue, "write_queue", queue)
+        try:
+            with session_factory() as db:
+                return await asyncio.gather(
+                    *(services.process_and_create_message(db=db, message=schemas.MessageCreate(**PAYLOAD))
+                      for _ in range(2)),
+                    return_exceptions=True,
+                )
+        finally:
+            await queue.stop()
+
+    results = asyncio.run(scenario())
+    assert sum(isinstance(result, idempotency.DuplicateMessage) for result in results) == 1
+    with engine.connect() as connection:
+        assert connection.execute(select(func.count()).select_from(models.Message)).scalar() == 1
+    engine.dispose()
+
+
+def test_recent_messages_are_bounded_in_bytes_and_keyed_by_tenant():
+    """Prueba que la memoria de reintentos se acota por bytes y no comparte respuestas entre tenants."""
+    async def scenario():
+        recent = idempotency.RecentMessages(max_entries=100, max_bytes=250)
+        for i in range(5):
+            await recent.remember("acme", f"m-{i}", b"x" * 100)
+        other_tenant = await recent.get("globex", "m-4")
+        return recent, other_tenant, await recent.get("acme", "m-4"), await recent.get("acme", "m-0")
+
+    recent, other_tenant, kept, evicted = asyncio.run(scenario())
+    assert (len(recent.local), recent.local.bytes) == (2, 200)
+    assert other_tenant is None and evicted is None
+    assert kept == b"x" * 100
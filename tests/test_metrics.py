@@ -0,0 +1,53 @@
+from datetime import datetime
+
+from app import metrics
+
+HEADERS = {"X-API-Key": "my-super-secret-key"}
+
+
+def test_metrics_endpoint_reports_stages_and_queries(client):
+    """Prueba que /metrics expone las etapas de un POST y las consultas SQL por petición."""
+    response = client.post("/api/messages/", json={
+        "message_id": "metrics-1", "session_id": "metrics-s", "content": "hola",
+        "timestamp": datetime.utcnow().isoformat(), "sender": "user",
+    }, headers=HEADERS)
+    assert response.status_code == 201
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    body = response.text
+    for stage in ("auth", "rate_limit", "validation", "filter", "db", "serialization", "broadcast"):
+        assert f'request_stage_duration_seconds_count{{stage="{stage}"}}' in body
+    assert 'http_request_duration_seconds_count{method="POST",route="/api/messages/",status="201"}' in body
+    # INSERT del mensaje y upsert de session_stats
+    queries = [line for line in body.splitlines()
+               if line.startswith('db_queries_per_request_sum{method="POST",route="/api/messages/"}')]
+    assert queries and float(queries[0].split()[-1]) >= 2
+    assert "websocket_connections 0" in body
+
+
+def test_histogram_renders_cumulative_buckets():
+    """Prueba el formato de texto de un histograma: buckets acumulados, suma y total."""
+    histogram = metrics.Histogram("latency_seconds", "Latencia.", ("stage",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(value, 'a"b')
+    assert histogram.render() == [
+        "# HELP latency_seconds Latencia.",
+        "# TYPE latency_seconds histogram",
+        'latency_seconds_bucket{stage="a\\"b",le="0.1"} 2',
+        'latency_seconds_bucket{stage="a\\"b",le="1.0"} 3',
+        'latency_seconds_bucket{stage="a\\"b",le="+Inf"} 4',
+        'latency_seconds_sum{stage="a\\"b"} 3.65',
+        'latency_seconds_count{stage="a\\"b"} 4',
+    ]
+
+
+def test_span_is_noop_when_disabled(monkeypatch):
+    """Prueba que, desactivadas las métricas, span no mide nada."""
+    monkeypatch.setattr(metrics, "METRICS_ENABLED", False)
+    before = metrics.stage_duration._values.get(("disabled-stage",))
+    with metrics.span("disabled-stage"):
+        pass
+    assert metrics.span("disabled-stage") is metrics._DISABLED
+    assert metrics.stage_duration._values.get(("disabled-stage",)) == before
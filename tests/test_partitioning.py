@@ -0,0 +1,259 @@
+import gzip
+import json
+from datetime import datetime
+
+import pytest
+from sqlalchemy import create_engine, event, inspect, select
+from sqlalchemy.orm import Session
+
+from app import crud, models, partitioning, schemas, search
+from app.models import Base
+
+NOW = datetime(2024, 5, 15)
+
+
+def _item(message_id: str, timestamp: datetime, session_id: str = "part-s"):
+    message = schemas.MessageCreate(
+        message_id=message_id, session_id=session_id, content=f"mensaje {message_id}",
+        timestamp=timestamp, sender="user",
+    )
+    return message, schemas.MessageMetadata(word_count=2, character_count=10)
+
+
+@pytest.fixture()
+def part_engine(tmp_path, monkeypatch):
+    monkeypatch.setattr(partitioning, "PARTITIONING_ENABLED", True)
+    engine = create_engine(f"sqlite:///{tmp_path / 'part.db'}")
+    Base.metadata.create_all(bind=engine)
+    # Dos mensajes por mes de enero a mayo, y otra sesión en febrero
+    items = [_item(f"m{month}-{day}", datetime(2024, month, day)) for month in range(1, 6) for day in (3, 20)]
+    items.append(_item("other", datetime(2024, 2, 10), session_id="other-s"))
+    with Session(engine) as db:
+        crud.create_messages(db, sorted(items, key=lambda item: item[0].timestamp))
+    yield engine
+    partitioning.catalog.invalidate()
+    engine.dispose()
+
+
+def _walk(db, page_size: int) -> list[str]:
+    """Recorre la sesión página a página con la clave de la última fila como cursor."""
+    ids, after = [], None
+    while True:
+        rows = crud.get_messages_by_session(db, "part-s", None, limit=page_size, after=after)
+        ids += [row.message_id for row in rows]
+        if len(rows) < page_size:
+            return ids
+        after = (rows[-1].timestamp, rows[-1].id)
+
+
+def test_sealed_partitions_keep_history_order(part_engine):
+    """Prueba que, tras mover los meses antiguos a particiones, el historial se lee igual."""
+    with Session(part_engine) as db:
+        before = _walk(db, 3)
+    with part_engine.begin() as connection:
+        sealed = partitioning.seal_partitions(connection, NOW, hot_months=1)
+    assert [entry["partition"] for entry in sealed] == ["messages_2024_01", "messages_2024_02", "messages_2024_03"]
+    assert sealed[1]["rows"] == 3
+
+    with Session(part_engine) as db:
+        hot = db.execute(select(models.Message.message_id)).scalars().all()
+        assert sorted(hot) == ["m4-20", "m4-3", "m5-20", "m5-3"]
+        assert _walk(db, 3) == before
+        assert [row.message_id for row in crud.get_messages_by_session(db, "part-s", None, skip=3, limit=4)] == before[3:7]
+        assert crud.get_message_by_message_id(db, "m1-3").session_id == "part-s"
+        assert [row.message_id for batch in crud.iter_messages_by_session(db, "part-s", None, batch_size=4)
+                for row in batch] == before
+
+
+def test_late_message_is_merged_and_sealed(part_engine):
+    """Prueba que un mensaje de un mes ya sellado se lee en orden y pasa a su partición."""
+    with part_engine.begin() as connection:
+        partitioning.seal_partitions(connection, NOW, hot_months=1)
+    with Session(part_engine) as db:
+        crud.create_message(db, *_item("late", datetime(2024, 2, 15)))
+        # El mensaje con el mayor id nunca sale de la tabla activa
+        crud.create_message(db, *_item("newest", datetime(2024, 5, 25)))
+        ids = _walk(db, 2)
+        assert ids.index("late") == ids.index("m2-3") + 1
+    with part_engine.begin() as connection:
+        sealed = partitioning.seal_partitions(connection, NOW, hot_months=1)
+    assert sealed == [{"partition": "messages_2024_02", "moved": 1, "rows": 4}]
+    with Session(part_engine) as db:
+        assert _walk(db, 2) == ids
+
+
+def test_reads_prune_partitions_by_cursor(part_engine):
+    """Prueba que una página posterior al cursor no consulta las particiones anteriores."""
+    with part_engine.begin() as connection:
+        partitioning.seal_partitions(connection, NOW, hot_months=1)
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with Session(part_engine) as db:
+        partitioning.catalog.online(db)
+        event.listen(part_engine, "before_cursor_execute", capture)
+        try:
+            rows = crud.get_messages_by_session(db, "part-s", None, limit=2, after=(datetime(2024, 3, 5), 0))
+        finally:
+            event.remove(part_engine, "before_cursor_execute", capture)
+    assert [row.message_id for row in rows] == ["m3-20", "m4-3"]
+    assert not any("messages_2024_01" in s or "messages_2024_02" in s for s in statements)
+    assert any("messages_2024_03" in s for s in statements)
+
+
+def test_archive_expired_partitions(part_engine, tmp_path):
+    """Prueba que las particiones fuera de la retención se vuelcan comprimidas y se eliminan."""
+    archive_dir = tmp_path / "archive"
+    with part_engine.begin() as connection:
+        partitioning.seal_partitions(connection, NOW, hot_months=1)
+        archived = partitioning.archive_partitions(connection, NOW, retention_months=2, archive_dir=str(archive_dir))
+    assert [entry["partition"] for entry in archived] == ["messages_2024_01", "messages_2024_02"]
+
+    lines = gzip.decompress((archive_dir / "messages_2024_02.ndjson.gz").read_bytes()).splitlines()
+    assert [json.loads(line)["message_id"] for line in lines] == ["m2-3", "other", "m2-20"]
+    assert not inspect(part_engine).has_table("messages_2024_01")
+    with Session(part_engine) as db:
+        states = dict(db.execute(select(models.MessagePartition.name, models.MessagePartition.state)).all())
+        assert states == {"messages_2024_01": "archived", "messages_2024_02": "archived", "messages_2024_03": "online"}
+        assert _walk(db, 5)[0] == "m3-3"
+
+
+def test_sealed_message_id_stays_unique(part_engine):
+    """Prueba que reenviar un mensaje ya sellado es un reintento y no crea una fila duplicada."""
+    import asyncio
+
+    from app import idempotency, services
+
+    with part_engine.begin() as connection:
+        partitioning.seal_partitions(connection, NOW, hot_months=1)
+    message, _ = _item("m1-3", datetime(2024, 1, 3))
+    with Session(part_engine) as db:
+        with pytest.raises(idempotency.DuplicateMessage) as replay:
+            asyncio.run(services.process_and_create_message(db=db, message=message))
+        assert json.loads(replay.value.message_json)["message_id"] == "m1-3"
+        # La ingesta masiva también lo descarta
+        row = {**message.model_dump(), "word_count": 2, "character_count": 10, "processed_at": None}
+        assert crud.bulk_insert_messages(db, [row]) == set()
+        assert _walk(db, 20).count("m1-3") == 1
+        stats = crud.get_session_stats(db, "part-s")
+        assert sum(stat.message_count for stat in stats) == 10
+    idempotency.recent_messages.clear()
+
+
+def test_seal_keeps_rows_it_could_not_move(part_engine):
+    """Prueba que una fila con un message_id ya presente en la partición no se borra al sellar."""
+    with part_engine.begin() as connection:
+        partitioning.seal_partitions(connection, NOW, hot_months=1)
+        # Duplicado que esquiva el registro (p. ej. insertado con el particionado desactivado)
+        messages = models.Message.__table__
+        connection.execute(messages.insert().values(
+            message_id="m1-3", session_id="part-s", content="dup", timestamp=datetime(2024, 1, 3, 12),
+            sender="user", word_count=1, character_count=3,
+        ))
+        connection.execute(messages.insert().values(
+            message_id="newest", session_id="part-s", content="n", timestamp=datetime(2024, 5, 25),
+            sender="user", word_count=1, character_count=1,
+        ))
+        sealed = partitioning.seal_partitions(connection, NOW, hot_months=1)
+    assert sealed == [{"partition": "messages_2024_01", "moved": 0, "rows": 2, "conflicts": 1}]
+    with Session(part_engine) as db:
+        hot = db.execute(select(models.Message.content).where(models.Message.message_id == "m1-3")).scalars().all()
+        assert hot == ["dup"]
+
+
+def test_async_export_includes_partitions(part_engine):
+    """Prueba que la exportación con AsyncSession (DB_ASYNC=true) incluye los meses sellados."""
+    import asyncio
+
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+    from app import services
+
+    with part_engine.begin() as connection:
+        partitioning.seal_partitions(connection, NOW, hot_months=1)
+    with Session(part_engine) as db:
+        expected = _walk(db, 20)
+
+    async def export():
+        engine = create_async_engine(f"sqlite+aiosqlite:///{part_engine.url.database}")
+        try:
+            factory = async_sessionmaker(bind=engine, expire_on_commit=False)
+            return b"".join([chunk async for chunk in services.export_messages(factory, "part-s", None, batch_size=3)])
+        finally:
+            await engine.dispose()
+
+    lines = asyncio.run(export()).splitlines()
+    assert [json.loads(line)["message_id"] for line in lines] == expected
+    assert len(expected) == 10
+
+
+def test_search_covers_sealed_partitions(part_engine, tmp_path):
+    """Prueba que la búsqueda encuentra los mensajes sellados y pagina con cursor entre particiones."""
+    with Session(part_engine) as db:
+        before = sorted(row.message_id for row, _ in crud.search_messages_by_content(db, "mensaje"))
+    with part_engine.begin() as connection:
+        partitioning.seal_partitions(connection, NOW, hot_months=1)
+    with Session(part_engine) as db:
+        found = [row.message_id for row, _ in crud.search_messages_by_content(db, "m1")]
+        assert found == ["m1-3", "m1-20"]
+        ids, after = [], None
+        while page := crud.search_messages_by_content(db, "mensaje", session_id="part-s", limit=3, after=after):
+            ids += [row.message_id for row, _ in page]
+            after = page[-1][1]
+        assert sorted(ids) == sorted(id_ for id_ in before if id_ != "other")
+        assert len(ids) == len(set(ids))
+
+    with part_engine.begin() as connection:
+        partitioning.archive_partitions(connection, NOW, retention_months=2, archive_dir=str(tmp_path / "archive"))
+    assert not inspect(part_engine).has_table("messages_2024_01_fts")
+    with Session(part_engine) as db:
+        assert crud.search_messages_by_content(db, "m1") == []
+
+
+def test_seal_from_another_process_is_seen_by_the_app(client, db_session, monkeypatch):
+    """Prueba que la app ve, en la siguiente lectura, un sellado hecho con otra conexión (como el cron)."""
+    from app import idempotency
+    from app.cache import history_cache
+
+    monkeypatch.setattr(partitioning, "PARTITIONING_ENABLED", True)
+    headers = {"X-API-Key": "my-super-secret-key"}
+    for i, month in enumerate((1, 2, 5)):
+        client.post("/api/messages/", headers=headers, json={
+            "message_id": f"p{i}", "session_id": "cron-s", "content": f"sellado {i}",
+            "timestamp": f"2024-0{month}-10T10:00:00", "sender": "user",
+        })
+
+    def history():
+        return [message["message_id"] for message in client.get("/api/messages/cron-s", headers=headers).json()["data"]]
+
+    def search_ids():
+        response = client.get("/api/messages/search", headers=headers, params={"query": "sellado"})
+        return sorted(message["message_id"] for message in response.json()["data"])
+
+    # Las lecturas previas dejan el catálogo (vacío) en la caché del proceso
+    assert history() == ["p0", "p1", "p2"]
+    with db_session.get_bind().begin() as connection:
+        # Como el cron en otro proceso: seal_partitions no toca la caché del catálogo de este
+        versions_before = connection.execute(select(models.PartitionCatalogVersion.version)).scalar()
+        sealed = partitioning.seal_partitions(connection, NOW, hot_months=1)
+    assert [entry["partition"] for entry in sealed] == ["messages_2024_01", "messages_2024_02"]
+    assert versions_before is None
+
+    history_cache.clear()
+    assert history() == ["p0", "p1", "p2"]
+    assert search_ids() == ["p0", "p1", "p2"]
+    idempotency.recent_messages.clear()
+    replay = client.post("/api/messages/", headers=headers, json={
+        "message_id": "p0", "session_id": "cron-s", "content": "sellado 0",
+        "timestamp": "2024-01-10T10:00:00", "sender": "user",
+    })
+    assert replay.status_code == 200
+
+    # La BD en memoria se comparte entre pruebas: drop_all no conoce las tablas de partición
+    with db_session.get_bind().begin() as connection:
+        for entry in sealed:
+            search.drop_search_index(connection, entry["partition"])
+            partitioning.partition_table(entry["partition"]).drop(connection)
+    partitioning.catalog.invalidate()
@@ -0,0 +1,89 @@
+import queue
+import threading
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+from app.database import PoolMetrics, engine_options
+from app.dependencies import get_async_db, get_db
+from app.main import app
+
+def _engine(tmp_path, metrics: PoolMetrics, **pool):
+    url = f"sqlite:///{tmp_path / 'pool.db'}"
+    return create_engine(url, **{**engine_options(url, metrics), **pool})
+
+def test_engine_options_per_backend(monkeypatch):
+    """Prueba los valores por defecto por backend y su sustitución por variables de entorno."""
+    assert engine_options("postgresql://u@h/chat")["pool_pre_ping"] is True
+    assert "pool_size" not in engine_options("sqlite:///:memory:")
+    monkeypatch.setenv("DB_POOL_SIZE", "3")
+    monkeypatch.setenv("DB_POOL_PRE_PING", "true")
+    options = engine_options("sqlite:///./chat.db")
+    assert options["pool_size"] == 3 and options["pool_pre_ping"] is True
+
+class StepClock:
+    """Reloj controlado por la prueba; cada lectura se anuncia en ``reads``."""
+
+    def __init__(self):
+        self.now = 0.0
+        self.reads: queue.Queue = queue.Queue()
+
+    def __call__(self) -> float:
+        self.reads.put(self.now)
+        return self.now
+
+def test_concurrent_checkouts_exceeding_pool(tmp_path):
+    """Prueba que con más peticiones concurrentes que conexiones se espera y, pasado el timeout, se falla."""
+    clock = StepClock()
+    metrics = PoolMetrics(clock=clock)
+    engine = _engine(tmp_path, metrics, pool_size=2, max_overflow=0, pool_timeout=30)
+    events = []
+
+    def request():
+        with engine.connect() as connection:
+            events.append("checkout")
+            connection.execute(text("SELECT 1"))
+
+    held = [engine.connect(), engine.connect()]
+    for _ in range(4):  # inicio y fin de los dos checkouts sin espera
+        clock.reads.get_nowait()
+
+    # Una tercera petición espera a que se libere una conexión
+    waiting = threading.Thread(target=request)
+    waiting.start()
+    clock.reads.get(timeout=5)  # ya ha empezado el checkout
+    clock.now = 2.0
+    events.append("release")
+    held.pop().close()
+    waiting.join(timeout=5)
+    assert events == ["release", "checkout"]
+    assert metrics.checkouts == 3
+    assert metrics.wait_seconds_max == 2.0
+
+    for connection in held:
+        connection.close()
+    engine.dispose()
+
+    # Con todas las conexiones retenidas más que el timeout, la petición sobrante falla
+    metrics = PoolMetrics()
+    engine = _engine(tmp_path, metrics, pool_size=1, max_overflow=0, pool_timeout=0)
+    with engine.connect():
+        with pytest.raises(PoolTimeoutError):
+            engine.connect()
+    assert (metrics.checkouts, metrics.timeouts) == (1, 1)
+    engine.dispose()
+
+def test_pool_timeout_returns_503(client: TestClient):
+    """Prueba que un pool agotado devuelve 503 en lugar de un error 500."""
+    def exhausted_pool():
+        raise PoolTimeoutError("QueuePool limit reached")
+        yield
+
+    app.dependency_overrides[get_db] = exhausted_pool
+    app.dependency_overrides[get_async_db] = exhausted_pool
+    response = client.get("/api/messages/s1", headers={"X-API-Key": "my-super-secret-key"})
+    assert response.status_code == 503
+    assert response.json()["error"]["code"] == "DATABASE_BUSY"
+    assert response.headers["Retry-After"] == "1"
@@ -0,0 +1,44 @@
+import asyncio
+
+import pytest
+
+from app import services
+from app.processing import ProcessingPipeline
+
+@pytest.mark.parametrize("mode", ["thread", "process"])
+def test_pipeline_matches_inline_processing(mode):
+    """Prueba que el pool devuelve lo mismo que el procesamiento en línea y agrupa en lotes."""
+    contents = [f"mensaje {i} con palabra prohibida" for i in range(20)]
+
+    async def scenario():
+        pipeline = ProcessingPipeline(services.process_contents, mode=mode, workers=2, window_ms=20)
+        await pipeline.start()
+        try:
+            submitted = await asyncio.gather(*(pipeline.submit(content) for content in contents))
+            mapped = await pipeline.map(contents)
+        finally:
+            await pipeline.stop()
+        return pipeline, submitted, mapped
+
+    pipeline, submitted, mapped = asyncio.run(scenario())
+    expected = services.process_contents(contents)
+    assert submitted == expected
+    assert mapped == expected
+    assert pipeline.items == 40
+    assert pipeline.batches < pipeline.items
+
+def test_pipeline_propagates_errors():
+    """Prueba que un fallo en el pool llega a quien espera el resultado."""
+    def fail(items):
+        raise RuntimeError("fallo")
+
+    async def scenario():
+        pipeline = ProcessingPipeline(fail, mode="thread", workers=1)
+        await pipeline.start()
+        try:
+            with pytest.raises(RuntimeError):
+                await pipeline.submit("x")
+        finally:
+            await pipeline.stop()
+
+    asyncio.run(scenario())
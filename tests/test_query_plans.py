@@ -0,0 +1,101 @@
+import inspect
+from datetime import datetime
+
+import pytest
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import sessionmaker
+
+from app import crud, schemas
+from app.database import register_sqlite_pragmas
+from app.models import Base
+
+# Funciones de crud.py y la llamada que ejercita cada una de sus consultas
+CRUD_CALLS = {
+    "create_message": lambda db: crud.create_message(db, *_item("plan-1")),
+    "create_messages": lambda db: crud.create_messages(db, [_item("plan-2"), _item("plan-3")]),
+    "bulk_insert_messages": lambda db: crud.bulk_insert_messages(db, [_row("plan-4")]),
+    "get_messages_by_session": lambda db: [
+        crud.get_messages_by_session(db, "plan-s", sender=None),
+        crud.get_messages_by_session(db, "plan-s", sender="user"),
+        crud.get_messages_by_session(db, "plan-s", sender=None, after=(datetime(2024, 1, 1), 1)),
+        crud.get_messages_by_session(db, "plan-s", sender="user", after=(datetime(2024, 1, 1), 1)),
+    ],
+    "get_session_stats": lambda db: crud.get_session_stats(db, "plan-s"),
+    "session_history_query": lambda db: [
+        db.execute(crud.session_history_query("plan-s", None)).all(),
+        db.execute(crud.session_history_query("plan-s", "user")).all(),
+    ],
+    "iter_messages_by_session": lambda db: list(crud.iter_messages_by_session(db, "plan-s", None, batch_size=2)),
+    "get_message_by_message_id": lambda db: crud.get_message_by_message_id(db, "plan-1"),
+    "search_messages_by_content": lambda db: [
+        crud.search_messages_by_content(db, "hola"),
+        crud.search_messages_by_content(db, "hola", session_id="plan-s"),
+        crud.search_messages_by_content(db, "hola", after=[-1.0, 1]),
+    ],
+}
+
+# Las búsquedas ordenan por relevancia, lo que siempre requiere ordenar los resultados
+SORT_ALLOWED = {"search_messages_by_content"}
+
+def _item(message_id: str):
+    message = schemas.MessageCreate(
+        message_id=message_id, session_id="plan-s", content="hola plan",
+        timestamp=datetime(2024, 1, 1), sender="user",
+    )
+    return message, schemas.MessageMetadata(word_count=2, character_count=9)
+
+def _row(message_id: str) -> dict:
+    message, metadata = _item(message_id)
+    return {**message.model_dump(), **metadata.model_dump()}
+
+@pytest.fixture()
+def plan_engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'plans.db'}")
+    register_sqlite_pragmas(engine)
+    Base.metadata.create_all(bind=engine)
+    yield engine
+    engine.dispose()
+
+def _captured_selects(engine, fn) -> list[tuple[str, tuple]]:
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT") and not executemany:
+            statements.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", capture)
+    try:
+        with sessionmaker(bind=engine)() as db:
+            fn(db)
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+    return statements
+
+def test_every_crud_function_is_covered():
+    """Prueba que cada función pública de crud.py tiene su consulta en esta suite."""
+    functions = {
+        name for name, obj in inspect.getmembers(crud, inspect.isfunction)
+        if obj.__module__ == crud.__name__ and not name.startswith("_")
+    }
+    assert functions == set(CRUD_CALLS)
+
+@pytest.mark.parametrize("name", sorted(CRUD_CALLS))
+def test_crud_queries_use_indexes(plan_engine, name):
+    """Prueba que ninguna consulta de crud.py recorre la tabla de mensajes completa."""
+    statements = _captured_selects(plan_engine, CRUD_CALLS[name])
+    with plan_engine.connect() as connection:
+        for statement, parameters in statements:
+            plan = [row[3] for row in connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)]
+            full_scans = [
+                step for step in plan
+                if step.startswith("SCAN ") and "VIRTUAL TABLE" not in step
+            ]
+            assert not full_scans, f"{name}: {statement}\n{plan}"
+            if name not in SORT_ALLOWED:
+                assert not any("TEMP B-TREE" in step for step in plan), f"{name}: {statement}\n{plan}"
+
+def test_sqlite_pragmas_applied(plan_engine):
+    """Prueba que las conexiones nuevas se abren con los PRAGMAs configurados."""
+    with plan_engine.connect() as connection:
+        assert connection.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+        assert connection.execute(text("PRAGMA synchronous")).scalar() == 1  # NORMAL
@@ -0,0 +1,136 @@
+import asyncio
+import ipaddress
+
+from fastapi.testclient import TestClient
+from redis.exceptions import ConnectionError as RedisConnectionError
+from starlette.requests import Request
+
+from app.rate_limit import Limit, LocalRateLimitBackend, RedisRateLimitBackend, client_ip, parse_route_limits
+
+HEADERS = {"X-API-Key": "my-super-secret-key"}
+
+class FakeClock:
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+class FakePipeline:
+    def __init__(self, redis: "FakeRedis"):
+        self.redis = redis
+        self.commands = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def set(self, key, value, ex=None, nx=False):
+        self.commands.append(("set", key, value, nx))
+
+    def incrby(self, key, amount):
+        self.commands.append(("incrby", key, amount))
+
+    async def execute(self):
+        if self.redis.fail:
+            raise RedisConnectionError("redis no disponible")
+        self.redis.round_trips += 1
+        results = []
+        for command in self.commands:
+            if command[0] == "set":
+                _, key, value, nx = command
+                if not (nx and key in self.redis.data):
+                    self.redis.data[key] = value
+                results.append(True)
+            else:
+                _, key, amount = command
+                self.redis.data[key] = int(self.redis.data.get(key, 0)) + amount
+                results.append(self.redis.data[key])
+        return results
+
+class FakeRedis:
+    def __init__(self, fail: bool = False):
+        self.fail = fail
+        self.data: dict = {}
+        self.round_trips = 0
+
+    def pipeline(self, transaction: bool = True):
+        return FakePipeline(self)
+
+def test_local_token_bucket_refills():
+    """Prueba que el token bucket admite ráfagas hasta el límite y se rellena con el tiempo."""
+    clock = FakeClock()
+    backend = LocalRateLimitBackend(clock=clock)
+    limit = Limit(times=5, seconds=60)
+    assert [backend.check("k", limit) for _ in range(5)] == [0] * 5
+    assert backend.check("k", limit) == 12
+    assert backend.check("otra", limit) == 0
+    clock.now += 12
+    assert backend.check("k", limit) == 0
+
+def test_redis_backend_shares_limit_with_leases():
+    """Prueba que dos procesos comparten el límite en Redis con pocas idas y vueltas."""
+    async def scenario():
+        redis, clock = FakeRedis(), FakeClock(6000.0)
+        workers = [RedisRateLimitBackend(redis, lease_fraction=0.1, clock=clock) for _ in range(2)]
+        limit = Limit(times=100, seconds=60)
+        results = [await workers[i % 2].hit("k", limit) for i in range(150)]
+        return redis, results
+
+    redis, results = asyncio.run(scenario())
+    assert results.count(0) == 100
+    # Una reserva de 10 tokens por viaje, más la que descubre que la ventana está agotada
+    assert redis.round_trips <= 12
+
+def test_redis_backend_falls_back_to_local():
+    """Prueba que si Redis falla se aplica el límite en memoria."""
+    backend = RedisRateLimitBackend(FakeRedis(fail=True))
+    limit = Limit(times=2, seconds=60)
+    async def scenario():
+        return [await backend.hit("k", limit) for _ in range(3)]
+
+    results = asyncio.run(scenario())
+    assert results[:2] == [0, 0] and results[2] > 0
+    assert backend.errors == 3
+
+def test_parse_route_limits():
+    """Prueba el formato de RATE_LIMIT_ROUTES."""
+    assert parse_route_limits("POST /api/messages/bulk=2/60, GET /=100/1") == {
+        "POST /api/messages/bulk": Limit(2, 60),
+        "GET /": Limit(100, 1),
+    }
+
+def test_rate_limit_returns_429(client: TestClient):
+    """Prueba que al superar el límite por ruta se responde 429 con Retry-After."""
+    for _ in range(5):
+        assert client.get("/").status_code == 200
+    response = client.get("/")
+    assert response.status_code == 429
+    assert response.json()["error"]["code"] == "RATE_LIMITED"
+    assert int(response.headers["Retry-After"]) > 0
+    # Cada ruta tiene su propio contador
+    response = client.get("/api/messages/search?query=x", headers=HEADERS)
+    assert response.status_code == 200
+
+def test_unauthenticated_api_keys_do_not_bypass_limit(client: TestClient):
+    """Prueba que rotar una X-API-Key sin validar no esquiva el límite: se cuenta por IP."""
+    for i in range(5):
+        assert client.get("/", headers={"X-API-Key": f"inventada-{i}"}).status_code == 200
+    assert client.get("/", headers={"X-API-Key": "inventada-5"}).status_code == 429
+
+def test_forwarded_for_only_from_trusted_proxies():
+    """Prueba que X-Forwarded-For solo se acepta si la conexión viene de un proxy de confianza."""
+    def request(peer: str, forwarded: str) -> Request:
+        return Request({
+            "type": "http", "method": "GET", "path": "/", "client": (peer, 1234),
+            "headers": [(b"x-forwarded-for", forwarded.encode())],
+        })
+
+    proxies = [ipaddress.ip_network("10.0.0.0/8")]
+    # Sin proxies de confianza la cabecera se ignora
+    assert client_ip(request("203.0.113.7", "1.2.3.4"), []) == "203.0.113.7"
+    assert client_ip(request("203.0.113.7", "1.2.3.4"), proxies) == "203.0.113.7"
+    # Tras una cadena de proxies se toma la primera IP no fiable desde la derecha
+    assert client_ip(request("10.0.0.2", "1.2.3.4, 198.51.100.9, 10.0.0.1"), proxies) == "198.51.100.9"
@@ -0,0 +1,145 @@
+import asyncio
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from app import crud, replicas, schemas
+from app.cache import history_cache
+from app.models import Base
+
+HEADERS = {"X-API-Key": "my-super-secret-key"}
+
+
+def _seed(url: str, message_id: str):
+    engine = create_engine(url)
+    Base.metadata.create_all(bind=engine)
+    message = schemas.MessageCreate(
+        message_id=message_id, session_id="replica-s", content="copia en la réplica",
+        timestamp="2024-01-01T10:00:00", sender="user",
+    )
+    with Session(engine) as db:
+        crud.create_messages(db, [(message, schemas.MessageMetadata(word_count=4, character_count=19))])
+    engine.dispose()
+
+
+@pytest.fixture()
+def replica_urls(tmp_path):
+    urls = []
+    for name in ("r1", "r2"):
+        url = f"sqlite:///{tmp_path / name}.db"
+        _seed(url, f"from-{name}")
+        urls.append(url)
+    return urls
+
+
+@pytest.fixture()
+def use_replicas(monkeypatch):
+    created = []
+
+    def install(urls, read_your_writes=5.0):
+        replica_set = replicas.ReplicaSet([replicas.Replica(url, is_async=False) for url in urls],
+                                          read_your_writes=read_your_writes)
+        monkeypatch.setattr(replicas, "replica_set", replica_set)
+        created.append(replica_set)
+        return replica_set
+
+    yield install
+    for replica_set in created:
+        asyncio.run(replica_set.stop())
+
+
+def _history_ids(client) -> list[str]:
+    # Sin caché: cada lectura llega a la base de datos elegida
+    history_cache.clear()
+    response = client.get("/api/messages/replica-s", headers=HEADERS)
+    assert response.status_code == 200
+    return [message["message_id"] for message in response.json()["data"]]
+
+
+def test_reads_round_robin_between_replicas(client, replica_urls, use_replicas):
+    """Prueba que el historial se lee de las réplicas por turnos y no del primario."""
+    replica_set = use_replicas(replica_urls)
+    assert [_history_ids(client) for _ in range(2)] == [["from-r1"], ["from-r2"]]
+    assert [replica.reads for replica in replica_set.replicas] == [1, 1]
+    assert replica_set.primary_reads == 0
+
+
+def test_recent_writer_reads_from_primary(client, replica_urls, use_replicas):
+    """Prueba que, tras un POST, el mismo cliente lee del primario y ve su mensaje."""
+    replica_set = use_replicas(replica_urls[:1])
+    response = client.post("/api/messages/", headers=HEADERS, json={
+        "message_id": "written", "session_id": "replica-s", "content": "nuevo",
+        "timestamp": "2024-01-01T11:00:00", "sender": "user",
+    })
+    assert response.status_code == 201
+    assert _history_ids(client) == ["written"]
+    assert replica_set.primary_reads == 1
+
+    # Sin ventana de lectura de las propias escrituras vuelve a leer de la réplica
+    replica_set.recent_writers.clear()
+    assert _history_ids(client) == ["from-r1"]
+
+
+def test_unhealthy_replica_falls_back_to_primary(client, tmp_path, use_replicas):
+    """Prueba que una réplica que no responde deja de recibir lecturas."""
+    replica_set = use_replicas([f"sqlite:///{tmp_path / 'missing' / 'r.db'}"])
+    asyncio.run(replica_set.check())
+    assert replica_set.replicas[0].healthy is False
+    assert _history_ids(client) == []
+    assert replica_set.primary_reads == 1
+    assert replica_set.stats()["replicas"][0]["failures"] == 1
+
+
+def test_replica_rejects_writes(replica_urls):
+    """Prueba que las conexiones a una réplica SQLite son de solo lectura."""
+    replica = replicas.Replica(replica_urls[0], is_async=False)
+    with replica.session_factory() as db, pytest.raises(Exception, match="readonly"):
+        crud.create_messages(db, [(
+            schemas.MessageCreate(message_id="x", session_id="s", content="c",
+                                  timestamp="2024-01-01T00:00:00", sender="user"),
+            schemas.MessageMetadata(word_count=1, character_count=1),
+        )])
+    replica.engine.dispose()
+
+
+def test_only_primary_reads_are_cached(client, replica_urls, use_replicas, monkeypatch):
+    """Prueba que una página leída de una réplica no se guarda en la caché y una del primario sí."""
+    from app import cache
+    monkeypatch.setattr(cache, "CACHE_ENABLED", True)
+    replica_set = use_replicas(replica_urls[:1])
+    for _ in range(2):
+        response = client.get("/api/messages/replica-s", headers=HEADERS)
+        assert [message["message_id"] for message in response.json()["data"]] == ["from-r1"]
+    assert replica_set.replicas[0].reads == 2
+    assert history_cache.stats()["entries"] == 0
+
+    client.post("/api/messages/", headers=HEADERS, json={
+        "message_id": "written", "session_id": "replica-s", "content": "nuevo",
+        "timestamp": "2024-01-01T11:00:00", "sender": "user",
+    })
+    client.get("/api/messages/replica-s", headers=HEADERS)
+    assert replica_set.primary_reads == 1
+    assert history_cache.stats()["entries"] == 1
+
+
+def test_recent_write_is_shared_between_app_replicas(client, replica_urls, use_replicas):
+    """Prueba que, con la ventana en Redis, una lectura atendida por otra réplica de la app va al primario."""
+    from benchmarks.fake_redis import FakeRedis
+
+    redis = FakeRedis()
+    pod_a = use_replicas(replica_urls[:1])
+    pod_a.redis = redis
+    client.post("/api/messages/", headers=HEADERS, json={
+        "message_id": "written", "session_id": "replica-s", "content": "nuevo",
+        "timestamp": "2024-01-01T11:00:00", "sender": "user",
+    })
+
+    # Otra réplica de la app sin Redis no sabe nada de la escritura y lee de la réplica atrasada
+    use_replicas(replica_urls[:1])
+    assert _history_ids(client) == ["from-r1"]
+
+    pod_b = use_replicas(replica_urls[:1])
+    pod_b.redis = redis
+    assert _history_ids(client) == ["written"]
+    assert pod_b.primary_reads == 1
@@ -37,3 +37,159 @@ def test_get_db_closes_session():
         # Simula la salida del contexto del generador (ejecutando el finally)
         db_generator.close()
     mock_db.close.assert_called_once()
+
+def test_process_and_create_message_async_session():
+    """Prueba que el servicio persiste el mensaje usando una AsyncSession."""
+    import asyncio
+    import json
+    from datetime import datetime
+    from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+    from app import schemas, services
+    from app.models import Base
+
+    async def scenario():
+        engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        session_factory = async_sessionmaker(bind=engine, expire_on_commit=False)
+        async with session_factory() as db:
+            message = schemas.MessageCreate(
+                message_id="async-1", session_id="async-s", content="Hola async",
+                timestamp=datetime.utcnow(), sender="user",
+            )
+            created = await services.process_and_create_message(db=db, message=message)
+            stored = await services.get_messages(db=db, session_id="async-s", sender=None, skip=0, limit=10)
+        await engine.dispose()
+        return created, stored
+
+    created, stored = asyncio.run(scenario())
+    assert created.word_count == 2
+    assert [msg["message_id"] for msg in json.loads(stored)["data"]] == ["async-1"]
+
+def test_iter_json_array_split_chunks():
+    """Prueba que el array JSON se decodifica aunque los elementos lleguen partidos."""
+    import asyncio
+    from app.ingest import iter_json_array
+
+    body = '[{"content": "a ] , [ b"}, {"content": "ñandú"}]'.encode()
+
+    async def chunks():
+        for i in range(0, len(body), 3):
+            yield body[i:i + 3]
+
+    async def collect():
+        return [item async for item in iter_json_array(chunks())]
+
+    assert asyncio.run(collect()) == [{"content": "a ] , [ b"}, {"content": "ñandú"}]
+
+def test_banned_word_filter_modes():
+    """Prueba los modos subcadena y palabra completa del filtro compilado."""
+    from app.filtering import BannedWordFilter
+
+    words = {"mal", "maldito", "feo"}
+    content = "Un MALDITO día, malo y feo"
+    assert BannedWordFilter(words).filter(content) == "Un **** día, ****o y ****"
+    assert BannedWordFilter(words, whole_words=True).filter(content) == "Un **** día, malo y ****"
+
+def test_word_list_file_hot_reload(tmp_path):
+    """Prueba que el filtro se recompila cuando cambia el fichero de palabras."""
+    import os
+    from app.filtering import WordListFile
+
+    path = tmp_path / "banned.txt"
+    path.write_text("# comentario\nuno\n", encoding="utf-8")
+    word_list = WordListFile(str(path), check_interval=0)
+    assert word_list.get_filter().filter("uno dos") == "**** dos"
+
+    path.write_text("dos\n", encoding="utf-8")
+    stat = os.stat(path)
+    os.utime(path, (stat.st_atime, stat.st_mtime + 1))
+    assert word_list.get_filter().filter("uno dos") == "uno ****"
+
+def test_serialized_page_matches_response_schema():
+    """Prueba que la serialización directa produce el mismo JSON que los esquemas Pydantic."""
+    from datetime import datetime
+    from types import SimpleNamespace
+    from app import schemas, serialization
+
+    row = SimpleNamespace(
+        message_id="m1", session_id="s1", content="hola", timestamp=datetime(2024, 1, 1, 12, 30, 0, 123456),
+        sender="user", word_count=1, character_count=4, processed_at=datetime(2024, 1, 1, 12, 30, 1),
+    )
+    expected = schemas.MessagesResponse(
+        data=[schemas.Message(
+            message_id=row.message_id, session_id=row.session_id, content=row.content,
+            timestamp=row.timestamp, sender=row.sender,
+            metadata=schemas.MessageMetadata(
+                word_count=row.word_count, character_count=row.character_count, processed_at=row.processed_at,
+            ),
+        )],
+        next_cursor="abc",
+    )
+    assert serialization.dumps_messages_page([row], "abc") == expected.model_dump_json().encode()
+
+def test_backfill_session_stats_matches_incremental(tmp_path):
+    """Prueba que el cálculo inicial de session_stats coincide con el mantenido al insertar."""
+    from datetime import datetime
+    from sqlalchemy import create_engine, delete, select
+    from sqlalchemy.orm import Session
+    from app import crud, schemas
+    from app.database import backfill_session_stats
+    from app.models import Base, SessionStats
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'stats.db'}")
+    Base.metadata.create_all(bind=engine)
+    items = [
+        (
+            schemas.MessageCreate(
+                message_id=f"b-{i}", session_id=f"s{i % 2}", content="uno dos", sender="user",
+                timestamp=datetime(2024, 1, 1, i),
+            ),
+            schemas.MessageMetadata(word_count=2, character_count=7),
+        )
+        for i in range(5)
+    ]
+    with Session(engine) as db:
+        crud.create_messages(db, items)
+        incremental = db.execute(select(SessionStats.__table__).order_by("session_id")).all()
+    with engine.begin() as connection:
+        connection.execute(delete(SessionStats))
+        backfill_session_stats(connection)
+    with Session(engine) as db:
+        rebuilt = db.execute(select(SessionStats.__table__).order_by("session_id")).all()
+    engine.dispose()
+    assert rebuilt == incremental
+    assert [row.message_count for row in rebuilt] == [3, 2]
+
+def test_export_messages_async_session_gzip(tmp_path):
+    """Prueba la exportación en streaming con AsyncSession, por bloques y comprimida con gzip."""
+    import asyncio
+    import gzip
+    import json
+    from datetime import datetime
+    from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+    from app import schemas, services
+    from app.models import Base
+
+    async def scenario():
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'export.db'}")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        session_factory = async_sessionmaker(bind=engine, expire_on_commit=False)
+        async with session_factory() as db:
+            for i in range(5):
+                await services.process_and_create_message(db=db, message=schemas.MessageCreate(
+                    message_id=f"exp-{i}", session_id="exp", content=f"mensaje {i}",
+                    timestamp=datetime(2024, 1, 1, i), sender="user",
+                ))
+        chunks = [
+            chunk async for chunk in services.export_messages(
+                session_factory, "exp", None, "ndjson", compress=True, batch_size=2,
+            )
+        ]
+        await engine.dispose()
+        return chunks
+
+    chunks = asyncio.run(scenario())
+    lines = gzip.decompress(b"".join(chunks)).splitlines()
+    assert [json.loads(line)["message_id"] for line in lines] == [f"exp-{i}" for i in range(5)]
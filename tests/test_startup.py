@@ -0,0 +1,81 @@
+import json
+import os
+import socket
+import subprocess
+import sys
+
+# Objetivos de arranque en frío: importar la app y quedar lista (lifespan + /health/ready)
+COLD_IMPORT_BUDGET_SECONDS = 3.0
+COLD_READY_BUDGET_SECONDS = 5.0
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Se ejecuta en un proceso nuevo: la importación y el arranque se miden sin caché de módulos
+SCRIPT = """
+import json, os, sys, time
+start = time.perf_counter()
+import app.main
+imported = time.perf_counter() - start
+db_after_import = os.path.exists(os.environ["DB_PATH"])
+from fastapi.testclient import TestClient
+with TestClient(app.main.app) as client:
+    ready = client.get("/health/ready")
+    elapsed = time.perf_counter() - start
+    live = client.get("/health/live")
+print(json.dumps({
+    "import_seconds": imported,
+    "ready_seconds": elapsed,
+    "db_after_import": db_after_import,
+    "db_after_startup": os.path.exists(os.environ["DB_PATH"]),
+    "ready_status": ready.status_code,
+    "ready": ready.json(),
+    "live_status": live.status_code,
+}))
+"""
+
+
+def _closed_port() -> int:
+    """Puerto local sin nadie escuchando: Redis rechaza la conexión al instante."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _cold_start(tmp_path, **env) -> dict:
+    db_path = str(tmp_path / "cold.db")
+    environment = {
+        **os.environ,
+        "PYTHONPATH": ROOT,
+        "DB_PATH": db_path,
+        "DATABASE_URL": f"sqlite:///{db_path}",
+        "REDIS_HOST": "127.0.0.1",
+        "REDIS_PORT": str(_closed_port()),
+        **env,
+    }
+    result = subprocess.run(
+        [sys.executable, "-c", SCRIPT], cwd=tmp_path, env=environment,
+        capture_output=True, text=True, timeout=60,
+    )
+    assert result.returncode == 0, result.stderr
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def test_cold_start_is_lazy_and_within_budget(tmp_path):
+    """Prueba que importar la app no toca la BD y que arranca dentro del objetivo de tiempo."""
+    report = _cold_start(tmp_path)
+    assert report["db_after_import"] is False
+    assert report["db_after_startup"] is True
+    assert report["ready_status"] == 200
+    assert report["ready"] == {"status": "ready", "checks": {"startup": "ok", "database": "ok", "redis": "disabled"}}
+    assert report["live_status"] == 200
+    assert report["import_seconds"] < COLD_IMPORT_BUDGET_SECONDS
+    assert report["ready_seconds"] < COLD_READY_BUDGET_SECONDS
+
+
+def test_starts_degraded_without_redis(tmp_path):
+    """Prueba que, con Redis caído, la app arranca y se declara lista en modo degradado."""
+    report = _cold_start(tmp_path, BROADCAST_BACKEND="redis", CACHE_REDIS_ENABLED="true")
+    assert report["ready_status"] == 200
+    assert report["ready"]["status"] == "degraded"
+    assert report["ready"]["checks"]["redis"] == "unavailable"
+    assert report["ready_seconds"] < COLD_READY_BUDGET_SECONDS
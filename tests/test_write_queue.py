@@ -0,0 +1,102 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app import models, schemas
+from app.models import Base
+from app.write_queue import MessageWriteQueue, WriteQueueFull
+
+@pytest.fixture()
+def session_factory():
+    engine = create_engine(
+        "sqlite:///:memory:", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+    Base.metadata.create_all(bind=engine)
+    yield sessionmaker(autoflush=False, bind=engine)
+    engine.dispose()
+
+def _item(message_id: str):
+    message = schemas.MessageCreate(
+        message_id=message_id, session_id="batch-s", content="hola lote",
+        timestamp=datetime.utcnow(), sender="user",
+    )
+    return message, schemas.MessageMetadata(word_count=2, character_count=9)
+
+def test_write_queue_groups_messages_in_one_commit(session_factory):
+    """Prueba que los mensajes concurrentes se confirman en un único lote."""
+    async def scenario():
+        queue = MessageWriteQueue(session_factory, window_ms=50, max_batch_size=100)
+        await queue.start()
+        results = await asyncio.gather(*(queue.submit(*_item(f"b-{i}")) for i in range(20)))
+        await queue.stop()
+        return queue, results
+
+    queue, results = asyncio.run(scenario())
+    assert [msg.message_id for msg in results] == [f"b-{i}" for i in range(20)]
+    assert all(msg.id is not None for msg in results)
+    assert queue.batches_committed == 1
+    with session_factory() as db:
+        assert db.query(models.Message).count() == 20
+
+def test_write_queue_isolates_duplicates(session_factory):
+    """Prueba que un message_id duplicado solo hace fallar su propia petición."""
+    async def scenario():
+        queue = MessageWriteQueue(session_factory, window_ms=50)
+        await queue.start()
+        results = await asyncio.gather(
+            queue.submit(*_item("dup")), queue.submit(*_item("dup")), queue.submit(*_item("ok")),
+            return_exceptions=True,
+        )
+        await queue.stop()
+        return results
+
+    results = asyncio.run(scenario())
+    assert sum(isinstance(result, Exception) for result in results) == 1
+    with session_factory() as db:
+        assert db.query(models.Message).count() == 2
+
+def test_write_queue_backpressure(session_factory):
+    """Prueba que la cola rechaza mensajes cuando está llena."""
+    async def scenario():
+        # Sin arrancar el worker la cola nunca se vacía
+        queue = MessageWriteQueue(session_factory, max_queue_size=1, enqueue_timeout_ms=0)
+        pending = asyncio.create_task(queue.submit(*_item("q-1")))
+        await asyncio.sleep(0)
+        with pytest.raises(WriteQueueFull):
+            await queue.submit(*_item("q-2"))
+        pending.cancel()
+
+    asyncio.run(scenario())
+
+def test_write_queue_returns_stored_timestamp(session_factory):
+    """Prueba que el mensaje devuelto (respuesta, difusión y reintento) es igual con y sin la cola de escritura."""
+    from app import crud, serialization
+
+    def item(message_id: str):
+        message = schemas.MessageCreate(
+            message_id=message_id, session_id="tz-s", content="hola",
+            timestamp="2024-01-01T10:00:00+02:00", sender="user",
+        )
+        return message, schemas.MessageMetadata(word_count=1, character_count=4, processed_at=datetime(2024, 1, 1))
+
+    async def scenario():
+        queue = MessageWriteQueue(session_factory, window_ms=5)
+        await queue.start()
+        batched = await queue.submit(*item("tz-2"))
+        await queue.stop()
+        return batched
+
+    with session_factory() as db:
+        direct = crud.create_message(db, *item("tz-1"))
+        direct_json = serialization.dumps_message(direct)
+    batched_json = serialization.dumps_message(asyncio.run(scenario()))
+    with session_factory() as db:
+        stored_json = serialization.dumps_message(crud.get_message_by_message_id(db, "tz-2"))
+
+    assert b'"timestamp":"2024-01-01T10:00:00"' in batched_json
+    assert batched_json == stored_json
+    assert batched_json == direct_json.replace(b"tz-1", b"tz-2")